@@ -0,0 +1,220 @@
+"""
+Agrégats de ventes pour le tableau de bord admin.
+Chiffre d'affaires, nombre de commandes et articles vendus sont cumulés par
+heure, jour et semaine (UTC, semaines commençant le lundi) à chaque paiement,
+et retirés à l'annulation ou au remboursement d'une commande payée. Une
+période quelconque se calcule en combinant les plus gros seaux qu'elle
+contient, sans relire les commandes.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import threading
+import time
+
+from events import EventBus, OrderCancelled, OrderPaid, OrderRefunded
+from models import Order, OrderRepository, OrderStatus
+
+
+HOUR = 3600
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+# Le 1er janvier 1970 est un jeudi : les semaines démarrent 4 jours plus tard
+WEEK_OFFSET = 4 * DAY
+
+GRANULARITIES: Dict[str, int] = {"hour": HOUR, "day": DAY, "week": WEEK}
+
+
+def bucket_start(at: float, size: int) -> int:
+    offset = WEEK_OFFSET if size == WEEK else 0
+    return int((at - offset) // size) * size + offset
+
+
+@dataclass
+class SalesTotals:
+    revenue_cents: int = 0
+    orders: int = 0
+    units: int = 0
+    products: Dict[str, List[int]] = field(default_factory=dict)  # product_id -> [articles, CA]
+
+    def add(self, other: "SalesTotals"):
+        self.revenue_cents += other.revenue_cents
+        self.orders += other.orders
+        self.units += other.units
+        for product_id, (units, revenue_cents) in other.products.items():
+            line = self.products.setdefault(product_id, [0, 0])
+            line[0] += units
+            line[1] += revenue_cents
+
+    def record(self, order: Order, sign: int):
+        self.revenue_cents += sign * order.total_cents
+        self.orders += sign
+        self.units += sign * order.item_count
+        for item in order.items:
+            line = self.products.setdefault(item.product_id, [0, 0])
+            line[0] += sign * item.quantity
+            line[1] += sign * item.line_total_cents
+            if line == [0, 0]:
+                del self.products[item.product_id]
+
+    def refund(self, order: Order, amount_cents: int):
+        """
+        Remboursement partiel : la commande et ses articles restent vendus, seul le
+        chiffre d'affaires baisse, réparti sur les lignes au prorata de leur montant.
+        """
+        self.revenue_cents -= amount_cents
+        remaining = amount_cents
+        for i, item in enumerate(order.items):
+            if i == len(order.items) - 1:
+                share = remaining
+            else:
+                share = amount_cents * item.line_total_cents // order.total_cents
+            remaining -= share
+            line = self.products.setdefault(item.product_id, [0, 0])
+            line[1] -= share
+
+
+class SalesRollups:
+    """
+    Seaux de ventes par granularité : `{granularité: {début du seau: SalesTotals}}`.
+    Une vente est rangée à la date de paiement de la commande ; son retrait
+    (annulation, remboursement) touche les mêmes seaux, les périodes passées
+    donnent donc les ventes nettes.
+
+    Les commandes comptées sont mémorisées : une commande annulée puis remboursée
+    n'est retirée qu'une fois, et une commande jamais payée jamais. Un remboursement
+    partiel ne retire que le montant remboursé.
+    """
+    def __init__(self, orders: OrderRepository):
+        self.orders = orders
+        self._buckets: Dict[int, Dict[int, SalesTotals]] = {size: {} for size in GRANULARITIES.values()}
+        self._counted: Dict[str, float] = {}  # order_id -> date de paiement
+        self._lock = threading.Lock()
+
+    def subscribe_to(self, events: EventBus):
+        events.subscribe(OrderPaid, self._on_order_paid, name="sales-rollups")
+        events.subscribe(OrderCancelled, self._on_order_cancelled, name="sales-rollups")
+        events.subscribe(OrderRefunded, self._on_order_refunded, name="sales-rollups")
+
+    # ----- Mise à jour -----
+
+    def _buckets_at(self, paid_at: float) -> List[SalesTotals]:
+        found = []
+        for size, buckets in self._buckets.items():
+            start = bucket_start(paid_at, size)
+            totals = buckets.get(start)
+            if totals is None:
+                totals = buckets[start] = SalesTotals()
+            found.append(totals)
+        return found
+
+    def _record(self, order: Order, paid_at: float, sign: int):
+        for totals in self._buckets_at(paid_at):
+            totals.record(order, sign)
+
+    def _on_order_paid(self, event: OrderPaid):
+        order = self.orders.get(event.order_id)
+        if not order:
+            return
+        with self._lock:
+            if order.id in self._counted:
+                return
+            paid_at = order.paid_at or event.occurred_at
+            self._counted[order.id] = paid_at
+            self._record(order, paid_at, 1)
+
+    def _on_order_cancelled(self, event: OrderCancelled):
+        order = self.orders.get(event.order_id)
+        if not order:
+            return
+        with self._lock:
+            paid_at = self._counted.pop(order.id, None)
+            if paid_at is not None:
+                self._record(order, paid_at, -1)
+
+    def _on_order_refunded(self, event: OrderRefunded):
+        order = self.orders.get(event.order_id)
+        if not order:
+            return
+        amount = event.amount_cents if event.amount_cents is not None else order.total_cents
+        with self._lock:
+            paid_at = self._counted.pop(order.id, None)
+            if paid_at is None:
+                return
+            if amount >= order.total_cents:
+                self._record(order, paid_at, -1)
+            else:
+                for totals in self._buckets_at(paid_at):
+                    totals.refund(order, amount)
+
+    def rebuild(self):
+        """Recalcule tous les seaux depuis les commandes payées, expédiées, livrées ou remboursées en partie."""
+        with self._lock:
+            self._buckets = {size: {} for size in GRANULARITIES.values()}
+            self._counted = {}
+            for status in (OrderStatus.PAYEE, OrderStatus.EXPEDIEE, OrderStatus.LIVREE):
+                for order in self.orders.list_by_status(status):
+                    if order.paid_at is not None:
+                        self._counted[order.id] = order.paid_at
+                        self._record(order, order.paid_at, 1)
+            # Commandes payées puis remboursées en partie (sans annulation préalable)
+            for order in self.orders.list_by_status(OrderStatus.REMBOURSEE):
+                refunded = order.refunded_cents if order.refunded_cents is not None else order.total_cents
+                if order.paid_at is not None and order.cancelled_at is None and refunded < order.total_cents:
+                    self._record(order, order.paid_at, 1)
+                    for totals in self._buckets_at(order.paid_at):
+                        totals.refund(order, refunded)
+
+    # ----- Lecture -----
+
+    def totals(self, since: float, until: float) -> SalesTotals:
+        """
+        Ventes entre `since` et `until`, étendus aux heures pleines : on prend à chaque
+        pas le plus gros seau aligné qui tient dans la période, soit au plus quelques
+        heures et jours aux bords et un seau par semaine pleine.
+        """
+        start, end = bucket_start(since, HOUR), bucket_start(until, HOUR)
+        if end < until:
+            end += HOUR
+        result = SalesTotals()
+        with self._lock:
+            t = start
+            while t < end:
+                for size in (WEEK, DAY, HOUR):
+                    if bucket_start(t, size) == t and t + size <= end:
+                        totals = self._buckets[size].get(t)
+                        if totals is not None:
+                            result.add(totals)
+                        t += size
+                        break
+        return result
+
+    def series(self, since: float, until: float, granularity: str, max_points: int = 1000) -> List[Tuple[int, SalesTotals]]:
+        """Un point par seau de la granularité demandée, seaux vides compris."""
+        size = GRANULARITIES.get(granularity)
+        if size is None:
+            raise ValueError("Granularité inconnue (hour, day ou week).")
+        start, end = bucket_start(since, size), until
+        if (end - start) / size > max_points:
+            raise ValueError(f"Période trop longue pour cette granularité (au plus {max_points} points).")
+        points = []
+        with self._lock:
+            buckets = self._buckets[size]
+            t = start
+            while t < end:
+                totals = buckets.get(t)
+                points.append((t, SalesTotals(totals.revenue_cents, totals.orders, totals.units) if totals else SalesTotals()))
+                t += size
+        return points
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "counted_orders": len(self._counted),
+                **{f"{name}_buckets": len(self._buckets[size]) for name, size in GRANULARITIES.items()},
+            }
+
+
+def current_hour_end() -> int:
+    """Fin de l'heure en cours : borne de fin par défaut des requêtes."""
+    return bucket_start(time.time(), HOUR) + HOUR
@@ -0,0 +1,200 @@
+"""
+Archivage des fils du support fermés depuis longtemps.
+Les fils sont écrits dans des segments sur disque (un enregistrement zlib par fil),
+seul un résumé reste en mémoire ; le contenu est relu à la demande. Chaque segment
+a un index (les résumés, en JSON) relu au démarrage : l'archive survit aux redémarrages.
+"""
+
+from collections import OrderedDict
+from dataclasses import asdict, fields
+from typing import Dict, List, Optional
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+
+from events import EventBus, ThreadsArchived
+from models import ArchivedThread, Message, MessageThread, ThreadRepository
+
+
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+
+
+def _dump(thread: MessageThread) -> bytes:
+    data = {
+        "id": thread.id,
+        "user_id": thread.user_id,
+        "order_id": thread.order_id,
+        "subject": thread.subject,
+        "closed_at": thread.closed_at,
+        "messages": [asdict(m) for m in thread.messages],
+    }
+    return zlib.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+def _restore(record: bytes) -> MessageThread:
+    data = json.loads(zlib.decompress(record))
+    thread = MessageThread(
+        id=data["id"],
+        user_id=data["user_id"],
+        order_id=data["order_id"],
+        subject=data["subject"],
+        closed=True,
+        closed_at=data["closed_at"]
+    )
+    for m in data["messages"]:
+        thread.add_message(Message(**m))
+    return thread
+
+
+class ThreadArchive:
+    """
+    Stockage froid branché sur `ThreadRepository` : `archive_closed` déplace les
+    fils fermés depuis plus de `older_than_s` vers un nouveau segment, `load`
+    relit un fil archivé (avec un petit cache LRU des derniers fils relus).
+
+    Les noms de segments sont préfixés par un identifiant propre au processus :
+    plusieurs workers peuvent partager le répertoire sans s'écraser.
+    """
+    def __init__(self, threads: ThreadRepository, directory: str, segment_size: int = 500, cache_size: int = 32, events: Optional[EventBus] = None):
+        self.threads = threads
+        self.events = events
+        self.directory = directory
+        self.segment_size = segment_size
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, MessageThread]" = OrderedDict()
+        self._segments = 0
+        self._prefix = uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()  # un seul archivage à la fois
+        self._cache_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+        threads.archive = self
+        self._load_indexes()
+
+    def _load_indexes(self):
+        """Réinscrit les fils des segments déjà écrits (exécutions précédentes, autres workers)."""
+        names = {f.name for f in fields(ArchivedThread)}
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(INDEX_SUFFIX):
+                continue
+            with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                summaries = [ArchivedThread(**{k: v for k, v in data.items() if k in names}) for data in json.load(f)]
+            self.threads.mark_archived([s for s in summaries if not self.threads.is_archived(s.id)])
+
+    def clear(self) -> int:
+        """
+        Vide l'archive (segments de tous les workers compris) ; à appeler avant un seed,
+        dont les nouveaux utilisateurs et commandes ne correspondent plus aux fils archivés.
+        Retourne le nombre de fils oubliés.
+        """
+        with self._lock:
+            cleared = self.threads.count_archived()
+            for name in os.listdir(self.directory):
+                if name.endswith((SEGMENT_SUFFIX, INDEX_SUFFIX)) or name.endswith(".tmp"):
+                    os.remove(os.path.join(self.directory, name))
+            self.threads.clear_archived()
+            with self._cache_lock:
+                self._cache.clear()
+            return cleared
+
+    def archive_closed(self, older_than_s: float) -> int:
+        """Archive les fils fermés depuis plus de `older_than_s` secondes ; retourne leur nombre."""
+        cutoff = time.time() - older_than_s
+        archived = 0
+        with self._lock:
+            while True:
+                batch = self.threads.closed_before(cutoff, limit=self.segment_size)
+                if not batch:
+                    return archived
+                summaries = self._write_segment(batch)
+                self.threads.mark_archived(summaries)
+                archived += len(batch)
+                if self.events is not None:
+                    self.events.publish(ThreadsArchived(thread_ids=tuple(s.id for s in summaries)))
+
+    def _write_segment(self, threads: List[MessageThread]) -> List[ArchivedThread]:
+        self._segments += 1
+        segment = f"{self._prefix}-{self._segments:06d}{SEGMENT_SUFFIX}"
+        path = os.path.join(self.directory, segment)
+        summaries = []
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            for thread in threads:
+                record = _dump(thread)
+                last = thread.messages[-1] if thread.messages else None
+                summaries.append(ArchivedThread(
+                    id=thread.id,
+                    user_id=thread.user_id,
+                    order_id=thread.order_id,
+                    subject=thread.subject,
+                    message_count=len(thread.messages),
+                    last_message_preview=last.body[:120] if last else None,
+                    last_message_at=last.created_at if last else None,
+                    closed_at=thread.closed_at,
+                    segment=segment,
+                    offset=f.tell(),
+                    length=len(record)
+                ))
+                f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        # L'index n'est publié qu'une fois le segment complet sur disque
+        index = path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+        with open(f"{index}.tmp", "w", encoding="utf-8") as f:
+            json.dump([asdict(summary) for summary in summaries], f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{index}.tmp", index)
+        return summaries
+
+    def load(self, summary: ArchivedThread) -> MessageThread:
+        with self._cache_lock:
+            thread = self._cache.get(summary.id)
+            if thread is not None:
+                self._cache.move_to_end(summary.id)
+                return thread
+        with open(os.path.join(self.directory, summary.segment), "rb") as f:
+            f.seek(summary.offset)
+            thread = _restore(f.read(summary.length))
+        with self._cache_lock:
+            self._cache[summary.id] = thread
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return thread
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "archived_threads": self.threads.count_archived(),
+            "segments": sum(1 for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX)),
+            "disk_bytes": sum(
+                os.path.getsize(os.path.join(self.directory, name))
+                for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX)
+            ),
+            "cached_threads": len(self._cache),
+        }
+
+    # ----- Balayage périodique -----
+
+    def start(self, interval_s: float, older_than_s: float):
+        self._sweeper = threading.Thread(
+            target=self._loop, args=(interval_s, older_than_s), name="support-archive", daemon=True
+        )
+        self._sweeper.start()
+
+    def _loop(self, interval_s: float, older_than_s: float):
+        while not self._stop.wait(interval_s):
+            try:
+                self.archive_closed(older_than_s)
+            except Exception as e:
+                print(f"Erreur d'archivage du support: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
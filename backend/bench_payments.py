@@ -0,0 +1,91 @@
+"""
+Test de charge du pipeline de paiement contre le PSP simulé.
+Mesure le débit de checkout payé et la latence de queue (p50/p95/p99)
+selon le profil de latence et les pannes injectées côté PSP.
+
+Usage: python bench_payments.py [nombre_de_commandes]
+"""
+
+import sys
+import time
+import uuid
+
+from models import (
+    UserRepository, ProductRepository, CartRepository, OrderRepository,
+    InvoiceRepository, PaymentRepository, BillingService, DeliveryService,
+    CartService, OrderService, User, Product
+)
+from payments import PaymentPipeline, SimulatedPaymentGateway, PaymentJobStatus
+
+
+PROFILES = {
+    "instantané": dict(latency="fixed", latency_s=0.0),
+    "fixe 50ms": dict(latency="fixed", latency_s=0.05),
+    "normal 50±20ms": dict(latency="normal", latency_s=0.05, jitter_s=0.02),
+    "longue traîne 50ms": dict(latency="longtail", latency_s=0.05, tail_sigma=1.0),
+    "lent + 5% erreurs": dict(latency="longtail", latency_s=0.2, tail_sigma=0.8, error_rate=0.05),
+    "quota 100/s": dict(latency="fixed", latency_s=0.02, rate_limit_per_s=100, burst=20),
+}
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def run_profile(name, gateway_kwargs, n_orders, workers=8, timeout_s=0.5):
+    users = UserRepository()
+    products = ProductRepository()
+    carts = CartRepository()
+    orders = OrderRepository()
+    invoices = InvoiceRepository()
+    payments = PaymentRepository()
+    gateway = SimulatedPaymentGateway(seed=42, **gateway_kwargs)
+    order_svc = OrderService(
+        orders, products, carts, payments, invoices,
+        BillingService(invoices, users), DeliveryService(), gateway, users
+    )
+    cart_svc = CartService(carts, products)
+    pipeline = PaymentPipeline(
+        order_svc, max_workers=workers, max_pending=n_orders,
+        timeout_s=timeout_s, max_retries=3, backoff_s=0.01
+    )
+
+    product = Product(id=str(uuid.uuid4()), name="Bench", description="", price_cents=1000, stock_qty=n_orders)
+    products.add(product)
+    user = User(id=str(uuid.uuid4()), email="bench@shop.test", password_hash="", first_name="B", last_name="B", address="x")
+    users.add(user)
+
+    order_ids = []
+    for _ in range(n_orders):
+        cart_svc.add_to_cart(user.id, product.id, 1)
+        order_ids.append(order_svc.checkout(user.id).id)
+
+    started = time.perf_counter()
+    jobs = [
+        pipeline.submit(user.id, oid, "4242424242424242", 12, 2030, "123")
+        for oid in order_ids
+    ]
+    pipeline.shutdown(wait=True)
+    elapsed = time.perf_counter() - started
+
+    succeeded = [j for j in jobs if j.status == PaymentJobStatus.REUSSI]
+    latencies = [j.finished_at - j.created_at for j in jobs]
+    print(
+        f"{name:<22} {len(succeeded) / elapsed:>8.1f}/s  "
+        f"ok {len(succeeded):>5}/{n_orders:<5} "
+        f"p50 {percentile(latencies, 50) * 1000:>7.1f}ms  "
+        f"p95 {percentile(latencies, 95) * 1000:>7.1f}ms  "
+        f"p99 {percentile(latencies, 99) * 1000:>7.1f}ms  "
+        f"PSP {gateway.stats}"
+    )
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    print(f"Pipeline de paiement : {n} commandes par profil, 8 workers, timeout 500ms\n")
+    for name, kwargs in PROFILES.items():
+        run_profile(name, kwargs, n)
@@ -0,0 +1,82 @@
+"""
+Mesure la sérialisation des fils du support (liste admin) selon la résolution
+des noms d'auteurs : un accès au dépôt par message, par fil ou par réponse.
+
+Usage: python bench_support.py [nombre_de_fils] [messages_par_fil]
+"""
+
+import sys
+import time
+import uuid
+
+from models import UserRepository, ThreadRepository, CustomerService, User
+from schemas import MessageResponse, ThreadResponse, ThreadListResponse
+
+
+class CountingUserRepository(UserRepository):
+    """Compte les accès au dépôt pour vérifier la résolution des noms."""
+    def __init__(self):
+        super().__init__()
+        self.lookups = 0
+
+    def get(self, user_id):
+        self.lookups += 1
+        return super().get(user_id)
+
+
+def build(n_threads, n_messages, n_customers=20):
+    users = CountingUserRepository()
+    threads = ThreadRepository()
+    service = CustomerService(threads, users)
+    customers = []
+    for i in range(n_customers):
+        user = User(id=str(uuid.uuid4()), email=f"client{i}@shop.test", password_hash="", first_name=f"Client{i}", last_name="Test", address="x")
+        users.add(user)
+        customers.append(user)
+    for i in range(n_threads):
+        customer = customers[i % n_customers]
+        thread = service.open_thread(customer.id, f"Sujet {i}")
+        for j in range(n_messages):
+            # Alternance client / support, comme une conversation réelle
+            service.post_message(thread.id, customer.id if j % 2 == 0 else None, f"Message {j} du fil {i}")
+    return users, threads
+
+
+def per_message(threads, users):
+    return ThreadListResponse(threads=[
+        ThreadResponse(
+            id=t.id, user_id=t.user_id, order_id=t.order_id, subject=t.subject, closed=t.closed,
+            messages=[MessageResponse.from_message(m, users) for m in t.messages]
+        )
+        for t in threads
+    ])
+
+
+def per_thread(threads, users):
+    return ThreadListResponse(threads=[ThreadResponse.from_thread(t, users) for t in threads])
+
+
+def per_response(threads, users):
+    names = {}
+    return ThreadListResponse(threads=[ThreadResponse.from_thread(t, users, names) for t in threads])
+
+
+def run(name, serialize, users, threads, repeat=5):
+    all_threads = threads.list_all()
+    users.lookups = 0
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        serialize(all_threads, users)
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:<14} {best * 1000:>9.1f}ms  accès dépôt/réponse {users.lookups // repeat:>8}")
+
+
+if __name__ == "__main__":
+    n_threads = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    n_messages = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    users, threads = build(n_threads, n_messages)
+    print(f"Liste admin : {n_threads} fils de {n_messages} messages, 20 clients\n")
+    run("par message", per_message, users, threads)
+    run("par fil", per_thread, users, threads)
+    run("par réponse", per_response, users, threads)
@@ -3,8 +3,8 @@ Dépendances FastAPI pour l'injection dans les routes.
 Sépare les dépendances pour éviter les importations circulaires.
 """
 
-from fastapi import Depends, HTTPException, Header
-from typing import Optional
+from fastapi import Depends, HTTPException, Header, Query, Response
+from typing import Any, Awaitable, Callable, Optional
 
 
 def get_context():
@@ -40,6 +40,28 @@ def get_current_user_id(
     return user_id
 
 
+def get_stream_user_id(
+    context = Depends(get_context),
+    authorization: Optional[str] = Header(None, alias="Authorization"),
+    token: Optional[str] = Query(None)
+) -> str:
+    """
+    Variante pour les flux SSE : EventSource ne permet pas d'envoyer
+    d'en-tête, le token est alors accepté en paramètre `?token=`.
+    """
+    if authorization:
+        return get_current_user_id(context, authorization)
+    if not token:
+        raise HTTPException(status_code=401, detail="Token manquant")
+
+    user_id = context.sessions_manager.get_user_id(token)
+
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token invalide ou expiré")
+
+    return user_id
+
+
 def get_current_admin_user_id(
     user_id: str = Depends(get_current_user_id),
     context = Depends(get_context)
@@ -52,3 +74,32 @@ def get_current_admin_user_id(
         raise HTTPException(status_code=403, detail="Droits administrateur requis")
 
     return user_id
+
+
+async def run_idempotent(
+    context,
+    scope: str,
+    user_id: str,
+    idempotency_key: Optional[str],
+    payload: str,
+    response: Response,
+    handler: Callable[[], Awaitable[Any]]
+) -> Any:
+    """
+    Exécute `handler` une seule fois par en-tête `Idempotency-Key` (par utilisateur et par route).
+    Les répétitions reçoivent la réponse d'origine, marquée `Idempotent-Replayed: true` ;
+    seules les erreurs passagères (409, 5xx) libèrent la clé pour une nouvelle tentative.
+    """
+    from idempotency import IdempotencyKeyReused
+
+    key = f"{scope}:{user_id}:{idempotency_key}" if idempotency_key else None
+    try:
+        result, replayed = await context.idempotent_responses.run(
+            key, payload, handler,
+            retryable=lambda e: not isinstance(e, HTTPException) or e.status_code == 409 or e.status_code >= 500
+        )
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
@@ -0,0 +1,266 @@
+"""
+Événements métier et bus d'événements en mémoire.
+Les services publient un événement une fois leur modification enregistrée ;
+les effets de bord (facturation, statistiques, notifications...) s'y abonnent
+au lieu d'être appelés en ligne.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple, Type
+import queue
+import threading
+import time
+
+
+# =========================
+# ===== ÉVÉNEMENTS =====
+# =========================
+
+@dataclass(frozen=True)
+class Event:
+    occurred_at: float = field(default_factory=time.time, kw_only=True)
+
+
+@dataclass(frozen=True)
+class OrderCreated(Event):
+    order_id: str
+    user_id: str
+    total_cents: int
+
+
+@dataclass(frozen=True)
+class OrderValidated(Event):
+    order_id: str
+    user_id: str
+
+
+@dataclass(frozen=True)
+class OrderPaid(Event):
+    order_id: str
+    user_id: str
+    payment_id: str
+    amount_cents: int
+
+
+@dataclass(frozen=True)
+class OrderShipped(Event):
+    order_id: str
+    user_id: str
+    tracking_number: Optional[str]
+
+
+@dataclass(frozen=True)
+class OrderDelivered(Event):
+    order_id: str
+    user_id: str
+
+
+@dataclass(frozen=True)
+class OrderCancelled(Event):
+    order_id: str
+    user_id: str
+    previous_status: str
+
+
+@dataclass(frozen=True)
+class OrderRefunded(Event):
+    order_id: str
+    user_id: str
+    amount_cents: int
+
+
+@dataclass(frozen=True)
+class ThreadOpened(Event):
+    thread_id: str
+    user_id: str
+    order_id: Optional[str]
+
+
+@dataclass(frozen=True)
+class MessagePosted(Event):
+    thread_id: str
+    message_id: str
+    thread_user_id: str
+    author_user_id: Optional[str]  # None = agent support
+
+
+@dataclass(frozen=True)
+class ThreadsArchived(Event):
+    thread_ids: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class ProductChanged(Event):
+    product_id: str
+    fields: Tuple[str, ...]  # champs modifiés ("*" = création)
+
+
+@dataclass(frozen=True)
+class LowStockReached(Event):
+    product_id: str
+    stock_qty: int
+    threshold: int
+
+
+@dataclass(frozen=True)
+class LowStockCleared(Event):
+    product_id: str
+    stock_qty: int
+    threshold: int
+
+
+# =========================
+# ===== BUS =====
+# =========================
+
+Handler = Callable[[Event], None]
+
+
+class Subscriber:
+    """Abonné synchrone : appelé dans le thread qui publie, après l'enregistrement."""
+    def __init__(self, name: str, handler: Handler):
+        self.name = name
+        self.handler = handler
+        self.delivered = 0
+        self.processed = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+
+    def deliver(self, event: Event):
+        self.delivered += 1
+        self._handle(event)
+
+    def _handle(self, event: Event):
+        try:
+            self.handler(event)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"Erreur dans l'abonné {self.name}: {self.last_error}")
+
+    def metrics(self) -> Dict:
+        return {
+            "name": self.name,
+            "mode": "sync",
+            "delivered": self.delivered,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": 0,
+            "queue_depth": 0,
+            "max_queue": 0,
+            "lag_s": 0.0,
+            "last_error": self.last_error,
+        }
+
+
+class AsyncSubscriber(Subscriber):
+    """
+    Abonné asynchrone : les événements sont déposés dans une file bornée et
+    traités par un thread dédié. Si la file est pleine, l'événement est
+    abandonné et compté (`dropped`) : un consommateur lent ne ralentit jamais
+    le chemin de la requête.
+    """
+    def __init__(self, name: str, handler: Handler, max_queue: int = 1000):
+        super().__init__(name, handler)
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Event]]" = queue.Queue(maxsize=max_queue)
+        self._head: Optional[Event] = None  # événement en cours de traitement
+        self._thread = threading.Thread(target=self._loop, name=f"events-{name}", daemon=True)
+        self._thread.start()
+
+    def deliver(self, event: Event):
+        try:
+            self._queue.put_nowait(event)
+            self.delivered += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _loop(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                self._queue.task_done()
+                return
+            self._head = event
+            self._handle(event)
+            self._head = None
+            self._queue.task_done()
+
+    def drain(self):
+        """Attend que tous les événements reçus soient traités."""
+        self._queue.join()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def metrics(self) -> Dict:
+        head = self._head
+        try:
+            head = head or self._queue.queue[0]
+        except IndexError:
+            pass
+        return {
+            **super().metrics(),
+            "mode": "async",
+            "dropped": self.dropped,
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            # Retard = âge du plus ancien événement non encore traité
+            "lag_s": round(time.time() - head.occurred_at, 3) if head else 0.0,
+        }
+
+
+class EventBus:
+    """
+    Bus d'événements typés. Les abonnés synchrones doivent rester légers
+    (mise à jour d'un index, mise en file) ; les traitements lourds
+    s'abonnent en asynchrone via `subscribe_async`.
+    """
+    def __init__(self):
+        self._subscribers: Dict[Type[Event], List[Subscriber]] = defaultdict(list)
+        self._all: List[Subscriber] = []
+        self.published: Dict[str, int] = defaultdict(int)
+
+    def _name(self, handler: Handler, name: Optional[str]) -> str:
+        return name or getattr(handler, "__qualname__", repr(handler))
+
+    def subscribe(self, event_type: Type[Event], handler: Handler, name: Optional[str] = None) -> Subscriber:
+        sub = Subscriber(self._name(handler, name), handler)
+        self._subscribers[event_type].append(sub)
+        self._all.append(sub)
+        return sub
+
+    def subscribe_async(self, event_types, handler: Handler, name: Optional[str] = None, max_queue: int = 1000) -> AsyncSubscriber:
+        """Abonne `handler` à un ou plusieurs types d'événements, traités hors du thread appelant."""
+        if isinstance(event_types, type):
+            event_types = (event_types,)
+        sub = AsyncSubscriber(self._name(handler, name), handler, max_queue=max_queue)
+        for event_type in event_types:
+            self._subscribers[event_type].append(sub)
+        self._all.append(sub)
+        return sub
+
+    def publish(self, event: Event):
+        self.published[type(event).__name__] += 1
+        for sub in self._subscribers.get(type(event), ()):
+            sub.deliver(event)
+
+    def metrics(self) -> Dict:
+        return {
+            "published": dict(self.published),
+            "subscribers": [sub.metrics() for sub in self._all],
+        }
+
+    def drain(self):
+        for sub in self._all:
+            if isinstance(sub, AsyncSubscriber):
+                sub.drain()
+
+    def shutdown(self):
+        for sub in self._all:
+            if isinstance(sub, AsyncSubscriber):
+                sub.stop()
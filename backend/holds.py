@@ -0,0 +1,85 @@
+"""
+Expiration des réservations de stock des commandes non payées.
+Les échéances sont rangées dans un tas (la plus proche en tête) : le balayage
+ne regarde que les réservations échues, jamais l'ensemble des commandes.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import heapq
+import threading
+import time
+
+from events import EventBus, OrderCreated
+from models import OrderService
+
+
+class StockHoldSweeper:
+    """
+    Programme une échéance par commande créée (événement OrderCreated) et
+    annule les commandes dont la réservation a expiré sans paiement.
+
+    Suppression paresseuse : une commande payée ou annulée reste dans le tas
+    et est simplement ignorée quand son échéance arrive.
+    """
+    def __init__(self, order_service: OrderService, interval_s: float = 5.0):
+        self.order_service = order_service
+        self.interval_s = interval_s
+        self._heap: List[Tuple[float, str]] = []  # (échéance, order_id)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.expired = 0
+
+    def subscribe_to(self, events: EventBus):
+        events.subscribe(OrderCreated, self._on_order_created, name="stock-holds")
+
+    def _on_order_created(self, event: OrderCreated):
+        order = self.order_service.orders.get(event.order_id)
+        if order and order.hold_expires_at is not None:
+            self.schedule(order.id, order.hold_expires_at)
+
+    def schedule(self, order_id: str, expires_at: float):
+        with self._lock:
+            heapq.heappush(self._heap, (expires_at, order_id))
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Traite les échéances passées ; retourne le nombre de commandes annulées."""
+        now = now or time.time()
+        expired = 0
+        while True:
+            with self._lock:
+                if not self._heap or self._heap[0][0] > now:
+                    break
+                _, order_id = heapq.heappop(self._heap)
+            try:
+                cancelled, retry_at = self.order_service.expire_hold(order_id, now)
+            except Exception as e:
+                print(f"Erreur d'expiration de la réservation {order_id}: {e}")
+                continue
+            if retry_at is not None:
+                self.schedule(order_id, retry_at)
+            if cancelled:
+                expired += 1
+        self.expired += expired
+        return expired
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "scheduled": len(self._heap),
+                "next_expiry": self._heap[0][0] if self._heap else None,
+                "expired": self.expired,
+            }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="stock-holds", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            self.sweep()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
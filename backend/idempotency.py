@@ -0,0 +1,124 @@
+"""
+Store d'idempotence en mémoire, borné en taille et en durée de vie.
+Sert à dédupliquer les requêtes rejouées (même clé = même résultat).
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Optional, Tuple
+import asyncio
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+
+
+class IdempotencyStore:
+    """
+    Associe une clé d'idempotence à une valeur pendant `ttl_s` secondes.
+
+    Les entrées sont conservées dans leur ordre d'insertion : comme la durée
+    de vie est la même pour toutes, les plus anciennes sont toujours en tête,
+    ce qui permet d'expirer et d'évincer sans parcourir tout le store.
+    """
+    def __init__(self, max_entries: int = 10000, ttl_s: float = 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def _purge(self, now: float):
+        while self._entries:
+            key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                return None
+            return entry[1]
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            now = time.time()
+            self._entries.pop(key, None)
+            self._entries[key] = (now + self.ttl_s, value)
+            self._purge(now)
+
+    def get_or_put(self, key: str, factory: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Retourne la valeur existante pour `key`, ou stocke `factory()`.
+        Le booléen indique si la valeur vient d'être créée.
+        """
+        with self._lock:
+            now = time.time()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1], False
+            value = factory()
+            self._entries.pop(key, None)
+            self._entries[key] = (now + self.ttl_s, value)
+            self._purge(now)
+            return value, True
+
+    def discard(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class IdempotencyKeyReused(Exception):
+    """La clé d'idempotence a déjà servi pour une requête différente."""
+
+
+class IdempotentResponses:
+    """
+    Rejoue la réponse d'origine des requêtes envoyées avec un en-tête `Idempotency-Key`.
+
+    La première requête exécute le traitement ; une répétition reçoit le même
+    résultat (ou la même erreur), y compris si elle arrive pendant l'exécution :
+    elle attend alors la fin du traitement au lieu de le relancer.
+    """
+    def __init__(self, store: Optional[IdempotencyStore] = None, secret: Optional[bytes] = None):
+        self.store = store or IdempotencyStore()
+        # Clé de l'HMAC : sans secret, une empreinte de corps à faible entropie se retrouverait par force brute
+        self._secret = secret or secrets.token_bytes(32)
+
+    def fingerprint(self, payload: str) -> str:
+        return hmac.new(self._secret, payload.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    async def run(
+        self,
+        key: Optional[str],
+        payload: str,
+        handler: Callable[[], Awaitable[Any]],
+        retryable: Callable[[BaseException], bool] = lambda e: True
+    ) -> Tuple[Any, bool]:
+        """
+        Exécute `handler` une seule fois par clé ; retourne `(résultat, rejoué)`.
+        Une erreur pour laquelle `retryable` est vrai n'est pas mémorisée :
+        la clé est libérée et la requête suivante sera exécutée.
+        """
+        if key is None:
+            return await handler(), False
+        fingerprint = self.fingerprint(payload)
+        (stored, future), created = self.store.get_or_put(key, lambda: (fingerprint, Future()))
+        if not created:
+            if stored != fingerprint:
+                raise IdempotencyKeyReused("Clé d'idempotence déjà utilisée pour une autre requête.")
+            return await asyncio.wrap_future(future), True
+        try:
+            result = await handler()
+        except BaseException as e:
+            if retryable(e):
+                self.store.discard(key)
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result, False
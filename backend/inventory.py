@@ -0,0 +1,109 @@
+"""
+Journal des mouvements de stock.
+Chaque variation du stock disponible ou réservé d'un produit est ajoutée au
+journal (jamais modifiée) ; des soldes intermédiaires sont mémorisés tous les
+`checkpoint_every` mouvements pour retrouver le stock à une date donnée sans
+rejouer tout l'historique.
+"""
+
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import time
+
+
+@dataclass(frozen=True)
+class StockMovement:
+    at: float
+    product_id: str
+    delta: int           # variation du stock disponible (stock_qty)
+    reserved_delta: int  # variation du stock réservé (reserved_qty)
+    reason: str
+    order_id: Optional[str] = None
+
+
+class _ProductLedger:
+    __slots__ = ("movements", "times", "checkpoints")
+
+    def __init__(self):
+        self.movements: List[StockMovement] = []
+        self.times: List[float] = []
+        # checkpoints[k] = soldes (disponible, réservé) après k * checkpoint_every mouvements
+        self.checkpoints: List[Tuple[int, int]] = [(0, 0)]
+
+
+class InventoryLedger:
+    """
+    Journal par produit. Les écritures passent par `ProductRepository.adjust_stock`,
+    qui fournit le solde après chaque mouvement : c'est lui qui est mémorisé aux points de contrôle.
+    """
+    def __init__(self, checkpoint_every: int = 64):
+        self.checkpoint_every = checkpoint_every
+        self._ledgers: Dict[str, _ProductLedger] = {}
+
+    def record(self, product_id: str, delta: int, reserved_delta: int, reason: str, order_id: Optional[str], balance: Tuple[int, int]) -> StockMovement:
+        ledger = self._ledgers.get(product_id)
+        if ledger is None:
+            ledger = self._ledgers[product_id] = _ProductLedger()
+        # Horodatage croissant par produit, pour la recherche par date (bisect)
+        at = max(time.time(), ledger.times[-1]) if ledger.times else time.time()
+        movement = StockMovement(at, product_id, delta, reserved_delta, reason, order_id)
+        ledger.movements.append(movement)
+        ledger.times.append(at)
+        if len(ledger.movements) % self.checkpoint_every == 0:
+            ledger.checkpoints.append(balance)
+        return movement
+
+    def balance_at(self, product_id: str, at: Optional[float] = None) -> Tuple[int, int]:
+        """
+        Soldes (disponible, réservé) à la date `at` (maintenant par défaut) :
+        point de contrôle précédent + au plus `checkpoint_every` mouvements rejoués.
+        """
+        ledger = self._ledgers.get(product_id)
+        if ledger is None:
+            return 0, 0
+        n = len(ledger.movements) if at is None else bisect_right(ledger.times, at)
+        k = min(n // self.checkpoint_every, len(ledger.checkpoints) - 1)
+        available, reserved = ledger.checkpoints[k]
+        for movement in ledger.movements[k * self.checkpoint_every:n]:
+            available += movement.delta
+            reserved += movement.reserved_delta
+        return available, reserved
+
+    def movements(self, product_id: str, since: Optional[float] = None, until: Optional[float] = None) -> Iterator[StockMovement]:
+        """Mouvements d'un produit sur une période, dans l'ordre chronologique."""
+        ledger = self._ledgers.get(product_id)
+        if ledger is None:
+            return iter(())
+        start = bisect_left(ledger.times, since) if since is not None else 0
+        end = bisect_right(ledger.times, until) if until is not None else len(ledger.movements)
+        return (ledger.movements[i] for i in range(start, end))
+
+    def reconcile(self, products: Iterable, since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Dict]:
+        """
+        Rapport de rapprochement, produit par produit (générateur : rien n'est accumulé).
+        Pour chaque produit : solde d'ouverture à `since`, entrées et sorties de la
+        période, solde de clôture à `until`, et écart entre le journal et le stock actuel.
+        """
+        for product in products:
+            opening = self.balance_at(product.id, since) if since is not None else (0, 0)
+            entries = exits = 0
+            for movement in self.movements(product.id, since, until):
+                if movement.delta > 0:
+                    entries += movement.delta
+                else:
+                    exits -= movement.delta
+            closing = self.balance_at(product.id, until)
+            current = self.balance_at(product.id)
+            yield {
+                "product_id": product.id,
+                "name": product.name,
+                "opening_qty": opening[0],
+                "entries": entries,
+                "exits": exits,
+                "closing_qty": closing[0],
+                "closing_reserved_qty": closing[1],
+                "stock_qty": product.stock_qty,
+                "reserved_qty": product.reserved_qty,
+                "discrepancy": product.stock_qty - current[0],
+            }
@@ -0,0 +1,240 @@
+"""
+Émission différée et rendu des factures.
+Les commandes payées sont mises en file par l'événement OrderPaid, puis
+facturées par lots dans un thread dédié, hors du chemin de paiement.
+Les documents (PDF/HTML) sont rendus dans un pool de processus et mis en cache sur disque.
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict
+from html import escape
+from typing import Dict, List, Optional
+import os
+import queue
+import threading
+import time
+import zipfile
+
+from events import EventBus, OrderPaid
+from models import BillingService, Invoice, InvoiceRepository, OrderRepository
+
+
+class InvoiceBatcher:
+    """
+    Regroupe les commandes à facturer : un lot part dès qu'il atteint
+    `batch_size` commandes ou que la plus ancienne attend depuis `max_wait_s`.
+    `Order.invoice_id` est renseigné quand la facture est émise, sans changer
+    la version de la commande.
+    """
+    def __init__(self, billing: BillingService, orders: OrderRepository, batch_size: int = 100, max_wait_s: float = 0.2):
+        self.billing = billing
+        self.orders = orders
+        self.batch_size = batch_size
+        self.max_wait_s = max_wait_s
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="invoice-batcher", daemon=True)
+        self._thread.start()
+
+    def subscribe_to(self, events: EventBus):
+        events.subscribe(OrderPaid, self._on_order_paid, name="invoice-batcher")
+
+    def _on_order_paid(self, event: OrderPaid):
+        self.enqueue(event.order_id)
+
+    def enqueue(self, order_id: str):
+        self._queue.put(order_id)
+
+    def flush(self):
+        """Attend que toutes les commandes en file soient facturées."""
+        self._queue.join()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self) -> List[Optional[str]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                orders = []
+                for order_id in batch:
+                    order = self.orders.get(order_id) if order_id else None
+                    if order and not order.invoice_id:
+                        orders.append(order)
+                for order, invoice in zip(orders, self.billing.issue_invoices(orders)):
+                    self.orders.attach_invoice(order, invoice.id)
+            except Exception as e:
+                print(f"Erreur de facturation différée: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if batch[-1] is None:
+                return
+
+
+# =========================
+# ===== RENDU DES DOCUMENTS =====
+# =========================
+
+FORMATS = {"pdf": "application/pdf", "html": "text/html"}
+
+
+def _euros(cents: int) -> str:
+    return f"{cents / 100:.2f} EUR"
+
+
+def _invoice_text_lines(data: Dict) -> List[str]:
+    issued = time.strftime("%d/%m/%Y", time.gmtime(data["issued_at"]))
+    lines = [
+        f"FACTURE {data['id']}",
+        f"Date : {issued}    Commande : {data['order_id']}",
+        "",
+        f"Client : {data['customer_name']}",
+        f"Adresse : {data['customer_address']}",
+        "",
+        f"{'Article':<40} {'PU':>12} {'Qté':>5} {'Total':>14}",
+    ]
+    for line in data["lines"]:
+        lines.append(
+            f"{line['name'][:40]:<40} {_euros(line['unit_price_cents']):>12} "
+            f"{line['quantity']:>5} {_euros(line['line_total_cents']):>14}"
+        )
+    lines += ["", f"{'TOTAL TTC':<59} {_euros(data['total_cents']):>14}"]
+    return lines
+
+
+def render_invoice_html(data: Dict) -> bytes:
+    rows = "".join(
+        f"<tr><td>{escape(l['name'])}</td><td>{_euros(l['unit_price_cents'])}</td>"
+        f"<td>{l['quantity']}</td><td>{_euros(l['line_total_cents'])}</td></tr>"
+        for l in data["lines"]
+    )
+    issued = time.strftime("%d/%m/%Y", time.gmtime(data["issued_at"]))
+    return (
+        "<!DOCTYPE html><html lang=\"fr\"><head><meta charset=\"utf-8\">"
+        f"<title>Facture {escape(data['id'])}</title></head><body>"
+        f"<h1>Facture {escape(data['id'])}</h1>"
+        f"<p>Date : {issued}<br>Commande : {escape(data['order_id'])}</p>"
+        f"<p>{escape(data['customer_name'])}<br>{escape(data['customer_address'])}</p>"
+        "<table><thead><tr><th>Article</th><th>PU</th><th>Qté</th><th>Total</th></tr></thead>"
+        f"<tbody>{rows}</tbody></table>"
+        f"<p><strong>Total TTC : {_euros(data['total_cents'])}</strong></p>"
+        "</body></html>"
+    ).encode("utf-8")
+
+
+def render_invoice_pdf(data: Dict, lines_per_page: int = 50) -> bytes:
+    """PDF texte minimal (Courier, WinAnsi), sans dépendance externe."""
+    text = _invoice_text_lines(data)
+    pages = [text[i:i + lines_per_page] for i in range(0, len(text), lines_per_page)] or [[]]
+
+    def pdf_string(s: str) -> bytes:
+        raw = s.encode("cp1252", errors="replace")
+        return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+    objects: List[bytes] = []  # objet n -> objects[n - 1]
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % i for i in page_ids) + b"] /Count %d >>" % len(pages))
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>")
+    for page_id, page in zip(page_ids, pages):
+        stream = b"BT /F1 9 Tf 40 800 Td 12 TL " + b" ".join(pdf_string(l) + b" '" for l in page) + b" ET"
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (page_id + 1)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % n + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def _render_to_file(data: Dict, fmt: str, path: str) -> str:
+    """Exécuté dans un processus du pool : rend le document et l'écrit de façon atomique."""
+    content = render_invoice_pdf(data) if fmt == "pdf" else render_invoice_html(data)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(content)
+    os.replace(tmp, path)
+    return path
+
+
+class InvoiceRenderer:
+    """
+    Rend les factures dans un pool de processus (travail CPU hors de la boucle
+    de l'API) et les met en cache sur disque par id : une facture émise ne
+    change plus (coordonnées du client comprises, copiées à l'émission), un
+    fichier présent en cache est donc toujours valide.
+    """
+    def __init__(self, invoices: InvoiceRepository, cache_dir: str, max_workers: Optional[int] = None):
+        self.invoices = invoices
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, "exports"), exist_ok=True)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def cache_path(self, invoice_id: str, fmt: str) -> str:
+        return os.path.join(self.cache_dir, f"{invoice_id}.{fmt}")
+
+    def _document_data(self, invoice: Invoice) -> Dict:
+        return asdict(invoice)
+
+    def submit(self, invoice: Invoice, fmt: str) -> Future:
+        """Future du chemin du document ; déjà résolue si le document est en cache."""
+        if fmt not in FORMATS:
+            raise ValueError(f"Format de facture inconnu : {fmt}")
+        path = self.cache_path(invoice.id, fmt)
+        if os.path.exists(path):
+            done: Future = Future()
+            done.set_result(path)
+            return done
+        key = f"{invoice.id}.{fmt}"
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._executor().submit(_render_to_file, self._document_data(invoice), fmt, path)
+                self._pending[key] = future
+                future.add_done_callback(lambda _: self._pending.pop(key, None))
+        return future
+
+    def export_month(self, year: int, month: int, fmt: str = "pdf") -> str:
+        """Rend en parallèle toutes les factures du mois et les regroupe dans une archive zip."""
+        futures = [self.submit(invoice, fmt) for invoice in self.invoices.list_by_month(year, month)]
+        archive = os.path.join(self.cache_dir, "exports", f"factures-{year:04d}-{month:02d}-{fmt}.zip")
+        tmp = f"{archive}.{threading.get_ident()}.tmp"
+        with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for future in futures:
+                path = future.result()
+                zf.write(path, arcname=os.path.basename(path))
+        os.replace(tmp, archive)
+        return archive
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
@@ -17,8 +17,18 @@ from models import (
     InvoiceRepository, PaymentRepository, ThreadRepository,
     SessionManager, AuthService, CatalogService, CartService,
     BillingService, DeliveryService, PaymentGateway, OrderService,
-    CustomerService
+    CustomerService, ConflictError
 )
+from analytics import SalesRollups
+from archive import ThreadArchive
+from events import EventBus
+from holds import StockHoldSweeper
+from idempotency import IdempotencyStore, IdempotentResponses
+from invoicing import InvoiceBatcher, InvoiceRenderer
+from payments import PaymentPipeline, SimulatedPaymentGateway
+from realtime import ThreadBroadcaster
+from search import SupportSearchIndex
+from schemas import MessageResponse
 
 # Import des routers
 from routers import auth, catalog, cart, orders, support, admin
@@ -28,10 +38,17 @@ from routers import auth, catalog, cart, orders, support, admin
 # ===== INITIALISATION DES SERVICES =====
 # =========================
 
+# Bus d'événements métier
+event_bus = EventBus()
+
 # Création des repositories (singletons en mémoire)
 users_repo = UserRepository()
-products_repo = ProductRepository()
-carts_repo = CartRepository()
+products_repo = ProductRepository(event_bus)
+carts_repo = CartRepository(
+    max_carts=int(os.getenv("CART_MAX_IN_MEMORY", "10000")),
+    ttl_s=float(os.getenv("CART_TTL_S", str(7 * 24 * 3600))),
+    spill_dir=os.getenv("CART_SPILL_DIR") or None
+)
 orders_repo = OrderRepository()
 invoices_repo = InvoiceRepository()
 payments_repo = PaymentRepository()
@@ -40,17 +57,65 @@ sessions_manager = SessionManager()
 
 # Création des services
 auth_service = AuthService(users_repo, sessions_manager)
-catalog_service = CatalogService(products_repo)
+catalog_service = CatalogService(products_repo, event_bus)
 cart_service = CartService(carts_repo, products_repo)
-billing_service = BillingService(invoices_repo)
+billing_service = BillingService(invoices_repo, users_repo)
 delivery_service = DeliveryService()
-payment_gateway = PaymentGateway()
+if os.getenv("PSP_SIMULATION"):
+    payment_gateway = SimulatedPaymentGateway.from_env()
+else:
+    payment_gateway = PaymentGateway(latency_s=float(os.getenv("PSP_LATENCY_S", "0")))
 order_service = OrderService(
     orders_repo, products_repo, carts_repo, payments_repo,
     invoices_repo, billing_service, delivery_service,
-    payment_gateway, users_repo
+    payment_gateway, users_repo, event_bus,
+    hold_s=float(os.getenv("ORDER_HOLD_S", str(30 * 60)))
+)
+stock_hold_sweeper = StockHoldSweeper(order_service, interval_s=float(os.getenv("STOCK_HOLD_SWEEP_S", "5")))
+stock_hold_sweeper.subscribe_to(event_bus)
+# Agrégats de ventes (heure / jour / semaine) du tableau de bord
+sales_rollups = SalesRollups(orders_repo)
+sales_rollups.subscribe_to(event_bus)
+invoice_batcher = InvoiceBatcher(billing_service, orders_repo)
+invoice_batcher.subscribe_to(event_bus)
+thread_broadcaster = ThreadBroadcaster(
+    threads_repo,
+    serialize=lambda msg: MessageResponse.from_message(msg, users_repo).model_dump_json()
+)
+thread_broadcaster.subscribe_to(event_bus)
+invoice_renderer = InvoiceRenderer(
+    invoices_repo,
+    cache_dir=os.getenv(
+        "INVOICE_CACHE_DIR",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "invoices_cache")
+    )
+)
+customer_service = CustomerService(threads_repo, users_repo, event_bus)
+support_search = SupportSearchIndex(threads_repo)
+support_search.subscribe_to(event_bus)
+thread_archive = ThreadArchive(
+    threads_repo,
+    directory=os.getenv(
+        "SUPPORT_ARCHIVE_DIR",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "support_archive")
+    ),
+    events=event_bus
+)
+support_archive_after_s = float(os.getenv("SUPPORT_ARCHIVE_AFTER_S", str(30 * 24 * 3600)))
+# Réponses rejouées pour les requêtes répétées avec la même clé Idempotency-Key
+idempotent_responses = IdempotentResponses(
+    IdempotencyStore(
+        max_entries=int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000")),
+        ttl_s=float(os.getenv("IDEMPOTENCY_TTL_S", str(24 * 3600)))
+    ),
+    secret=os.getenv("IDEMPOTENCY_SECRET", "").encode("utf-8") or None
+)
+payment_pipeline = PaymentPipeline(
+    order_service,
+    max_workers=int(os.getenv("PAYMENT_WORKERS", "4")),
+    max_pending=int(os.getenv("PAYMENT_MAX_PENDING", "100")),
+    timeout_s=float(os.getenv("PAYMENT_TIMEOUT_S", "10"))
 )
-customer_service = CustomerService(threads_repo, users_repo)
 
 
 # =========================
@@ -76,6 +141,17 @@ class AppContext:
         self.payment_gateway = payment_gateway
         self.order_service = order_service
         self.customer_service = customer_service
+        self.payment_pipeline = payment_pipeline
+        self.idempotent_responses = idempotent_responses
+        self.event_bus = event_bus
+        self.invoice_batcher = invoice_batcher
+        self.invoice_renderer = invoice_renderer
+        self.thread_broadcaster = thread_broadcaster
+        self.support_search = support_search
+        self.thread_archive = thread_archive
+        self.stock_hold_sweeper = stock_hold_sweeper
+        self.sales_rollups = sales_rollups
+        self.support_archive_after_s = support_archive_after_s
 
 
 app_context = AppContext()
@@ -127,6 +203,15 @@ async def value_error_handler(request: Request, exc: ValueError):
     )
 
 
+@app.exception_handler(ConflictError)
+async def conflict_error_handler(request: Request, exc: ConflictError):
+    """Gestion des modifications concurrentes (version périmée)."""
+    return JSONResponse(
+        status_code=409,
+        content={"detail": str(exc)}
+    )
+
+
 @app.exception_handler(PermissionError)
 async def permission_error_handler(request: Request, exc: PermissionError):
     """Gestion des erreurs de permission."""
@@ -155,6 +240,40 @@ async def general_exception_handler(request: Request, exc: Exception):
     )
 
 
+# =========================
+# ===== DÉMARRAGE ET ARRÊT DE L'APPLICATION =====
+# =========================
+
+@app.on_event("startup")
+def start_background_workers():
+    """
+    Reconstruit l'index de recherche du support et les agrégats de ventes, puis lance l'archivage périodique
+    des fils fermés, l'expiration des réservations de stock et la purge des paniers débordés.
+    """
+    support_search.rebuild()
+    print(f"🔎 Index de recherche du support: {support_search.stats()}")
+    sales_rollups.rebuild()
+    print(f"📈 Agrégats de ventes: {sales_rollups.stats()}")
+    thread_archive.start(
+        interval_s=float(os.getenv("SUPPORT_ARCHIVE_INTERVAL_S", "3600")),
+        older_than_s=support_archive_after_s
+    )
+    stock_hold_sweeper.start()
+    carts_repo.start(interval_s=float(os.getenv("CART_SPILL_SWEEP_S", "3600")))
+
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    """Termine les paiements et facturations en cours avant l'arrêt du serveur."""
+    payment_pipeline.shutdown(wait=True)
+    invoice_batcher.stop()
+    invoice_renderer.shutdown()
+    thread_archive.stop()
+    stock_hold_sweeper.stop()
+    carts_repo.stop()
+    event_bus.shutdown()
+
+
 # =========================
 # ===== ROUTES PRINCIPALES =====
 # =========================
@@ -1,10 +1,25 @@
 from __future__ import annotations
-from dataclasses import dataclass, field
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, replace
 from enum import Enum, auto
-from typing import Dict, List, Optional
+from itertools import islice
+from typing import Callable, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import threading
 import uuid
 import time
 
+from inventory import InventoryLedger
+from events import (
+    EventBus, OrderCreated, OrderValidated, OrderPaid, OrderShipped,
+    OrderDelivered, OrderCancelled, OrderRefunded, ThreadOpened, MessagePosted, ProductChanged,
+    LowStockReached, LowStockCleared
+)
+
 
 # =========================
 # ===== MODÈLES DE DONNÉES =====
@@ -29,11 +44,19 @@ class User:
     last_name: str
     address: str
     is_admin: bool = False
+    _display_name: Optional[str] = field(default=None, repr=False, compare=False)
+
+    def display_name(self) -> str:
+        """Nom affiché (« Prénom Nom »), calculé une fois puis mis en cache."""
+        if self._display_name is None:
+            self._display_name = f"{self.first_name} {self.last_name}"
+        return self._display_name
 
     def update_profile(self, **fields):
         for k, v in fields.items():
-            if hasattr(self, k) and k not in {"id", "email", "is_admin", "password_hash"}:
+            if hasattr(self, k) and not k.startswith("_") and k not in {"id", "email", "is_admin", "password_hash"}:
                 setattr(self, k, v)
+        self._display_name = None
 
 
 @dataclass
@@ -45,55 +68,119 @@ class Product:
     stock_qty: int
     active: bool = True
     image_url: Optional[str] = None
+    # Incrémentée à chaque modification (champs ou stock) : contrôle de concurrence optimiste,
+    # et les paniers y comparent leur copie
+    version: int = 0
+    # Quantité retenue par des commandes pas encore payées, déjà déduite de stock_qty
+    # (stock_qty = disponible à la vente, stock_qty + reserved_qty = stock physique)
+    reserved_qty: int = 0
+    # Stock faible en dessous de ce seuil (stock disponible)
+    low_stock_threshold: int = 10
 
 
 @dataclass
 class CartItem:
     product_id: str
     quantity: int
+    # Copie des champs du produit au moment de l'ajout, rafraîchie si product_version change
+    name: str = ""
+    unit_price_cents: int = 0
+    image_url: Optional[str] = None
+    active: bool = True
+    product_version: int = -1
 
-
-
+    def line_total_cents(self) -> int:
+        return self.unit_price_cents * self.quantity if self.active else 0
 
 
 @dataclass
 class Cart:
     user_id: str
     items: Dict[str, CartItem] = field(default_factory=dict)  # key: product_id
-
-    def add(self, product: Product, qty: int = 1):
+    # Total courant des lignes actives, et version du catalogue à laquelle les copies ont été vérifiées
+    running_total_cents: int = 0
+    catalog_version: int = -1
+
+    def _snapshot(self, item: CartItem, product: Optional[Product]):
+        """Recopie le produit dans la ligne et corrige le total courant."""
+        self.running_total_cents -= item.line_total_cents()
+        if product is None:
+            item.active = False
+            item.product_version = -1
+        else:
+            item.name = product.name
+            item.unit_price_cents = product.price_cents
+            item.image_url = product.image_url
+            item.active = product.active
+            item.product_version = product.version
+        self.running_total_cents += item.line_total_cents()
+
+    def add(self, product: Product, qty: int = 1, check_stock: bool = True):
         if qty <= 0:
             raise ValueError("Quantité invalide.")
         if not product.active:
             raise ValueError("Produit inactif.")
-        if product.stock_qty < qty:
+        if check_stock and product.stock_qty < qty:
             raise ValueError("Stock insuffisant.")
-        if product.id in self.items:
-            self.items[product.id].quantity += qty
-        else:
-            self.items[product.id] = CartItem(product_id=product.id, quantity=qty)
+        item = self.items.get(product.id)
+        if item is None:
+            item = self.items[product.id] = CartItem(product_id=product.id, quantity=0)
+        if item.product_version != product.version:
+            self._snapshot(item, product)
+        item.quantity += qty
+        self.running_total_cents += item.unit_price_cents * qty
+
+    def set_quantity(self, product: Product, qty: int, check_stock: bool = True):
+        """Fixe la quantité d'une ligne (0 = retrait)."""
+        if qty < 0:
+            raise ValueError("Quantité invalide.")
+        current = self.items[product.id].quantity if product.id in self.items else 0
+        if qty > current:
+            self.add(product, qty - current, check_stock)
+        elif qty < current:
+            self.remove(product.id, current - qty)
 
     def remove(self, product_id: str, qty: int = 1):
-        if product_id not in self.items:
+        item = self.items.get(product_id)
+        if item is None:
             return
-        if qty <= 0:
+        if qty <= 0 or item.quantity <= qty:
+            self.running_total_cents -= item.line_total_cents()
             del self.items[product_id]
             return
-        self.items[product_id].quantity -= qty
-        if self.items[product_id].quantity <= 0:
-            del self.items[product_id]
+        if item.active:
+            self.running_total_cents -= item.unit_price_cents * qty
+        item.quantity -= qty
 
     def clear(self):
         self.items.clear()
+        self.running_total_cents = 0
+
+    def copy(self) -> "Cart":
+        """Copie indépendante (lignes comprises), pour appliquer des modifications tout-ou-rien."""
+        return replace(self, items={pid: replace(it) for pid, it in self.items.items()})
+
+    def refresh(self, product_repo: "ProductRepository"):
+        """
+        Remet les copies à jour si le catalogue a changé depuis la dernière
+        vérification ; sinon O(1). Seules les lignes dont le produit a changé sont recopiées.
+        """
+        if self.catalog_version == product_repo.catalog_version:
+            return
+        for item in self.items.values():
+            product = product_repo.get(item.product_id)
+            if product is None or product.version != item.product_version:
+                self._snapshot(item, product)
+        self.catalog_version = product_repo.catalog_version
+
+    def lines(self, product_repo: "ProductRepository") -> List[CartItem]:
+        """Lignes actives, copies à jour."""
+        self.refresh(product_repo)
+        return [it for it in self.items.values() if it.active]
 
     def total_cents(self, product_repo: "ProductRepository") -> int:
-        total = 0
-        for it in self.items.values():
-            p = product_repo.get(it.product_id)
-            if p is None or not p.active:
-                continue
-            total += p.price_cents * it.quantity
-        return total
+        self.refresh(product_repo)
+        return self.running_total_cents
 
 
 @dataclass
@@ -113,6 +200,9 @@ class Invoice:
     lines: List[InvoiceLine]
     total_cents: int
     issued_at: float  # epoch timestamp
+    # Coordonnées du client copiées à l'émission : la facture ne change plus ensuite
+    customer_name: str = ""
+    customer_address: str = ""
 
 
 @dataclass
@@ -125,6 +215,7 @@ class Payment:
     provider_ref: str
     succeeded: bool
     created_at: float
+    refunded_at: Optional[float] = None  # débit remboursé faute de commande encore payable
 
 
 @dataclass
@@ -145,6 +236,57 @@ class MessageThread:
     subject: str
     messages: List["Message"] = field(default_factory=list)
     closed: bool = False
+    closed_at: Optional[float] = None
+    # Index dérivés, tenus à jour par add_message
+    _position: Dict[str, int] = field(default_factory=dict, repr=False, compare=False)
+    trailing_count: int = field(default=0, repr=False, compare=False)  # messages consécutifs du dernier auteur (client ou support)
+    last_customer_message_at: Optional[float] = field(default=None, repr=False, compare=False)
+
+    def add_message(self, msg: "Message"):
+        last = self.messages[-1] if self.messages else None
+        if last is not None and (last.author_user_id is None) == (msg.author_user_id is None):
+            self.trailing_count += 1
+        else:
+            self.trailing_count = 1
+        if msg.author_user_id is not None:
+            self.last_customer_message_at = msg.created_at
+        self._position[msg.id] = len(self.messages)
+        self.messages.append(msg)
+
+    def position_of(self, message_id: str) -> Optional[int]:
+        return self._position.get(message_id)
+
+    def page(self, since: Optional[str] = None, before: Optional[str] = None, limit: int = 50) -> Tuple[List["Message"], bool]:
+        """
+        Tranche de messages par curseur : après `since`, avant `before`, ou les
+        `limit` derniers. Retourne aussi s'il reste des messages dans cette direction.
+        """
+        if since is not None and before is not None:
+            raise ValueError("Utiliser soit 'since', soit 'before'.")
+        if since is not None:
+            pos = self.position_of(since)
+            if pos is None:
+                raise ValueError("Curseur inconnu.")
+            start, end = pos + 1, min(pos + 1 + limit, len(self.messages))
+            return self.messages[start:end], end < len(self.messages)
+        end = len(self.messages)
+        if before is not None:
+            end = self.position_of(before)
+            if end is None:
+                raise ValueError("Curseur inconnu.")
+        start = max(0, end - limit)
+        return self.messages[start:end], start > 0
+
+    def is_answered(self) -> bool:
+        """Vrai si le dernier message vient du support."""
+        return bool(self.messages) and self.messages[-1].author_user_id is None
+
+    def unread_count(self, for_support: bool) -> int:
+        """Messages de l'autre partie restés sans réponse (du point de vue du support ou du client)."""
+        if not self.messages:
+            return 0
+        last_is_support = self.messages[-1].author_user_id is None
+        return self.trailing_count if last_is_support != for_support else 0
 
 
 @dataclass
@@ -156,12 +298,33 @@ class Message:
     created_at: float
 
 
+@dataclass
+class ArchivedThread:
+    """Résumé gardé en mémoire d'un fil archivé sur disque (voir archive.py)."""
+    id: str
+    user_id: str
+    order_id: Optional[str]
+    subject: str
+    message_count: int
+    last_message_preview: Optional[str]
+    last_message_at: Optional[float]
+    closed_at: float
+    segment: str   # fichier du segment
+    offset: int    # position de l'enregistrement compressé dans le segment
+    length: int
+
+
 @dataclass
 class OrderItem:
     product_id: str
     name: str
     unit_price_cents: int
     quantity: int
+    line_total_cents: int = field(init=False)
+
+    def __post_init__(self):
+        # Les lignes d'une commande ne changent plus après le checkout : total calculé une fois
+        self.line_total_cents = self.unit_price_cents * self.quantity
 
 
 @dataclass
@@ -181,9 +344,29 @@ class Order:
     delivery: Optional[Delivery] = None
     invoice_id: Optional[str] = None
     payment_id: Optional[str] = None
+    hold_expires_at: Optional[float] = None  # fin de la réservation du stock tant que la commande n'est pas payée
+    refunded_cents: Optional[int] = None
+    version: int = 0  # incrémentée à chaque modification, sous le verrou du dépôt
+    total_cents: int = field(init=False)
+    item_count: int = field(init=False)  # nombre d'articles (somme des quantités)
+
+    def __post_init__(self):
+        # Les articles sont figés au checkout : totaux calculés une fois à la création
+        self.total_cents = sum(i.line_total_cents for i in self.items)
+        self.item_count = sum(i.quantity for i in self.items)
 
-    def total_cents(self) -> int:
-        return sum(i.unit_price_cents * i.quantity for i in self.items)
+
+@dataclass
+class BulkResult:
+    """Résultat d'une opération back-office groupée, pour une commande."""
+    order_id: str
+    succeeded: bool
+    status: Optional[OrderStatus] = None
+    error: Optional[str] = None
+
+
+class ConflictError(Exception):
+    """La version attendue ne correspond plus : l'objet a été modifié entre-temps."""
 
 
 # =========================
@@ -207,11 +390,33 @@ class UserRepository:
 
 
 class ProductRepository:
-    def __init__(self):
+    def __init__(self, events: Optional[EventBus] = None):
         self._by_id: Dict[str, Product] = {}
+        # Compteur global : un panier vérifié à cette version n'a rien à rafraîchir
+        self.catalog_version = 0
+        # Journal des mouvements de stock : toute écriture passe par adjust_stock
+        self.ledger = InventoryLedger()
+        self._stock_lock = threading.Lock()
+        # Index des produits actifs trié par marge (stock - seuil) : marge < 0 = stock faible
+        self._stock_index: List[Tuple[int, str]] = []
+        self._margins: Dict[str, int] = {}
+        self.events = events or EventBus()
 
     def add(self, product: Product):
         self._by_id[product.id] = product
+        self.catalog_version += 1
+        with self._stock_lock:
+            if product.stock_qty or product.reserved_qty:
+                self.ledger.record(
+                    product.id, product.stock_qty, product.reserved_qty, "stock_initial", None,
+                    (product.stock_qty, product.reserved_qty)
+                )
+            alert = self._reindex(product)
+        self._publish(alert)
+
+    def bump_catalog_version(self):
+        """À appeler quand un champ recopié dans les paniers (nom, prix, actif, image) change."""
+        self.catalog_version += 1
 
     def get(self, product_id: str) -> Optional[Product]:
         return self._by_id.get(product_id)
@@ -219,39 +424,300 @@ class ProductRepository:
     def list_active(self) -> List[Product]:
         return [p for p in self._by_id.values() if p.active]
 
-    def reserve_stock(self, product_id: str, qty: int):
+    def adjust_stock(self, product_id: str, delta: int, reason: str, order_id: Optional[str] = None, reserved_delta: int = 0) -> Product:
+        """Seul point d'écriture du stock : applique le mouvement et l'ajoute au journal."""
+        with self._stock_lock:
+            p = self._apply(self._get_existing(product_id), delta, reserved_delta, reason, order_id)
+            alert = self._reindex(p) if delta else None
+        self._publish(alert)
+        return p
+
+    def update(self, product_id: str, changes: Dict[str, object], expected_version: Optional[int] = None) -> Tuple[Product, List[str]]:
+        """
+        Modifie des champs d'un produit (saisie admin) ; retourne le produit et les champs changés.
+        Avec `expected_version`, lève ConflictError si le produit a changé depuis sa lecture.
+        Un nouveau `stock_qty` est enregistré au journal comme un mouvement d'écart.
+        """
+        if changes.get("stock_qty", 0) < 0:
+            raise ValueError("Stock invalide.")
+        with self._stock_lock:
+            p = self._get_existing(product_id)
+            if expected_version is not None and p.version != expected_version:
+                raise ConflictError("Produit modifié entre-temps, rechargez-le avant de réessayer.")
+            changed = [k for k, v in changes.items() if getattr(p, k) != v]
+            for k in changed:
+                if k == "stock_qty":
+                    self._apply(p, changes[k] - p.stock_qty, 0, "ajustement", None)
+                else:
+                    setattr(p, k, changes[k])
+            if changed:
+                p.version += 1
+            alert = self._reindex(p) if {"stock_qty", "active", "low_stock_threshold"}.intersection(changed) else None
+        self._publish(alert)
+        return p, changed
+
+    def _reindex(self, p: Product):
+        # Appelé sous _stock_lock ; retourne l'alerte à publier si le produit franchit son seuil
+        old = self._margins.pop(p.id, None)
+        if old is not None:
+            del self._stock_index[bisect_left(self._stock_index, (old, p.id))]
+        new = None
+        if p.active:
+            new = p.stock_qty - p.low_stock_threshold
+            insort(self._stock_index, (new, p.id))
+            self._margins[p.id] = new
+        was_low = old is not None and old < 0
+        is_low = new is not None and new < 0
+        if is_low and not was_low:
+            return LowStockReached(product_id=p.id, stock_qty=p.stock_qty, threshold=p.low_stock_threshold)
+        if was_low and not is_low:
+            return LowStockCleared(product_id=p.id, stock_qty=p.stock_qty, threshold=p.low_stock_threshold)
+        return None
+
+    def _publish(self, alert):
+        # Hors du verrou : un abonné peut relire ou modifier le stock
+        if alert is not None:
+            self.events.publish(alert)
+
+    def list_low_stock(self, limit: Optional[int] = None) -> List[Product]:
+        """Produits actifs sous leur seuil, du plus critique au moins critique."""
+        with self._stock_lock:
+            end = bisect_left(self._stock_index, (0, ""))
+            if limit is not None:
+                end = min(end, limit)
+            return [self._by_id[pid] for _, pid in self._stock_index[:end]]
+
+    def count_low_stock(self) -> int:
+        with self._stock_lock:
+            return bisect_left(self._stock_index, (0, ""))
+
+    def _get_existing(self, product_id: str) -> Product:
+        p = self.get(product_id)
+        if not p:
+            raise ValueError("Produit introuvable.")
+        return p
+
+    def _apply(self, p: Product, delta: int, reserved_delta: int, reason: str, order_id: Optional[str]) -> Product:
+        # Appelé sous _stock_lock
+        if p.stock_qty + delta < 0:
+            raise ValueError("Stock insuffisant.")
+        p.stock_qty += delta
+        p.reserved_qty += reserved_delta
+        p.version += 1
+        self.ledger.record(p.id, delta, reserved_delta, reason, order_id, (p.stock_qty, p.reserved_qty))
+        return p
+
+    def reserve_stock(self, product_id: str, qty: int, reason: str = "vente", order_id: Optional[str] = None):
         p = self.get(product_id)
         if not p or p.stock_qty < qty:
             raise ValueError("Stock insuffisant.")
-        p.stock_qty -= qty
+        self.adjust_stock(product_id, -qty, reason, order_id)
 
-    def release_stock(self, product_id: str, qty: int):
+    def release_stock(self, product_id: str, qty: int, reason: str = "retour", order_id: Optional[str] = None):
+        if self.get(product_id):
+            self.adjust_stock(product_id, qty, reason, order_id)
+
+    def hold_stock(self, product_id: str, qty: int, order_id: Optional[str] = None):
+        """Retient du stock pour une commande non payée : il n'est plus disponible à la vente."""
         p = self.get(product_id)
-        if p:
-            p.stock_qty += qty
+        if not p or p.stock_qty < qty:
+            raise ValueError("Stock insuffisant.")
+        self.adjust_stock(product_id, -qty, "reservation", order_id, reserved_delta=qty)
 
+    def confirm_hold(self, product_id: str, qty: int, order_id: Optional[str] = None):
+        """La commande est payée : la réservation devient une sortie de stock définitive."""
+        if self.get(product_id):
+            self.adjust_stock(product_id, 0, "paiement", order_id, reserved_delta=-qty)
 
-class CartRepository:
-    def __init__(self):
-        self._by_user: Dict[str, Cart] = {}
+    def release_hold(self, product_id: str, qty: int, reason: str = "liberation", order_id: Optional[str] = None):
+        if self.get(product_id):
+            self.adjust_stock(product_id, qty, reason, order_id, reserved_delta=-qty)
 
-    def get_or_create(self, user_id: str) -> Cart:
-        if user_id not in self._by_user:
-            self._by_user[user_id] = Cart(user_id=user_id)
-        return self._by_user[user_id]
+
+class CartRepository:
+    """
+    Paniers en mémoire, du moins récemment utilisé au plus récent.
+
+    - un panier inutilisé depuis `ttl_s` est considéré comme abandonné et supprimé ;
+    - au-delà de `max_carts`, les plus anciens sont écrits dans `spill_dir`
+      (s'il est défini) et relus au prochain accès, sinon supprimés ; les fichiers
+      jamais relus sont supprimés par `sweep_spilled` une fois leur TTL dépassé ;
+    - les lectures ne créent pas de panier : un panier vide n'est pas conservé.
+    """
+    def __init__(self, max_carts: int = 10000, ttl_s: float = 7 * 24 * 3600, spill_dir: Optional[str] = None):
+        self.max_carts = max_carts
+        self.ttl_s = ttl_s
+        self.spill_dir = spill_dir
+        self._by_user: "OrderedDict[str, Tuple[float, Cart]]" = OrderedDict()  # user_id -> (dernier accès, panier)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"expired": 0, "evicted": 0, "spilled": 0, "restored": 0}
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def get(self, user_id: str) -> Optional[Cart]:
+        with self._lock:
+            return self._get(user_id, time.time())
+
+    def put(self, cart: Cart):
+        """Enregistre le panier (un panier vide est supprimé)."""
+        if not cart.items:
+            self.clear(cart.user_id)
+            return
+        with self._lock:
+            now = time.time()
+            if self._by_user.pop(cart.user_id, None) is None:
+                # Une copie débordée plus ancienne ne doit plus être relue
+                self._remove_spilled(cart.user_id)
+            self._by_user[cart.user_id] = (now, cart)
+            self._purge(now)
 
     def clear(self, user_id: str):
-        self.get_or_create(user_id).clear()
+        with self._lock:
+            self._by_user.pop(user_id, None)
+            self._remove_spilled(user_id)
+
+    def __len__(self) -> int:
+        return len(self._by_user)
+
+    def _get(self, user_id: str, now: float) -> Optional[Cart]:
+        entry = self._by_user.pop(user_id, None)
+        if entry is not None and entry[0] + self.ttl_s <= now:
+            self.stats["expired"] += 1
+            entry = None
+        if entry is not None:
+            self._by_user[user_id] = (now, entry[1])
+            return entry[1]
+        cart = self._restore(user_id, now)
+        if cart is not None:
+            self._by_user[user_id] = (now, cart)
+            self._purge(now)
+        return cart
+
+    def _purge(self, now: float):
+        # Le moins récemment utilisé est en tête : on s'arrête au premier panier à garder
+        while self._by_user:
+            user_id, (touched_at, cart) = next(iter(self._by_user.items()))
+            if touched_at + self.ttl_s <= now:
+                self._by_user.popitem(last=False)
+                self.stats["expired"] += 1
+            elif len(self._by_user) > self.max_carts:
+                self._by_user.popitem(last=False)
+                if self.spill_dir and cart.items:
+                    self._spill(user_id, touched_at, cart)
+                else:
+                    self.stats["evicted"] += 1
+            else:
+                break
+
+    # ----- Débordement sur disque -----
+
+    def _spill_path(self, user_id: str) -> str:
+        return os.path.join(self.spill_dir, hashlib.sha256(user_id.encode("utf-8")).hexdigest() + ".json")
+
+    def _spill(self, user_id: str, touched_at: float, cart: Cart):
+        path = self._spill_path(user_id)
+        data = {"touched_at": touched_at, "user_id": user_id, "items": [asdict(it) for it in cart.items.values()]}
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(f"{path}.tmp", path)
+        self.stats["spilled"] += 1
+
+    def _restore(self, user_id: str, now: float) -> Optional[Cart]:
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(user_id)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        os.remove(path)
+        if data["touched_at"] + self.ttl_s <= now:
+            self.stats["expired"] += 1
+            return None
+        cart = Cart(user_id=user_id)
+        for item in data["items"]:
+            cart.items[item["product_id"]] = CartItem(**item)
+        # Total recalculé depuis les copies ; catalog_version = -1 force la vérification des produits
+        cart.running_total_cents = sum(it.line_total_cents() for it in cart.items.values())
+        self.stats["restored"] += 1
+        return cart
+
+    def _remove_spilled(self, user_id: str):
+        if self.spill_dir:
+            try:
+                os.remove(self._spill_path(user_id))
+            except FileNotFoundError:
+                pass
+
+    def sweep_spilled(self, now: Optional[float] = None) -> int:
+        """Supprime les paniers débordés expirés ; retourne le nombre de fichiers supprimés."""
+        if not self.spill_dir:
+            return 0
+        now = now or time.time()
+        removed = 0
+        for name in os.listdir(self.spill_dir):
+            path = os.path.join(self.spill_dir, name)
+            if not name.endswith(".json"):
+                # Fichier temporaire d'une écriture interrompue
+                if name.endswith(".json.tmp") and os.path.getmtime(path) + self.ttl_s <= now:
+                    os.remove(path)
+                continue
+            # Sous le verrou : pas de course avec une relecture ou un débordement du même panier
+            with self._lock:
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        touched_at = json.load(f)["touched_at"]
+                except FileNotFoundError:
+                    continue
+                except (ValueError, KeyError):
+                    touched_at = os.path.getmtime(path)
+                if touched_at + self.ttl_s <= now:
+                    os.remove(path)
+                    self.stats["expired"] += 1
+                    removed += 1
+        return removed
+
+    def start(self, interval_s: float):
+        """Balaye le répertoire de débordement au démarrage puis toutes les `interval_s` secondes."""
+        if not self.spill_dir:
+            return
+        self._sweeper = threading.Thread(target=self._loop, args=(interval_s,), name="cart-spill", daemon=True)
+        self._sweeper.start()
+
+    def _loop(self, interval_s: float):
+        while True:
+            try:
+                self.sweep_spilled()
+            except Exception as e:
+                print(f"Erreur de purge des paniers débordés: {e}")
+            if self._stop.wait(interval_s):
+                break
+
+    def stop(self):
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
 
 
 class OrderRepository:
     def __init__(self):
         self._by_id: Dict[str, Order] = {}
         self._by_user: Dict[str, List[str]] = {}
+        # Index par statut : un dict par statut sert d'ensemble ordonné
+        # (ordre d'entrée dans le statut = ordre de la file de traitement)
+        self._by_status: Dict[OrderStatus, Dict[str, None]] = {s: {} for s in OrderStatus}
+        self._status_of: Dict[str, OrderStatus] = {}
+        self._lock = threading.Lock()
 
     def add(self, order: Order):
-        self._by_id[order.id] = order
-        self._by_user.setdefault(order.user_id, []).append(order.id)
+        with self._lock:
+            self._by_id[order.id] = order
+            self._by_user.setdefault(order.user_id, []).append(order.id)
+            self._by_status[order.status][order.id] = None
+            self._status_of[order.id] = order.status
 
     def get(self, order_id: str) -> Optional[Order]:
         return self._by_id.get(order_id)
@@ -259,20 +725,78 @@ class OrderRepository:
     def list_by_user(self, user_id: str) -> List[Order]:
         return [self._by_id[oid] for oid in self._by_user.get(user_id, [])]
 
-    def update(self, order: Order):
-        self._by_id[order.id] = order
+    def list_by_status(self, status: OrderStatus, limit: Optional[int] = None) -> List[Order]:
+        """Commandes d'un statut, la plus ancienne en premier (O(limit))."""
+        # Copie sous le verrou : les workers de paiement, le balayage des réservations
+        # et la facturation modifient l'index depuis d'autres threads
+        with self._lock:
+            ids = self._by_status[status]
+            if limit is not None:
+                ids = islice(ids, limit)
+            return [self._by_id[oid] for oid in ids]
+
+    def count_by_status(self, status: OrderStatus) -> int:
+        return len(self._by_status[status])
+
+    def compare_and_set(self, order: Order, expected_version: int, **changes) -> Order:
+        """
+        Applique `changes` seulement si la commande est toujours à `expected_version`
+        (sinon ConflictError) ; le statut et son index changent dans la même section critique.
+        """
+        with self._lock:
+            if order.version != expected_version:
+                raise ConflictError("Commande modifiée entre-temps, rechargez-la avant de réessayer.")
+            self._set(order, changes)
+            return order
+
+    def update(self, order: Order, **changes) -> Order:
+        """Modification sans condition de version (ex: retour arrière d'un remboursement échoué)."""
+        with self._lock:
+            self._by_id[order.id] = order
+            self._set(order, changes)
+            return order
+
+    def attach_invoice(self, order: Order, invoice_id: str):
+        """
+        Rattache la facture émise en différé. Ne change pas la version : la facture
+        ne modifie pas l'état que protège le compare-and-set, et un admin qui agit
+        avec la version renvoyée par le paiement ne doit pas recevoir de 409.
+        """
+        with self._lock:
+            order.invoice_id = invoice_id
+
+    def _set(self, order: Order, changes: Dict):
+        for k, v in changes.items():
+            setattr(order, k, v)
+        order.version += 1
+        self._reindex(order)
+
+    def _reindex(self, order: Order):
+        previous = self._status_of.get(order.id)
+        if previous == order.status:
+            return
+        if previous is not None:
+            self._by_status[previous].pop(order.id, None)
+        self._by_status[order.status][order.id] = None
+        self._status_of[order.id] = order.status
 
 
 class InvoiceRepository:
     def __init__(self):
         self._by_id: Dict[str, Invoice] = {}
+        self._by_month: Dict[str, List[str]] = {}  # "AAAA-MM" (UTC) -> ids
 
     def add(self, invoice: Invoice):
         self._by_id[invoice.id] = invoice
+        month = time.strftime("%Y-%m", time.gmtime(invoice.issued_at))
+        self._by_month.setdefault(month, []).append(invoice.id)
 
     def get(self, invoice_id: str) -> Optional[Invoice]:
         return self._by_id.get(invoice_id)
 
+    def list_by_month(self, year: int, month: int) -> List[Invoice]:
+        return [self._by_id[iid] for iid in self._by_month.get(f"{year:04d}-{month:02d}", [])]
+
 
 class PaymentRepository:
     def __init__(self):
@@ -286,17 +810,130 @@ class PaymentRepository:
 
 
 class ThreadRepository:
+    INBOX_STATES = ("unanswered", "answered")
+
     def __init__(self):
         self._by_id: Dict[str, MessageThread] = {}
+        # Boîte de réception du support : fils ouverts uniquement, un dict par état
+        # sert d'ensemble ordonné. Un fil entre en fin de "unanswered" au premier message
+        # client sans réponse et y garde sa place tant qu'il n'est pas répondu (les relances
+        # ne le font pas reculer) ; "answered" est trié par dernière réponse du support.
+        self._inbox: Dict[str, Dict[str, None]] = {state: {} for state in self.INBOX_STATES}
+        # Fils fermés encore en mémoire, par ordre de fermeture (candidats à l'archivage)
+        self._closed: Dict[str, None] = {}
+        # Fils archivés : résumé en mémoire, contenu chargé à la demande par `archive`
+        self._archived: Dict[str, ArchivedThread] = {}
+        self._archived_by_user: Dict[str, List[str]] = {}
+        self.archive = None  # stockage froid (archive.ThreadArchive), branché au démarrage
+        self._lock = threading.Lock()
 
     def add(self, thread: MessageThread):
-        self._by_id[thread.id] = thread
+        with self._lock:
+            self._by_id[thread.id] = thread
+            if thread.closed:
+                thread.closed_at = thread.closed_at or time.time()
+                self._closed[thread.id] = None
+            self._refile(thread)
 
     def get(self, thread_id: str) -> Optional[MessageThread]:
-        return self._by_id.get(thread_id)
+        thread = self._by_id.get(thread_id)
+        if thread is None and self.archive is not None:
+            summary = self._archived.get(thread_id)
+            if summary is not None:
+                thread = self.archive.load(summary)
+        return thread
 
     def list_by_user(self, user_id: str) -> List[MessageThread]:
-        return [t for t in self._by_id.values() if t.user_id == user_id]
+        threads = self.list_live_by_user(user_id)
+        if self.archive is not None:
+            threads += [self.archive.load(summary) for summary in self.list_archived_by_user(user_id)]
+        return threads
+
+    def list_live_by_user(self, user_id: str) -> List[MessageThread]:
+        """Fils de l'utilisateur encore en mémoire (sans relire l'archive)."""
+        return [t for t in list(self._by_id.values()) if t.user_id == user_id]
+
+    def list_archived_by_user(self, user_id: str) -> List[ArchivedThread]:
+        with self._lock:
+            return [self._archived[tid] for tid in self._archived_by_user.get(user_id, [])]
+
+    def list_all(self) -> List[MessageThread]:
+        """Fils en mémoire (ouverts ou fermés récemment), sans les fils archivés."""
+        return list(self._by_id.values())
+
+    def list_archived(self, offset: int = 0, limit: Optional[int] = None) -> List[ArchivedThread]:
+        """Résumés des fils archivés, par ordre d'archivage."""
+        stop = offset + limit if limit is not None else None
+        # Copie de la page sous le verrou : l'archivage périodique insère en parallèle
+        with self._lock:
+            return list(islice(self._archived.values(), offset, stop))
+
+    def clear_archived(self):
+        """Oublie tous les fils archivés (l'archive sur disque a été vidée)."""
+        with self._lock:
+            self._archived.clear()
+            self._archived_by_user.clear()
+
+    def count_archived(self) -> int:
+        return len(self._archived)
+
+    def is_archived(self, thread_id: str) -> bool:
+        return thread_id in self._archived
+
+    def closed_before(self, cutoff: float, limit: Optional[int] = None) -> List[MessageThread]:
+        """Fils fermés avant `cutoff`, le plus ancien en premier (s'arrête au premier plus récent)."""
+        threads = []
+        for tid in list(self._closed):
+            thread = self._by_id.get(tid)
+            if thread is None:
+                continue
+            if thread.closed_at >= cutoff or (limit is not None and len(threads) >= limit):
+                break
+            threads.append(thread)
+        return threads
+
+    def mark_archived(self, summaries: List[ArchivedThread]):
+        """Remplace les fils archivés par leur résumé : leurs messages quittent la mémoire."""
+        with self._lock:
+            for summary in summaries:
+                self._by_id.pop(summary.id, None)
+                self._closed.pop(summary.id, None)
+                self._archived[summary.id] = summary
+                self._archived_by_user.setdefault(summary.user_id, []).append(summary.id)
+
+    def append_message(self, thread: MessageThread, msg: "Message"):
+        """Ajoute un message et met à jour la boîte de réception dans la même section critique."""
+        with self._lock:
+            thread.add_message(msg)
+            self._refile(thread)
+
+    def set_closed(self, thread: MessageThread):
+        with self._lock:
+            thread.closed = True
+            thread.closed_at = time.time()
+            self._closed[thread.id] = None
+            self._refile(thread)
+
+    def list_inbox(self, state: str = "unanswered", offset: int = 0, limit: Optional[int] = None) -> List[MessageThread]:
+        """Fils ouverts d'un état, le plus ancien en premier (O(offset + limit))."""
+        ids = self._inbox[state]
+        stop = offset + limit if limit is not None else None
+        return [self._by_id[tid] for tid in islice(ids, offset, stop)]
+
+    def count_inbox(self, state: str) -> int:
+        return len(self._inbox[state])
+
+    def _refile(self, thread: MessageThread):
+        state = None
+        if not thread.closed and thread.messages:
+            state = "answered" if thread.is_answered() else "unanswered"
+        # Déjà en attente de réponse : la file reste ordonnée par premier message sans réponse
+        if state == "unanswered" and thread.id in self._inbox["unanswered"]:
+            return
+        for ids in self._inbox.values():
+            ids.pop(thread.id, None)
+        if state is not None:
+            self._inbox[state][thread.id] = None
 
 
 # =========================
@@ -362,37 +999,115 @@ class AuthService:
 
 
 class CatalogService:
-    def __init__(self, products: ProductRepository):
+    EDITABLE_FIELDS = {"name", "description", "price_cents", "stock_qty", "active", "image_url", "low_stock_threshold"}
+    # Champs recopiés dans les lignes de panier
+    SNAPSHOT_FIELDS = {"name", "price_cents", "active", "image_url"}
+
+    def __init__(self, products: ProductRepository, events: Optional[EventBus] = None):
         self.products = products
+        self.events = events or EventBus()
 
     def list_products(self) -> List[Product]:
         return self.products.list_active()
 
+    def add_product(self, product: Product) -> Product:
+        self.products.add(product)
+        self.events.publish(ProductChanged(product_id=product.id, fields=("*",)))
+        return product
+
+    def update_product(self, product_id: str, expected_version: Optional[int] = None, **fields) -> Product:
+        changes = {k: v for k, v in fields.items() if k in self.EDITABLE_FIELDS}
+        product, changed = self.products.update(product_id, changes, expected_version)
+        if self.SNAPSHOT_FIELDS.intersection(changed):
+            self.products.bump_catalog_version()
+        if changed:
+            self.events.publish(ProductChanged(product_id=product.id, fields=tuple(changed)))
+        return product
+
 
 class CartService:
     def __init__(self, carts: CartRepository, products: ProductRepository):
         self.carts = carts
         self.products = products
 
-    def add_to_cart(self, user_id: str, product_id: str, qty: int = 1):
+    def add_to_cart(self, user_id: str, product_id: str, qty: int = 1) -> Cart:
         product = self.products.get(product_id)
         if not product:
             raise ValueError("Produit introuvable.")
-        self.carts.get_or_create(user_id).add(product, qty)
-
-    def remove_from_cart(self, user_id: str, product_id: str, qty: int = 1):
-        self.carts.get_or_create(user_id).remove(product_id, qty)
+        cart = self.carts.get(user_id) or Cart(user_id=user_id)
+        cart.add(product, qty)
+        self.carts.put(cart)
+        return cart
+
+    def remove_from_cart(self, user_id: str, product_id: str, qty: int = 1) -> Cart:
+        cart = self.carts.get(user_id)
+        if cart is None:
+            return Cart(user_id=user_id)
+        cart.remove(product_id, qty)
+        if not cart.items:
+            self.carts.clear(user_id)
+        return cart
+
+    def apply_batch(self, user_id: str, operations: List[Tuple[str, str, int]], replace_cart: bool = False) -> Cart:
+        """
+        Applique une liste d'opérations (`add`, `remove`, `set`) de façon atomique :
+        elles sont appliquées sur une copie du panier, le stock est vérifié une fois
+        pour toutes les lignes modifiées, puis la copie remplace le panier.
+        `replace_cart` part d'un panier vide (restauration d'un panier sauvegardé).
+        """
+        current = self.carts.get(user_id)
+        cart = Cart(user_id=user_id) if replace_cart or current is None else current.copy()
+        touched: Dict[str, Product] = {}
+        for op, product_id, qty in operations:
+            if op == "remove":
+                cart.remove(product_id, qty)
+                continue
+            product = self.products.get(product_id)
+            if not product:
+                raise ValueError(f"Produit introuvable : {product_id}.")
+            if op == "add":
+                cart.add(product, qty, check_stock=False)
+            elif op == "set":
+                cart.set_quantity(product, qty, check_stock=False)
+            else:
+                raise ValueError(f"Opération inconnue : {op}.")
+            touched[product_id] = product
+        shortages = [
+            f"{p.name} (disponible : {p.stock_qty})"
+            for pid, p in touched.items()
+            if pid in cart.items and cart.items[pid].quantity > p.stock_qty
+        ]
+        if shortages:
+            raise ValueError("Stock insuffisant pour " + ", ".join(shortages) + ".")
+        cart.refresh(self.products)
+        self.carts.put(cart)
+        return cart
 
     def view_cart(self, user_id: str) -> Cart:
-        return self.carts.get_or_create(user_id)
+        """Panier de l'utilisateur ; un panier vide temporaire (non conservé) s'il n'en a pas."""
+        cart = self.carts.get(user_id)
+        if cart is None:
+            return Cart(user_id=user_id)
+        cart.refresh(self.products)
+        return cart
 
     def cart_total(self, user_id: str) -> int:
-        return self.carts.get_or_create(user_id).total_cents(self.products)
+        cart = self.carts.get(user_id)
+        return cart.total_cents(self.products) if cart else 0
 
 
 class PaymentGateway:
     """Simulation d'un prestataire CB (à remplacer par Stripe/Adyen/etc.)."""
-    def charge_card(self, card_number: str, exp_month: int, exp_year: int, cvc: str, amount_cents: int, idempotency_key: str) -> Dict:
+    def __init__(self, latency_s: float = 0.0):
+        # Latence simulée de l'appel au PSP (0 = réponse immédiate)
+        self.latency_s = latency_s
+
+    def charge_card(self, card_number: str, exp_month: int, exp_year: int, cvc: str, amount_cents: int, idempotency_key: str, timeout_s: Optional[float] = None) -> Dict:
+        if self.latency_s:
+            if timeout_s is not None and self.latency_s > timeout_s:
+                time.sleep(timeout_s)
+                raise TimeoutError("Délai de réponse du PSP dépassé.")
+            time.sleep(self.latency_s)
         # MOCK: succès si carte ne finit pas par '0000'
         ok = not card_number.endswith("0000")
         return {
@@ -409,8 +1124,9 @@ class PaymentGateway:
 
 
 class BillingService:
-    def __init__(self, invoices: InvoiceRepository):
+    def __init__(self, invoices: InvoiceRepository, users: Optional[UserRepository] = None):
         self.invoices = invoices
+        self.users = users
 
     def issue_invoice(self, order: Order) -> Invoice:
         lines = [
@@ -419,21 +1135,28 @@ class BillingService:
                 name=i.name,
                 unit_price_cents=i.unit_price_cents,
                 quantity=i.quantity,
-                line_total_cents=i.unit_price_cents * i.quantity
+                line_total_cents=i.line_total_cents
             )
             for i in order.items
         ]
+        user = self.users.get(order.user_id) if self.users else None
         inv = Invoice(
             id=str(uuid.uuid4()),
             order_id=order.id,
             user_id=order.user_id,
             lines=lines,
             total_cents=sum(l.line_total_cents for l in lines),
-            issued_at=time.time()
+            issued_at=time.time(),
+            customer_name=f"{user.first_name} {user.last_name}" if user else "",
+            customer_address=user.address if user else ""
         )
         self.invoices.add(inv)
         return inv
 
+    def issue_invoices(self, orders: List[Order]) -> List[Invoice]:
+        """Facturation par lot (utilisée par l'émission différée)."""
+        return [self.issue_invoice(order) for order in orders]
+
 
 class DeliveryService:
     def prepare_delivery(self, order: Order, address: str, carrier: str = "POSTE") -> Delivery:
@@ -457,6 +1180,123 @@ class DeliveryService:
         return delivery
 
 
+# Transitions autorisées : statut de départ -> {statut d'arrivée: effet sur le stock}
+#   "confirm_hold"  la réservation devient une sortie définitive (paiement)
+#   "release_hold"  la réservation est libérée (commande non payée annulée ou expirée)
+#   "release_stock" le stock sorti est restitué (commande payée annulée ou remboursée)
+ORDER_TRANSITIONS: Dict[OrderStatus, Dict[OrderStatus, Optional[str]]] = {
+    OrderStatus.CREE: {
+        OrderStatus.VALIDEE: None,
+        OrderStatus.PAYEE: "confirm_hold",
+        OrderStatus.ANNULEE: "release_hold",
+    },
+    OrderStatus.VALIDEE: {
+        OrderStatus.PAYEE: "confirm_hold",
+        OrderStatus.ANNULEE: "release_hold",
+    },
+    OrderStatus.PAYEE: {
+        OrderStatus.EXPEDIEE: None,
+        OrderStatus.ANNULEE: "release_stock",
+        OrderStatus.REMBOURSEE: "release_stock",
+    },
+    OrderStatus.EXPEDIEE: {
+        OrderStatus.LIVREE: None,
+    },
+    OrderStatus.LIVREE: {},
+    # Le stock d'une commande annulée a déjà été restitué à l'annulation
+    OrderStatus.ANNULEE: {
+        OrderStatus.REMBOURSEE: None,
+    },
+    OrderStatus.REMBOURSEE: {},
+}
+
+# Champ horodaté à l'entrée dans chaque statut
+STATUS_TIMESTAMPS: Dict[OrderStatus, str] = {
+    OrderStatus.VALIDEE: "validated_at",
+    OrderStatus.PAYEE: "paid_at",
+    OrderStatus.EXPEDIEE: "shipped_at",
+    OrderStatus.LIVREE: "delivered_at",
+    OrderStatus.ANNULEE: "cancelled_at",
+    OrderStatus.REMBOURSEE: "refunded_at",
+}
+
+
+@dataclass(frozen=True)
+class Transition:
+    source: OrderStatus
+    target: OrderStatus
+    timestamp_field: Optional[str]
+    stock_effect: Optional[str]
+
+
+TransitionHook = Callable[[Order, Transition, Dict], None]
+
+
+class OrderStateMachine:
+    """
+    Machine à états des commandes. La table est précalculée en un dict
+    (départ, arrivée) -> Transition : la vérification d'une transition est en O(1).
+
+    `enter` vérifie la transition et écrit le statut, son horodatage et les champs
+    associés par compare-and-set (l'index par statut est mis à jour dans la même
+    section critique) ; `complete` appelle les hooks de la transition (stock,
+    événements) et tient les compteurs. `apply` enchaîne les deux.
+    """
+    def __init__(self, orders: OrderRepository, table: Dict[OrderStatus, Dict[OrderStatus, Optional[str]]] = ORDER_TRANSITIONS):
+        self.orders = orders
+        self._transitions: Dict[Tuple[OrderStatus, OrderStatus], Transition] = {
+            (source, target): Transition(source, target, STATUS_TIMESTAMPS.get(target), effect)
+            for source, targets in table.items()
+            for target, effect in targets.items()
+        }
+        self._hooks: List[TransitionHook] = []
+        self._hooks_by_target: Dict[OrderStatus, List[TransitionHook]] = {s: [] for s in OrderStatus}
+        self._counts: Dict[Tuple[OrderStatus, OrderStatus], int] = {key: 0 for key in self._transitions}
+        self._lock = threading.Lock()
+
+    def on_transition(self, hook: TransitionHook):
+        self._hooks.append(hook)
+
+    def on(self, target: OrderStatus, hook: TransitionHook):
+        self._hooks_by_target[target].append(hook)
+
+    def can(self, source: OrderStatus, target: OrderStatus) -> bool:
+        return (source, target) in self._transitions
+
+    def enter(self, order: Order, version: int, target: OrderStatus, refusal: Optional[str] = None, **changes) -> Transition:
+        transition = self._transitions.get((order.status, target))
+        if transition is None:
+            raise ValueError(refusal or f"Transition {order.status.name} → {target.name} non autorisée.")
+        if transition.timestamp_field:
+            changes.setdefault(transition.timestamp_field, time.time())
+        self.orders.compare_and_set(order, version, status=target, **changes)
+        return transition
+
+    def complete(self, order: Order, transition: Transition, details: Optional[Dict] = None):
+        with self._lock:
+            self._counts[(transition.source, transition.target)] += 1
+        details = details or {}
+        for hook in self._hooks:
+            hook(order, transition, details)
+        for hook in self._hooks_by_target[transition.target]:
+            hook(order, transition, details)
+
+    def apply(self, order: Order, version: int, target: OrderStatus, details: Optional[Dict] = None, refusal: Optional[str] = None, **changes) -> Transition:
+        transition = self.enter(order, version, target, refusal, **changes)
+        self.complete(order, transition, details)
+        return transition
+
+    def revert(self, order: Order, transition: Transition, **changes):
+        """Annule une transition écrite dont l'effet externe a échoué ; ses hooks n'ont pas été appelés."""
+        if transition.timestamp_field:
+            changes.setdefault(transition.timestamp_field, None)
+        self.orders.update(order, status=transition.source, **changes)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {f"{source.name}->{target.name}": n for (source, target), n in self._counts.items()}
+
+
 class OrderService:
     def __init__(
         self,
@@ -468,7 +1308,9 @@ class OrderService:
         billing: BillingService,
         delivery_svc: DeliveryService,
         gateway: PaymentGateway,
-        users: UserRepository
+        users: UserRepository,
+        events: Optional[EventBus] = None,
+        hold_s: float = 30 * 60
     ):
         self.orders = orders
         self.products = products
@@ -479,51 +1321,185 @@ class OrderService:
         self.delivery_svc = delivery_svc
         self.gateway = gateway
         self.users = users
+        self.events = events or EventBus()
+        # Durée de réservation du stock d'une commande non payée
+        self.hold_s = hold_s
+        self._pinned_holds: Dict[str, int] = {}  # order_id -> paiements en cours
+        self._hold_lock = threading.Lock()
+        # Toutes les transitions de statut passent par la machine à états
+        self.states = OrderStateMachine(orders)
+        self._register_hooks()
+
+    # ----- RÉSERVATIONS DE STOCK -----
+
+    def pin_hold(self, order_id: str):
+        """Empêche l'expiration et l'annulation de la commande tant qu'un paiement est en cours."""
+        with self._hold_lock:
+            self._pinned_holds[order_id] = self._pinned_holds.get(order_id, 0) + 1
+
+    def unpin_hold(self, order_id: str):
+        with self._hold_lock:
+            if self._pinned_holds.get(order_id, 0) <= 1:
+                self._pinned_holds.pop(order_id, None)
+            else:
+                self._pinned_holds[order_id] -= 1
+
+    @contextmanager
+    def pinned_hold(self, order_id: str):
+        self.pin_hold(order_id)
+        try:
+            yield
+        finally:
+            self.unpin_hold(order_id)
+
+    # ----- CONCURRENCE -----
+
+    # Nombre de tentatives d'une transition face à des écritures concurrentes
+    MAX_ATTEMPTS = 3
+
+    def _transition(self, order_id: str, expected_version: Optional[int], apply: Callable[[Order, int], Order]) -> Order:
+        """
+        Relit la commande et appelle `apply(commande, version lue)`, qui vérifie le
+        statut puis écrit par compare-and-set. Sans version attendue du client, une
+        écriture concurrente provoque une nouvelle tentative (le statut est revérifié
+        sur l'état à jour) ; avec une version attendue, elle lève ConflictError.
+        """
+        for attempt in range(self.MAX_ATTEMPTS):
+            order = self.orders.get(order_id)
+            if not order:
+                raise ValueError("Commande introuvable.")
+            # La version est lue avant le statut : si l'un change, le compare-and-set échoue
+            version = order.version
+            if expected_version is not None and version != expected_version:
+                raise ConflictError("Commande modifiée entre-temps, rechargez-la avant de réessayer.")
+            try:
+                return apply(order, version)
+            except ConflictError:
+                if expected_version is not None or attempt == self.MAX_ATTEMPTS - 1:
+                    raise
+        raise ConflictError("Commande modifiée entre-temps, rechargez-la avant de réessayer.")
+
+    # ----- HOOKS DES TRANSITIONS -----
+
+    def _register_hooks(self):
+        self.states.on_transition(self._move_stock)
+        publish = self.events.publish
+        self.states.on(OrderStatus.VALIDEE, lambda o, t, d: publish(OrderValidated(order_id=o.id, user_id=o.user_id)))
+        # La facture est émise en différé par les abonnés à OrderPaid
+        self.states.on(OrderStatus.PAYEE, lambda o, t, d: publish(OrderPaid(
+            order_id=o.id, user_id=o.user_id, payment_id=o.payment_id, amount_cents=d["amount_cents"]
+        )))
+        self.states.on(OrderStatus.EXPEDIEE, lambda o, t, d: publish(OrderShipped(
+            order_id=o.id, user_id=o.user_id, tracking_number=o.delivery.tracking_number
+        )))
+        self.states.on(OrderStatus.LIVREE, lambda o, t, d: publish(OrderDelivered(order_id=o.id, user_id=o.user_id)))
+        self.states.on(OrderStatus.ANNULEE, lambda o, t, d: publish(OrderCancelled(
+            order_id=o.id, user_id=o.user_id, previous_status=t.source.name
+        )))
+        self.states.on(OrderStatus.REMBOURSEE, lambda o, t, d: publish(OrderRefunded(
+            order_id=o.id, user_id=o.user_id, amount_cents=o.refunded_cents
+        )))
+
+    def _move_stock(self, order: Order, transition: Transition, details: Dict):
+        effect = transition.stock_effect
+        if effect is None:
+            return
+        reason = details.get("reason", "annulation")
+        for it in order.items:
+            if effect == "confirm_hold":
+                self.products.confirm_hold(it.product_id, it.quantity, order.id)
+            elif effect == "release_hold":
+                self.products.release_hold(it.product_id, it.quantity, reason, order.id)
+            else:
+                self.products.release_stock(it.product_id, it.quantity, reason, order.id)
+
+    def expire_hold(self, order_id: str, now: Optional[float] = None) -> Tuple[bool, Optional[float]]:
+        """
+        Annule une commande non payée dont la réservation a expiré.
+        Retourne (annulée, prochaine échéance à revoir) : l'échéance est renseignée
+        si la réservation est encore valide ou qu'un paiement est en cours.
+        """
+        now = now or time.time()
+
+        def expire(order: Order, version: int) -> Tuple[bool, Optional[float]]:
+            if order.hold_expires_at is None or not self.states.can(order.status, OrderStatus.ANNULEE):
+                return False, None
+            if order.hold_expires_at > now:
+                return False, order.hold_expires_at
+            if order_id in self._pinned_holds:
+                return False, now + max(1.0, min(60.0, self.hold_s))
+            self.states.apply(order, version, OrderStatus.ANNULEE, {"reason": "expiration"}, hold_expires_at=None)
+            return True, None
+
+        with self._hold_lock:
+            if not self.orders.get(order_id):
+                return False, None
+            return self._transition(order_id, None, expire)
 
     # ----- FONCTIONS CLIENT -----
 
     def checkout(self, user_id: str, shipping_address: str = None) -> Order:
-        cart = self.carts.get_or_create(user_id)
-        if not cart.items:
+        cart = self.carts.get(user_id)
+        if not cart or not cart.items:
             raise ValueError("Panier vide.")
         # Réserver le stock
+        order_id = str(uuid.uuid4())
         order_items: List[OrderItem] = []
-        for it in cart.items.values():
-            p = self.products.get(it.product_id)
-            if not p or not p.active:
-                raise ValueError("Produit indisponible.")
-            if p.stock_qty < it.quantity:
-                raise ValueError(f"Stock insuffisant pour {p.name}.")
-            self.products.reserve_stock(p.id, it.quantity)
-            order_items.append(OrderItem(
-                product_id=p.id,
-                name=p.name,
-                unit_price_cents=p.price_cents,
-                quantity=it.quantity
-            ))
+        try:
+            for it in cart.items.values():
+                p = self.products.get(it.product_id)
+                if not p or not p.active:
+                    raise ValueError("Produit indisponible.")
+                if p.stock_qty < it.quantity:
+                    raise ValueError(f"Stock insuffisant pour {p.name}.")
+                try:
+                    self.products.hold_stock(p.id, it.quantity, order_id)
+                except ValueError:
+                    # Vendu entre la vérification et la réservation
+                    raise ValueError(f"Stock insuffisant pour {p.name}.")
+                order_items.append(OrderItem(
+                    product_id=p.id,
+                    name=p.name,
+                    unit_price_cents=p.price_cents,
+                    quantity=it.quantity
+                ))
+        except Exception:
+            # Aucune commande ne sera créée : le balayage des réservations ne libérerait jamais ces lignes
+            for item in order_items:
+                self.products.release_hold(item.product_id, item.quantity, "checkout_echoue", order_id)
+            raise
         order = Order(
-            id=str(uuid.uuid4()),
+            id=order_id,
             user_id=user_id,
             items=order_items,
             status=OrderStatus.CREE,
             created_at=time.time(),
             shipping_address=shipping_address
         )
+        order.hold_expires_at = order.created_at + self.hold_s
         self.orders.add(order)
         # vider le panier
         self.carts.clear(user_id)
+        self.events.publish(OrderCreated(order_id=order.id, user_id=user_id, total_cents=order.total_cents))
         return order
 
-    def pay_by_card(self, order_id: str, card_number: str, exp_month: int, exp_year: int, cvc: str) -> Payment:
+    def payable_order(self, order_id: str) -> Order:
         order = self.orders.get(order_id)
         if not order:
             raise ValueError("Commande introuvable.")
-        if order.status not in {OrderStatus.CREE, OrderStatus.VALIDEE}:
+        if not self.states.can(order.status, OrderStatus.PAYEE):
             raise ValueError("Statut de commande incompatible avec le paiement.")
-        amount = order.total_cents()
-        res = self.gateway.charge_card(
-            card_number, exp_month, exp_year, cvc, amount, idempotency_key=order.id
-        )
+        return order
+
+    def record_card_payment(self, order_id: str, amount: int, res: Dict) -> Payment:
+        """
+        Enregistre la réponse du PSP et, si le paiement est accepté, passe la commande à PAYEE.
+        Un débit accepté est toujours enregistré : si la commande n'est plus payable
+        (annulée, expirée, déjà payée), il est remboursé aussitôt.
+        """
+        order = self.orders.get(order_id)
+        if not order:
+            raise ValueError("Commande introuvable.")
         payment = Payment(
             id=str(uuid.uuid4()),
             order_id=order.id,
@@ -537,105 +1513,172 @@ class OrderService:
         self.payments.add(payment)
         if not payment.succeeded:
             raise ValueError("Paiement refusé.")
-        order.payment_id = payment.id
-        order.status = OrderStatus.PAYEE
-        order.paid_at = time.time()
-        # Facture
-        inv = self.billing.issue_invoice(order)
-        order.invoice_id = inv.id
-        self.orders.update(order)
+
+        def mark_paid(order: Order, version: int) -> Order:
+            self.states.apply(
+                order, version, OrderStatus.PAYEE, {"amount_cents": amount},
+                refusal="Statut de commande incompatible avec le paiement.",
+                payment_id=payment.id, hold_expires_at=None
+            )
+            return order
+
+        try:
+            self._transition(order_id, None, mark_paid)
+        except (ValueError, ConflictError):
+            self.gateway.refund(payment.provider_ref, amount)
+            payment.refunded_at = time.time()
+            raise ValueError("Commande plus payable : le débit a été remboursé.")
         return payment
 
+    def pay_by_card(self, order_id: str, card_number: str, exp_month: int, exp_year: int, cvc: str) -> Payment:
+        with self.pinned_hold(order_id):
+            # Vérifié une fois l'annulation bloquée par le paiement en cours
+            order = self.payable_order(order_id)
+            amount = order.total_cents
+            res = self.gateway.charge_card(
+                card_number, exp_month, exp_year, cvc, amount, idempotency_key=order.id
+            )
+            return self.record_card_payment(order.id, amount, res)
+
     def view_orders(self, user_id: str) -> List[Order]:
         return self.orders.list_by_user(user_id)
 
-    def request_cancellation(self, user_id: str, order_id: str) -> Order:
-        order = self.orders.get(order_id)
-        if not order or order.user_id != user_id:
-            raise ValueError("Commande introuvable.")
-        if order.status in {OrderStatus.EXPEDIEE, OrderStatus.LIVREE}:
-            raise ValueError("Trop tard pour annuler : commande expédiée.")
-        order.status = OrderStatus.ANNULEE
-        order.cancelled_at = time.time()
-        # restituer le stock
-        for it in order.items:
-            self.products.release_stock(it.product_id, it.quantity)
-        self.orders.update(order)
-        return order
+    def request_cancellation(self, user_id: str, order_id: str, expected_version: Optional[int] = None) -> Order:
+        def cancel(order: Order, version: int) -> Order:
+            if order.user_id != user_id:
+                raise ValueError("Commande introuvable.")
+            if order.status in {OrderStatus.EXPEDIEE, OrderStatus.LIVREE}:
+                raise ValueError("Trop tard pour annuler : commande expédiée.")
+            self.states.apply(
+                order, version, OrderStatus.ANNULEE, {"reason": "annulation"},
+                refusal="Commande déjà annulée ou remboursée.", hold_expires_at=None
+            )
+            return order
+
+        with self._hold_lock:
+            # Un débit en cours aboutirait sur une commande annulée
+            if order_id in self._pinned_holds:
+                raise ConflictError("Paiement en cours, réessayez dans quelques instants.")
+            return self._transition(order_id, expected_version, cancel)
 
     # ----- FONCTIONS ADMIN -----
 
-    def backoffice_validate_order(self, admin_user_id: str, order_id: str) -> Order:
+    def _require_admin(self, admin_user_id: str):
         admin = self.users.get(admin_user_id)
         if not admin or not admin.is_admin:
             raise PermissionError("Droits insuffisants.")
-        order = self.orders.get(order_id)
-        if not order or order.status != OrderStatus.CREE:
-            raise ValueError("Commande introuvable ou mauvais statut.")
-        order.status = OrderStatus.VALIDEE
-        order.validated_at = time.time()
-        self.orders.update(order)
-        return order
 
-    def backoffice_ship_order(self, admin_user_id: str, order_id: str) -> Order:
-        admin = self.users.get(admin_user_id)
-        if not admin or not admin.is_admin:
-            raise PermissionError("Droits insuffisants.")
-        order = self.orders.get(order_id)
-        if not order or order.status != OrderStatus.PAYEE:
-            raise ValueError("La commande doit être payée pour être expédiée.")
-        delivery = self.delivery_svc.prepare_delivery(order, address=self.users.get(order.user_id).address)
-        delivery = self.delivery_svc.ship(delivery)
-        order.delivery = delivery
-        order.status = OrderStatus.EXPEDIEE
-        order.shipped_at = time.time()
-        self.orders.update(order)
-        return order
-
-    def backoffice_mark_delivered(self, admin_user_id: str, order_id: str) -> Order:
-        admin = self.users.get(admin_user_id)
-        if not admin or not admin.is_admin:
-            raise PermissionError("Droits insuffisants.")
-        order = self.orders.get(order_id)
-        if not order or order.status != OrderStatus.EXPEDIEE or not order.delivery:
-            raise ValueError("Commande non expédiée.")
-        self.delivery_svc.mark_delivered(order.delivery)
-        order.status = OrderStatus.LIVREE
-        order.delivered_at = time.time()
-        self.orders.update(order)
-        return order
+    def _validate(self, order_id: str, expected_version: Optional[int] = None) -> Order:
+        def validate(order: Order, version: int) -> Order:
+            self.states.apply(order, version, OrderStatus.VALIDEE, refusal="Commande introuvable ou mauvais statut.")
+            return order
+
+        return self._transition(order_id, expected_version, validate)
+
+    def _ship(self, order_id: str, expected_version: Optional[int] = None) -> Order:
+        def ship(order: Order, version: int) -> Order:
+            if not self.states.can(order.status, OrderStatus.EXPEDIEE):
+                raise ValueError("La commande doit être payée pour être expédiée.")
+            customer = self.users.get(order.user_id)
+            if not customer:
+                raise ValueError("Client introuvable : adresse de livraison inconnue.")
+            delivery = self.delivery_svc.prepare_delivery(order, address=customer.address)
+            delivery = self.delivery_svc.ship(delivery)
+            self.states.apply(order, version, OrderStatus.EXPEDIEE, delivery=delivery)
+            return order
+
+        return self._transition(order_id, expected_version, ship)
+
+    def _mark_delivered(self, order_id: str, expected_version: Optional[int] = None) -> Order:
+        def deliver(order: Order, version: int) -> Order:
+            if not self.states.can(order.status, OrderStatus.LIVREE) or not order.delivery:
+                raise ValueError("Commande non expédiée.")
+            delivery = self.delivery_svc.mark_delivered(replace(order.delivery))
+            self.states.apply(order, version, OrderStatus.LIVREE, delivery=delivery)
+            return order
+
+        return self._transition(order_id, expected_version, deliver)
+
+    def backoffice_validate_order(self, admin_user_id: str, order_id: str, expected_version: Optional[int] = None) -> Order:
+        self._require_admin(admin_user_id)
+        return self._validate(order_id, expected_version)
+
+    def backoffice_ship_order(self, admin_user_id: str, order_id: str, expected_version: Optional[int] = None) -> Order:
+        self._require_admin(admin_user_id)
+        return self._ship(order_id, expected_version)
+
+    def backoffice_mark_delivered(self, admin_user_id: str, order_id: str, expected_version: Optional[int] = None) -> Order:
+        self._require_admin(admin_user_id)
+        return self._mark_delivered(order_id, expected_version)
+
+    def backoffice_bulk(self, admin_user_id: str, action: str, order_ids: List[str]) -> List[BulkResult]:
+        """
+        Applique une même transition (validate / ship / deliver) à une liste de commandes.
+        Les droits sont vérifiés une seule fois ; un échec n'interrompt pas le lot.
+        """
+        self._require_admin(admin_user_id)
+        transitions = {
+            "validate": self._validate,
+            "ship": self._ship,
+            "deliver": self._mark_delivered,
+        }
+        if action not in transitions:
+            raise ValueError("Action groupée inconnue.")
+        apply = transitions[action]
+        results: List[BulkResult] = []
+        for order_id in order_ids:
+            try:
+                order = apply(order_id)
+                results.append(BulkResult(order_id=order_id, succeeded=True, status=order.status))
+            except (ValueError, ConflictError) as e:
+                results.append(BulkResult(order_id=order_id, succeeded=False, error=str(e)))
+            except Exception as e:
+                # Erreur inattendue sur une commande : le reste du lot continue, l'erreur est rapportée
+                results.append(BulkResult(order_id=order_id, succeeded=False, error=f"Erreur interne : {type(e).__name__}: {e}"))
+        return results
+
+    def backoffice_refund(self, admin_user_id: str, order_id: str, amount_cents: Optional[int] = None, expected_version: Optional[int] = None) -> Order:
+        self._require_admin(admin_user_id)
+
+        def claim(order: Order, version: int) -> Tuple[Order, Transition, Payment]:
+            if not self.states.can(order.status, OrderStatus.REMBOURSEE):
+                raise ValueError("Remboursement non autorisé au statut actuel.")
+            payment = self.payments.get(order.payment_id) if order.payment_id else None
+            if not payment or not payment.provider_ref:
+                raise ValueError("Aucun paiement initial.")
+            refundable = order.total_cents - (order.refunded_cents or 0)
+            if amount_cents is not None and not 0 < amount_cents <= refundable:
+                raise ValueError(f"Montant de remboursement invalide (entre 1 et {refundable} centimes).")
+            # Le statut est pris avant l'appel au PSP : un second remboursement concurrent échoue ici
+            transition = self.states.enter(
+                order, version, OrderStatus.REMBOURSEE,
+                refunded_cents=amount_cents if amount_cents is not None else refundable
+            )
+            return order, transition, payment
 
-    def backoffice_refund(self, admin_user_id: str, order_id: str, amount_cents: Optional[int] = None) -> Order:
-        admin = self.users.get(admin_user_id)
-        if not admin or not admin.is_admin:
-            raise PermissionError("Droits insuffisants.")
-        order = self.orders.get(order_id)
-        if not order or order.status not in {OrderStatus.PAYEE, OrderStatus.ANNULEE}:
-            raise ValueError("Remboursement non autorisé au statut actuel.")
-        amount = amount_cents or order.total_cents()
+        order, transition, payment = self._transition(order_id, expected_version, claim)
         # remboursement via le PSP mock
-        payment = self.payments.get(order.payment_id) if order.payment_id else None
-        if not payment or not payment.provider_ref:
-            raise ValueError("Aucun paiement initial.")
-        self.gateway.refund(payment.provider_ref, amount)
-        order.status = OrderStatus.REMBOURSEE
-        order.refunded_at = time.time()
-        # restituer le stock si besoin
-        for it in order.items:
-            self.products.release_stock(it.product_id, it.quantity)
-        self.orders.update(order)
+        try:
+            self.gateway.refund(payment.provider_ref, order.refunded_cents)
+        except Exception:
+            self.states.revert(order, transition, refunded_cents=None)
+            raise
+        # Stock restitué (sauf s'il l'a déjà été à l'annulation) et événement, via les hooks
+        self.states.complete(order, transition, {"reason": "remboursement"})
         return order
 
 
 class CustomerService:
     """Service client: fils de discussion & messages côté UI + réponses agents."""
-    def __init__(self, threads: ThreadRepository, users: UserRepository):
+    def __init__(self, threads: ThreadRepository, users: UserRepository, events: Optional[EventBus] = None):
         self.threads = threads
         self.users = users
+        self.events = events or EventBus()
 
     def open_thread(self, user_id: str, subject: str, order_id: Optional[str] = None) -> MessageThread:
         th = MessageThread(id=str(uuid.uuid4()), user_id=user_id, order_id=order_id, subject=subject)
         self.threads.add(th)
+        self.events.publish(ThreadOpened(thread_id=th.id, user_id=user_id, order_id=order_id))
         return th
 
     def post_message(self, thread_id: str, author_user_id: Optional[str], body: str) -> Message:
@@ -645,7 +1688,13 @@ class CustomerService:
         if author_user_id is not None and not self.users.get(author_user_id):
             raise ValueError("Auteur inconnu.")
         msg = Message(id=str(uuid.uuid4()), thread_id=thread_id, author_user_id=author_user_id, body=body, created_at=time.time())
-        th.messages.append(msg)
+        self.threads.append_message(th, msg)
+        self.events.publish(MessagePosted(
+            thread_id=th.id,
+            message_id=msg.id,
+            thread_user_id=th.user_id,
+            author_user_id=author_user_id
+        ))
         return msg
 
     def close_thread(self, thread_id: str, admin_user_id: str):
@@ -655,7 +1704,7 @@ class CustomerService:
         th = self.threads.get(thread_id)
         if not th:
             raise ValueError("Fil introuvable.")
-        th.closed = True
+        self.threads.set_closed(th)
         return th
 
 
@@ -677,7 +1726,7 @@ if __name__ == "__main__":
     auth = AuthService(users, sessions)
     catalog = CatalogService(products)
     cart_svc = CartService(carts, products)
-    billing = BillingService(invoices)
+    billing = BillingService(invoices, users)
     delivery_svc = DeliveryService()
     gateway = PaymentGateway()
     order_svc = OrderService(orders, products, carts, payments, invoices, billing, delivery_svc, gateway, users)
@@ -706,7 +1755,7 @@ if __name__ == "__main__":
 
     # Création de la commande
     order = order_svc.checkout(user_id)
-    print("Commande créée:", order.id, "Total €:", order.total_cents()/100)
+    print("Commande créée:", order.id, "Total €:", order.total_cents/100)
 
     # Validation par l'admin
     order = order_svc.backoffice_validate_order(admin.id, order.id)
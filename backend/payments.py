@@ -0,0 +1,268 @@
+"""
+Pipeline de paiement asynchrone.
+Les paiements CB sont mis en file puis traités par un pool de workers borné,
+avec délai maximal, nouvelles tentatives et déduplication par clé d'idempotence.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, Optional
+import os
+import random
+import threading
+import time
+import uuid
+
+from idempotency import IdempotencyKeyReused, IdempotencyStore
+from models import OrderService, PaymentGateway
+
+
+class PaymentJobStatus(Enum):
+    EN_ATTENTE = "EN_ATTENTE"
+    EN_COURS = "EN_COURS"
+    REUSSI = "REUSSI"
+    REFUSE = "REFUSE"
+    ECHEC = "ECHEC"
+
+
+@dataclass
+class PaymentJob:
+    id: str
+    order_id: str
+    user_id: str
+    idempotency_key: str
+    amount_cents: int
+    status: PaymentJobStatus
+    created_at: float
+    attempts: int = 0
+    payment_id: Optional[str] = None
+    error: Optional[str] = None
+    finished_at: Optional[float] = None
+
+
+class PaymentQueueFull(Exception):
+    """La file de paiements est pleine : le client doit réessayer plus tard."""
+
+
+class PaymentRateLimited(ConnectionError):
+    """Le PSP a rejeté l'appel (quota dépassé) : erreur transitoire, à retenter."""
+
+
+class SimulatedPaymentGateway(PaymentGateway):
+    """
+    PSP simulé pour les tests de charge.
+
+    - `latency` : "fixed" (latency_s), "normal" (latency_s ± jitter_s)
+      ou "longtail" (log-normale de médiane latency_s, dispersion `tail_sigma`) ;
+    - `error_rate` : part d'appels en erreur transitoire (ConnectionError) ;
+    - `decline_rate` : part de cartes refusées, en plus des cartes finissant par 0000 ;
+    - `hang_rate` : part d'appels qui ne répondent jamais : ils bloquent jusqu'au
+      `timeout_s` de l'appelant, ou `hang_s` sans timeout, puis lèvent TimeoutError ;
+    - `rate_limit_per_s` / `burst` : seau à jetons, au-delà PaymentRateLimited.
+    """
+    def __init__(
+        self,
+        latency: str = "fixed",
+        latency_s: float = 0.0,
+        jitter_s: float = 0.0,
+        tail_sigma: float = 1.0,
+        error_rate: float = 0.0,
+        decline_rate: float = 0.0,
+        hang_rate: float = 0.0,
+        hang_s: float = 60.0,
+        rate_limit_per_s: Optional[float] = None,
+        burst: int = 10,
+        seed: Optional[int] = None
+    ):
+        if latency not in {"fixed", "normal", "longtail"}:
+            raise ValueError(f"Profil de latence inconnu : {latency}")
+        super().__init__(latency_s=latency_s)
+        self.latency = latency
+        self.jitter_s = jitter_s
+        self.tail_sigma = tail_sigma
+        self.error_rate = error_rate
+        self.decline_rate = decline_rate
+        self.hang_rate = hang_rate
+        self.hang_s = hang_s
+        self.rate_limit_per_s = rate_limit_per_s
+        self.burst = burst
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"calls": 0, "errors": 0, "timeouts": 0, "rate_limited": 0, "declined": 0}
+
+    @classmethod
+    def from_env(cls) -> "SimulatedPaymentGateway":
+        """Configuration via variables d'environnement PSP_* (voir README)."""
+        rate = os.getenv("PSP_RATE_LIMIT_PER_S")
+        return cls(
+            latency=os.getenv("PSP_LATENCY", "fixed"),
+            latency_s=float(os.getenv("PSP_LATENCY_S", "0")),
+            jitter_s=float(os.getenv("PSP_JITTER_S", "0")),
+            tail_sigma=float(os.getenv("PSP_TAIL_SIGMA", "1")),
+            error_rate=float(os.getenv("PSP_ERROR_RATE", "0")),
+            decline_rate=float(os.getenv("PSP_DECLINE_RATE", "0")),
+            hang_rate=float(os.getenv("PSP_HANG_RATE", "0")),
+            hang_s=float(os.getenv("PSP_HANG_S", "60")),
+            rate_limit_per_s=float(rate) if rate else None,
+            burst=int(os.getenv("PSP_BURST", "10"))
+        )
+
+    def _sample_latency(self) -> float:
+        if self._random.random() < self.hang_rate:
+            return float("inf")
+        if self.latency == "normal":
+            return max(0.0, self._random.gauss(self.latency_s, self.jitter_s))
+        if self.latency == "longtail":
+            return self.latency_s * self._random.lognormvariate(0.0, self.tail_sigma)
+        return self.latency_s
+
+    def _take_token(self) -> bool:
+        if self.rate_limit_per_s is None:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_limit_per_s)
+        self._refilled_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def charge_card(self, card_number: str, exp_month: int, exp_year: int, cvc: str, amount_cents: int, idempotency_key: str, timeout_s: Optional[float] = None) -> Dict:
+        with self._lock:
+            self.stats["calls"] += 1
+            if not self._take_token():
+                self.stats["rate_limited"] += 1
+                raise PaymentRateLimited("Trop de requêtes vers le PSP.")
+            latency = self._sample_latency()
+            failed = self._random.random() < self.error_rate
+            declined = self._random.random() < self.decline_rate
+        if timeout_s is not None and latency > timeout_s:
+            time.sleep(timeout_s)
+            with self._lock:
+                self.stats["timeouts"] += 1
+            raise TimeoutError("Délai de réponse du PSP dépassé.")
+        if latency == float("inf"):
+            # Sans timeout côté appelant, l'appel reste bloqué jusqu'au délai de la connexion
+            time.sleep(self.hang_s)
+            with self._lock:
+                self.stats["timeouts"] += 1
+            raise TimeoutError("Le PSP ne répond pas.")
+        time.sleep(latency)
+        if failed:
+            with self._lock:
+                self.stats["errors"] += 1
+            raise ConnectionError("PSP indisponible.")
+        if declined or card_number.endswith("0000"):
+            with self._lock:
+                self.stats["declined"] += 1
+            return {"success": False, "transaction_id": None, "failure_reason": "CARTE_REFUSEE"}
+        return {"success": True, "transaction_id": str(uuid.uuid4()), "failure_reason": None}
+
+
+class PaymentPipeline:
+    """
+    Traite les paiements CB hors de la requête HTTP.
+
+    - `max_pending` borne le nombre de paiements en file ou en cours ;
+    - chaque appel au PSP est limité à `timeout_s` et retenté jusqu'à
+      `max_retries` fois sur erreur transitoire (timeout, connexion) ;
+    - les retentatives d'un même job réutilisent sa clé d'idempotence côté PSP ;
+    - une clé d'idempotence déjà vue renvoie le job existant au lieu d'en créer un.
+    """
+    def __init__(
+        self,
+        order_service: OrderService,
+        max_workers: int = 4,
+        max_pending: int = 100,
+        timeout_s: float = 10.0,
+        max_retries: int = 2,
+        backoff_s: float = 0.5,
+        store: Optional[IdempotencyStore] = None
+    ):
+        self.order_service = order_service
+        self.timeout_s = timeout_s
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.store = store or IdempotencyStore()
+        self._jobs = IdempotencyStore(max_entries=self.store.max_entries, ttl_s=self.store.ttl_s)
+        self._inflight_by_order: Dict[str, PaymentJob] = {}
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="payment")
+
+    def submit(self, user_id: str, order_id: str, card_number: str, exp_month: int, exp_year: int, cvc: str, idempotency_key: Optional[str] = None) -> PaymentJob:
+        """Met un paiement en file et retourne immédiatement le job (ou le job existant)."""
+        client_key = idempotency_key is not None
+        key = f"{user_id}:{idempotency_key if client_key else order_id}"
+        with self._lock:
+            existing = self.store.get(key)
+            if existing is not None and existing.order_id != order_id:
+                raise IdempotencyKeyReused("Clé d'idempotence déjà utilisée pour une autre commande.")
+            existing = existing or self._inflight_by_order.get(order_id)
+            if existing is not None:
+                return existing
+            order = self.order_service.payable_order(order_id)
+            if not self._slots.acquire(blocking=False):
+                raise PaymentQueueFull("File de paiement pleine, réessayez plus tard.")
+            job = PaymentJob(
+                id=str(uuid.uuid4()),
+                order_id=order.id,
+                user_id=user_id,
+                idempotency_key=key,
+                amount_cents=order.total_cents,
+                status=PaymentJobStatus.EN_ATTENTE,
+                created_at=time.time()
+            )
+            self.store.put(key, job)
+            self._jobs.put(job.id, job)
+            self._inflight_by_order[order.id] = job
+            # La réservation du stock ne doit pas expirer tant que le job n'est pas terminé
+            self.order_service.pin_hold(order.id)
+        # Les données carte ne sont conservées que dans la closure du worker
+        self._executor.submit(self._run, job, client_key, card_number, exp_month, exp_year, cvc)
+        return job
+
+    def get(self, job_id: str) -> Optional[PaymentJob]:
+        return self._jobs.get(job_id)
+
+    def _run(self, job: PaymentJob, client_key: bool, card_number: str, exp_month: int, exp_year: int, cvc: str):
+        job.status = PaymentJobStatus.EN_COURS
+        try:
+            # La commande a pu être annulée pendant l'attente dans la file
+            self.order_service.payable_order(job.order_id)
+            res = None
+            while res is None:
+                job.attempts += 1
+                try:
+                    res = self.order_service.gateway.charge_card(
+                        card_number, exp_month, exp_year, cvc, job.amount_cents,
+                        idempotency_key=job.id, timeout_s=self.timeout_s
+                    )
+                except (TimeoutError, ConnectionError):
+                    if job.attempts > self.max_retries:
+                        raise
+                    time.sleep(self.backoff_s * 2 ** (job.attempts - 1))
+            payment = self.order_service.record_card_payment(job.order_id, job.amount_cents, res)
+            job.payment_id = payment.id
+            job.status = PaymentJobStatus.REUSSI
+        except ValueError as e:
+            job.error = str(e)
+            job.status = PaymentJobStatus.REFUSE
+        except Exception as e:
+            job.error = str(e) or type(e).__name__
+            job.status = PaymentJobStatus.ECHEC
+        finally:
+            job.finished_at = time.time()
+            self.order_service.unpin_hold(job.order_id)
+            with self._lock:
+                self._inflight_by_order.pop(job.order_id, None)
+                # Sans clé explicite du client, un échec ne doit pas bloquer une nouvelle tentative
+                if job.status != PaymentJobStatus.REUSSI and not client_key:
+                    self.store.discard(job.idempotency_key)
+            self._slots.release()
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
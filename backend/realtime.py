@@ -0,0 +1,81 @@
+"""
+Diffusion temps réel des nouveaux messages du support (Server-Sent Events).
+Chaque message posté est sérialisé une seule fois puis poussé à tous les
+clients connectés au fil, au lieu d'être relu par polling.
+"""
+
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import threading
+
+from events import EventBus, MessagePosted
+from models import Message, MessageThread, ThreadRepository
+
+
+class ThreadListener:
+    """Connexion SSE ouverte sur un fil : une file bornée dans la boucle asyncio du client."""
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_queue: int = 100):
+        self.loop = loop
+        self.queue: "asyncio.Queue[Tuple[str, str]]" = asyncio.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def offer(self, item: Tuple[str, str]):
+        # Exécuté dans la boucle du client (call_soon_threadsafe)
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Client trop lent : on coupe, il reprendra via Last-Event-ID
+            self.overflowed = True
+
+
+class ThreadBroadcaster:
+    """
+    Abonné à MessagePosted : pousse `(message_id, données)` aux écouteurs du fil.
+    `serialize` transforme un Message en charge utile (JSON) une seule fois par message.
+    """
+    def __init__(self, threads: ThreadRepository, serialize: Callable[[Message], str]):
+        self.threads = threads
+        self.serialize = serialize
+        self._listeners: Dict[str, Set[ThreadListener]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe_to(self, events: EventBus):
+        events.subscribe(MessagePosted, self._on_message_posted, name="support-sse")
+
+    def listen(self, thread_id: str) -> ThreadListener:
+        listener = ThreadListener(asyncio.get_running_loop())
+        with self._lock:
+            self._listeners.setdefault(thread_id, set()).add(listener)
+        return listener
+
+    def unlisten(self, thread_id: str, listener: ThreadListener):
+        with self._lock:
+            listeners = self._listeners.get(thread_id)
+            if listeners is not None:
+                listeners.discard(listener)
+                if not listeners:
+                    del self._listeners[thread_id]
+
+    def backlog(self, thread: MessageThread, last_seen_id: Optional[str]) -> List[Tuple[str, str]]:
+        """Messages postés après `last_seen_id` (tous si l'id est inconnu, aucun sans id)."""
+        if not last_seen_id:
+            return []
+        pos = thread.position_of(last_seen_id)
+        start = pos + 1 if pos is not None else 0
+        return [(m.id, self.serialize(m)) for m in thread.messages[start:]]
+
+    def _on_message_posted(self, event: MessagePosted):
+        with self._lock:
+            listeners = list(self._listeners.get(event.thread_id, ()))
+        if not listeners:
+            return
+        thread = self.threads.get(event.thread_id)
+        if not thread:
+            return
+        pos = thread.position_of(event.message_id)
+        if pos is None:
+            return
+        msg = thread.messages[pos]
+        item = (msg.id, self.serialize(msg))
+        for listener in listeners:
+            listener.loop.call_soon_threadsafe(listener.offer, item)
@@ -3,8 +3,8 @@ Router pour l'administration du site e-commerce.
 Endpoints réservés aux administrateurs: gestion des commandes, produits, statistiques.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Query, Header, Response
+from fastapi.responses import FileResponse, StreamingResponse
 
 # Import depuis le module parent
 import sys
@@ -16,9 +16,23 @@ from schemas import (
     RefundOrderRequest, UpdateStockRequest, CreateProductRequest,
     UpdateProductRequest, OrderResponse, ProductResponse,
     AdminStatsResponse, OrderListResponse,
-    ThreadListResponse, ThreadResponse, PostMessageRequest
+    ThreadListResponse, ThreadResponse, PostMessageRequest,
+    OrderStatusEnum, BulkOrderActionRequest, BulkOrderActionResponse,
+    ThreadSummaryListResponse, ThreadSummaryResponse, SupportInboxResponse,
+    SupportSearchResponse, SupportSearchHitResponse, ArchivedThreadListResponse,
+    StockHoldsResponse, StockHoldProductResponse,
+    StockMovementListResponse, StockMovementResponse, StockBalanceResponse,
+    LowStockResponse, UpdateLowStockThresholdRequest,
+    SalesAnalyticsResponse, SalesPointResponse, ProductSalesResponse
 )
-from models import Product, OrderStatus
+from analytics import DAY, current_hour_end
+from models import ConflictError, Product, OrderStatus
+from itertools import islice
+from pydantic import TypeAdapter, ValidationError
+from typing import Literal, Optional
+import asyncio
+import csv
+import io
 import uuid
 
 
@@ -43,11 +57,14 @@ async def validate_order(
     try:
         order = context.order_service.backoffice_validate_order(
             admin_user_id=admin_id,
-            order_id=request.order_id
+            order_id=request.order_id,
+            expected_version=request.version
         )
         return OrderResponse.from_order(order, context.products_repo)
     except PermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -69,11 +86,14 @@ async def ship_order(
     try:
         order = context.order_service.backoffice_ship_order(
             admin_user_id=admin_id,
-            order_id=request.order_id
+            order_id=request.order_id,
+            expected_version=request.version
         )
         return OrderResponse.from_order(order, context.products_repo)
     except PermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -94,43 +114,89 @@ async def mark_delivered(
     try:
         order = context.order_service.backoffice_mark_delivered(
             admin_user_id=admin_id,
-            order_id=request.order_id
+            order_id=request.order_id,
+            expected_version=request.version
         )
         return OrderResponse.from_order(order, context.products_repo)
     except PermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/orders/refund", response_model=OrderResponse)
-async def refund_order(
-    request: RefundOrderRequest,
+@router.post("/orders/bulk/{action}", response_model=BulkOrderActionResponse)
+async def bulk_order_action(
+    action: Literal["validate", "ship", "deliver"],
+    request: BulkOrderActionRequest,
     admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
     context=Depends(__import__('dependencies').get_context)
 ):
     """
-    Rembourse une commande.
+    Valide, expédie ou marque comme livrées plusieurs commandes en un seul appel.
 
-    Le stock est restitué et le montant remboursé au client.
+    Les droits sont vérifiés une fois pour tout le lot. Chaque commande est traitée
+    indépendamment : la réponse indique pour chacune le succès ou l'erreur,
+    sans renvoyer le détail complet des commandes.
     """
     try:
-        order = context.order_service.backoffice_refund(
+        results = context.order_service.backoffice_bulk(
             admin_user_id=admin_id,
-            order_id=request.order_id,
-            amount_cents=request.amount_cents
+            action=action,
+            order_ids=request.order_ids
         )
-        return OrderResponse.from_order(order, context.products_repo)
+        return BulkOrderActionResponse.from_results(action, results)
     except PermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/orders/refund", response_model=OrderResponse)
+async def refund_order(
+    request: RefundOrderRequest,
+    response: Response,
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """
+    Rembourse une commande.
+
+    Le stock est restitué et le montant remboursé au client.
+    Une requête répétée avec la même clé `Idempotency-Key` renvoie le résultat
+    du premier remboursement sans rembourser une seconde fois.
+    """
+    async def refund():
+        try:
+            order = context.order_service.backoffice_refund(
+                admin_user_id=admin_id,
+                order_id=request.order_id,
+                amount_cents=request.amount_cents,
+                expected_version=request.version
+            )
+            return OrderResponse.from_order(order, context.products_repo)
+        except PermissionError as e:
+            raise HTTPException(status_code=403, detail=str(e))
+        except ConflictError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return await __import__('dependencies').run_idempotent(
+        context, "refund", admin_id, idempotency_key, request.model_dump_json(), response, refund
+    )
+
+
 @router.get("/orders", response_model=OrderListResponse)
 async def get_all_orders(
     admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
@@ -145,10 +211,30 @@ async def get_all_orders(
         # Récupérer toutes les commandes
         all_orders = list(context.orders_repo._by_id.values())
 
-        order_responses = [
-            OrderResponse.from_order(order, context.products_repo)
-            for order in all_orders
-        ]
+        order_responses = OrderResponse.from_orders(all_orders, context.products_repo)
+
+        return OrderListResponse(orders=order_responses)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/orders/queue/{status}", response_model=OrderListResponse)
+async def get_orders_queue(
+    status: OrderStatusEnum,
+    limit: int = Query(50, ge=1, le=500),
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    File de travail du back-office : les `limit` commandes les plus anciennes
+    dans un statut donné (CREE à valider, PAYEE à expédier, EXPEDIEE à livrer...).
+
+    S'appuie sur l'index par statut du repository : pas de parcours de toutes les commandes.
+    """
+    try:
+        queue = context.orders_repo.list_by_status(OrderStatus[status.value], limit)
+
+        order_responses = OrderResponse.from_orders(queue, context.products_repo)
 
         return OrderListResponse(orders=order_responses)
     except Exception as e:
@@ -206,7 +292,7 @@ async def create_product(
             active=True,
             image_url=image_url
         )
-        context.products_repo.add(product)
+        context.catalog_service.add_product(product)
 
         return ProductResponse.from_product(product)
     except HTTPException:
@@ -233,24 +319,32 @@ async def update_product(
             raise HTTPException(status_code=404, detail="Produit introuvable")
 
         # Mise à jour des champs fournis
-        if request.name is not None:
-            product.name = request.name
-        if request.description is not None:
-            product.description = request.description
-        if request.price_cents is not None:
-            product.price_cents = request.price_cents
-        if request.stock_qty is not None:
-            product.stock_qty = request.stock_qty
-        if request.active is not None:
-            product.active = request.active
+        changes = request.model_dump(exclude={"product_id", "version"}, exclude_none=True)
+        product = context.catalog_service.update_product(product.id, request.version, **changes)
 
         return ProductResponse.from_product(product)
     except HTTPException:
         raise
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Même validation que le champ `version: Optional[int]` des requêtes typées ("3" est accepté)
+_version_field = TypeAdapter(Optional[int])
+
+
+def _body_version(request: dict) -> Optional[int]:
+    """Version lue dans un corps non typé ; ValueError (400) si ce n'est pas un entier."""
+    try:
+        return _version_field.validate_python(request.get('version'))
+    except ValidationError:
+        raise ValueError("version doit être un entier.")
+
+
 @router.put("/products/{product_id}", response_model=ProductResponse)
 async def update_product_by_id(
     product_id: str,
@@ -264,43 +358,52 @@ async def update_product_by_id(
     Accepte les formats: price/price_cents et stock/stock_qty.
     """
     try:
+        version = _body_version(request)
+
         product = context.products_repo.get(product_id)
 
         if not product:
             raise HTTPException(status_code=404, detail="Produit introuvable")
 
         # Mise à jour des champs fournis
+        changes = {}
         if 'name' in request and request['name'] is not None:
-            product.name = request['name']
+            changes['name'] = request['name']
         if 'description' in request and request['description'] is not None:
-            product.description = request['description']
+            changes['description'] = request['description']
 
         # Accepter 'price' (en euros) ou 'price_cents'
         if 'price' in request:
             if request['price'] is not None:
-                product.price_cents = int(float(request['price']) * 100)
+                changes['price_cents'] = int(float(request['price']) * 100)
         elif 'price_cents' in request:
             if request['price_cents'] is not None:
-                product.price_cents = int(request['price_cents'])
+                changes['price_cents'] = int(request['price_cents'])
 
         # Accepter 'stock' ou 'stock_qty'
         if 'stock' in request:
             if request['stock'] is not None:
-                product.stock_qty = int(request['stock'])
+                changes['stock_qty'] = int(request['stock'])
         elif 'stock_qty' in request:
             if request['stock_qty'] is not None:
-                product.stock_qty = int(request['stock_qty'])
+                changes['stock_qty'] = int(request['stock_qty'])
 
         if 'active' in request and request['active'] is not None:
-            product.active = request['active']
+            changes['active'] = request['active']
 
         # Gérer image_url
         if 'image_url' in request:
-            product.image_url = request['image_url']
+            changes['image_url'] = request['image_url']
+
+        product = context.catalog_service.update_product(product.id, version, **changes)
 
         return ProductResponse.from_product(product)
     except HTTPException:
         raise
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -322,11 +425,15 @@ async def update_stock(
         if not product:
             raise HTTPException(status_code=404, detail="Produit introuvable")
 
-        product.stock_qty = request.stock_qty
+        product = context.catalog_service.update_product(product.id, request.version, stock_qty=request.stock_qty)
 
         return ProductResponse.from_product(product)
     except HTTPException:
         raise
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -357,11 +464,15 @@ async def update_stock_by_id(
         else:
             raise HTTPException(status_code=400, detail="Le champ 'stock' ou 'stock_qty' est requis")
 
-        product.stock_qty = int(stock_qty)
+        product = context.catalog_service.update_product(product.id, _body_version(request), stock_qty=int(stock_qty))
 
         return ProductResponse.from_product(product)
     except HTTPException:
         raise
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -387,6 +498,188 @@ async def get_all_products(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/stock/holds", response_model=StockHoldsResponse)
+async def get_stock_holds(
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Réservations de stock des commandes non payées : quantités disponibles,
+    réservées et physiques par produit, et prochaine expiration.
+
+    Réservé aux administrateurs.
+    """
+    try:
+        products = [
+            StockHoldProductResponse(
+                product_id=p.id,
+                name=p.name,
+                available_qty=p.stock_qty,
+                reserved_qty=p.reserved_qty,
+                on_hand_qty=p.stock_qty + p.reserved_qty
+            )
+            for p in context.products_repo._by_id.values()
+            if p.reserved_qty
+        ]
+
+        return StockHoldsResponse(
+            hold_s=context.order_service.hold_s,
+            products=products,
+            **context.stock_hold_sweeper.stats()
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/low-stock", response_model=LowStockResponse)
+async def get_low_stock(
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Produits actifs dont le stock disponible est sous leur seuil, du plus critique au moins critique.
+
+    Réservé aux administrateurs.
+    """
+    try:
+        repo = context.products_repo
+        return LowStockResponse(
+            count=repo.count_low_stock(),
+            products=[ProductResponse.from_product(p) for p in repo.list_low_stock(limit)]
+        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.put("/products/{product_id}/low-stock-threshold", response_model=ProductResponse)
+async def update_low_stock_threshold(
+    product_id: str,
+    request: UpdateLowStockThresholdRequest,
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Modifie le seuil de stock faible d'un produit.
+
+    Réservé aux administrateurs.
+    """
+    try:
+        if not context.products_repo.get(product_id):
+            raise HTTPException(status_code=404, detail="Produit introuvable")
+        product = context.catalog_service.update_product(product_id, low_stock_threshold=request.threshold)
+        return ProductResponse.from_product(product)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/inventory/reconciliation")
+async def get_inventory_reconciliation(
+    since: Optional[float] = Query(None, description="Début de période (timestamp)"),
+    until: Optional[float] = Query(None, description="Fin de période (timestamp)"),
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Rapport de rapprochement du stock au format CSV, envoyé en flux produit par produit :
+    solde d'ouverture, entrées, sorties, solde de clôture et écart avec le stock actuel.
+
+    Réservé aux administrateurs.
+    """
+    try:
+        repo = context.products_repo
+        rows = repo.ledger.reconcile(list(repo._by_id.values()), since, until)
+
+        def stream():
+            buffer = io.StringIO()
+            writer = None
+            for row in rows:
+                if writer is None:
+                    writer = csv.DictWriter(buffer, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        return StreamingResponse(
+            stream(),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=rapprochement-stock.csv"}
+        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/inventory/{product_id}/movements", response_model=StockMovementListResponse)
+async def get_stock_movements(
+    product_id: str,
+    since: Optional[float] = Query(None, description="Début de période (timestamp)"),
+    until: Optional[float] = Query(None, description="Fin de période (timestamp)"),
+    limit: int = Query(100, ge=1, le=1000),
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Historique des mouvements de stock d'un produit (réservations, paiements,
+    annulations, remboursements, ajustements), du plus ancien au plus récent.
+
+    Réservé aux administrateurs.
+    """
+    try:
+        if not context.products_repo.get(product_id):
+            raise HTTPException(status_code=404, detail="Produit introuvable")
+        page = list(islice(context.products_repo.ledger.movements(product_id, since, until), limit + 1))
+        return StockMovementListResponse(
+            product_id=product_id,
+            movements=[StockMovementResponse.from_movement(m) for m in page[:limit]],
+            has_more=len(page) > limit
+        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/inventory/{product_id}/balance", response_model=StockBalanceResponse)
+async def get_stock_balance(
+    product_id: str,
+    at: Optional[float] = Query(None, description="Date (timestamp) ; maintenant par défaut"),
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Stock disponible et réservé d'un produit à une date donnée.
+
+    Réservé aux administrateurs.
+    """
+    try:
+        if not context.products_repo.get(product_id):
+            raise HTTPException(status_code=404, detail="Produit introuvable")
+        available, reserved = context.products_repo.ledger.balance_at(product_id, at)
+        return StockBalanceResponse(product_id=product_id, at=at, available_qty=available, reserved_qty=reserved)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # =========================
 # ===== SUPPORT CLIENT (ADMIN) =====
 # =========================
@@ -402,10 +695,11 @@ async def get_all_threads(
     Réservé aux administrateurs.
     """
     try:
-        all_threads = list(context.threads_repo._by_id.values())
+        all_threads = context.threads_repo.list_all()
 
+        names = {}
         thread_responses = [
-            ThreadResponse.from_thread(thread, context.users_repo)
+            ThreadResponse.from_thread(thread, context.users_repo, names)
             for thread in all_threads
         ]
 
@@ -414,6 +708,158 @@ async def get_all_threads(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/support/threads/summary", response_model=ThreadSummaryListResponse)
+async def get_all_thread_summaries(
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Boîte de réception résumée : un résumé par fil (sujet, aperçu du dernier
+    message, messages client non répondus), en O(nombre de fils).
+
+    Réservé aux administrateurs.
+    """
+    try:
+        return ThreadSummaryListResponse(threads=[
+            ThreadSummaryResponse.from_thread(thread, for_support=True)
+            for thread in context.threads_repo.list_all()
+        ])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/support/inbox", response_model=SupportInboxResponse)
+async def get_support_inbox(
+    state: Literal["unanswered", "answered"] = "unanswered",
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    File de travail du support : fils ouverts en attente de réponse
+    (`unanswered`, par date du premier message client sans réponse, le plus ancien en premier)
+    ou déjà répondus (`answered`).
+
+    S'appuie sur l'index de la boîte de réception : les fils fermés ne sont jamais parcourus.
+
+    Réservé aux administrateurs.
+    """
+    try:
+        repo = context.threads_repo
+        threads = repo.list_inbox(state, offset, limit)
+        total = repo.count_inbox(state)
+
+        return SupportInboxResponse(
+            state=state,
+            threads=[ThreadSummaryResponse.from_thread(thread, for_support=True) for thread in threads],
+            offset=offset,
+            limit=limit,
+            total=total,
+            has_more=offset + len(threads) < total,
+            unanswered_count=repo.count_inbox("unanswered"),
+            answered_count=repo.count_inbox("answered")
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/support/search", response_model=SupportSearchResponse)
+async def search_support(
+    q: str = Query(..., min_length=1, max_length=200),
+    user_id: Optional[str] = None,
+    order_id: Optional[str] = None,
+    status: Optional[Literal["open", "closed"]] = None,
+    limit: int = Query(20, ge=1, le=100),
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Recherche plein texte dans les sujets et messages du support.
+
+    - mots : tous requis (`remboursement taille`)
+    - expression exacte : `"pas reçu"`
+    - préfixe : `livr*`
+
+    Filtres optionnels par client, commande et statut (ouvert / fermé).
+    Les accents et la casse sont ignorés.
+
+    Réservé aux administrateurs.
+    """
+    try:
+        hits = context.support_search.search(
+            q,
+            user_id=user_id,
+            order_id=order_id,
+            closed=None if status is None else status == "closed",
+            limit=limit
+        )
+
+        names = {}
+        results = []
+        for hit in hits:
+            thread = context.threads_repo.get(hit.thread_id)
+            if thread:
+                results.append(SupportSearchHitResponse.from_hit(hit, thread, context.users_repo, names))
+
+        return SupportSearchResponse(query=q, results=results)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/support/archive", response_model=ArchivedThreadListResponse)
+async def get_archived_threads(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Fils archivés sur disque (résumés gardés en mémoire). Le détail d'un fil
+    archivé reste accessible via `/support/threads/{id}`, chargé à la demande.
+
+    Réservé aux administrateurs.
+    """
+    try:
+        repo = context.threads_repo
+        summaries = repo.list_archived(offset, limit)
+        total = repo.count_archived()
+
+        return ArchivedThreadListResponse(
+            threads=[ThreadSummaryResponse.from_archived(summary) for summary in summaries],
+            offset=offset,
+            total=total,
+            has_more=offset + len(summaries) < total
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/support/archive/run")
+async def run_support_archive(
+    older_than_s: Optional[float] = Query(None, ge=0),
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Lance immédiatement l'archivage des fils fermés depuis plus de `older_than_s`
+    secondes (par défaut, le seuil configuré du balayage périodique).
+
+    Réservé aux administrateurs.
+    """
+    try:
+        if older_than_s is None:
+            older_than_s = context.support_archive_after_s
+        loop = asyncio.get_running_loop()
+        archived = await loop.run_in_executor(None, context.thread_archive.archive_closed, older_than_s)
+
+        return {"archived": archived, **context.thread_archive.stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/support/threads/{thread_id}/reply", response_model=ThreadResponse)
 async def reply_to_thread(
     thread_id: str,
@@ -474,6 +920,37 @@ async def close_thread(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# =========================
+# ===== BUS D'ÉVÉNEMENTS =====
+# =========================
+
+@router.get("/events/metrics")
+async def get_event_metrics(
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Métriques du bus d'événements : événements publiés par type et, pour chaque
+    abonné, file en attente, événements abandonnés, erreurs et retard (lag).
+    """
+    try:
+        return context.event_bus.metrics()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/orders/transitions")
+async def get_order_transitions(
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """Nombre de transitions de statut effectuées depuis le démarrage, par couple départ -> arrivée."""
+    try:
+        return context.order_service.states.stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # =========================
 # ===== STATISTIQUES =====
 # =========================
@@ -495,35 +972,30 @@ async def get_stats(
     - Produits en stock faible
     """
     try:
-        all_orders = list(context.orders_repo._by_id.values())
         all_users = list(context.users_repo._by_id.values())
-        all_products = list(context.products_repo._by_id.values())
+        completed = [OrderStatus.PAYEE, OrderStatus.EXPEDIEE, OrderStatus.LIVREE]
 
-        # Revenu total (uniquement commandes payées ou livrées)
+        # Revenu total (uniquement commandes payées ou livrées), depuis les totaux stockés
         total_revenue_cents = sum(
-            order.total_cents()
-            for order in all_orders
-            if order.status in {OrderStatus.PAYEE, OrderStatus.EXPEDIEE, OrderStatus.LIVREE}
+            order.total_cents
+            for status in completed
+            for order in context.orders_repo.list_by_status(status)
         )
 
-        # Répartition par statut
-        orders_by_status = {}
-        for status in OrderStatus:
-            count = sum(1 for order in all_orders if order.status == status)
-            orders_by_status[status.name] = count
+        # Répartition par statut, lue dans l'index par statut
+        orders_by_status = {
+            status.name: context.orders_repo.count_by_status(status)
+            for status in OrderStatus
+        }
 
-        # Produits en stock faible (< 10 unités)
+        # Produits en stock faible (sous leur seuil), lus dans l'index trié par marge
         low_stock_products = [
             ProductResponse.from_product(product)
-            for product in all_products
-            if product.active and product.stock_qty < 10
+            for product in context.products_repo.list_low_stock()
         ]
 
         # Compter uniquement les commandes payées, expédiées ou livrées pour le total
-        completed_orders = sum(
-            1 for order in all_orders
-            if order.status in {OrderStatus.PAYEE, OrderStatus.EXPEDIEE, OrderStatus.LIVREE}
-        )
+        completed_orders = sum(orders_by_status[status.name] for status in completed)
 
         return AdminStatsResponse(
             total_orders=completed_orders,
@@ -536,13 +1008,102 @@ async def get_stats(
             shipped_orders=orders_by_status.get('EXPEDIEE', 0),
             delivered_orders=orders_by_status.get('LIVREE', 0),
             total_users=len(all_users),
-            total_products=len(all_products),
+            total_products=len(context.products_repo._by_id),
             low_stock_products=low_stock_products
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/analytics/sales", response_model=SalesAnalyticsResponse)
+async def get_sales_analytics(
+    since: Optional[float] = Query(None, description="Début (timestamp), 30 jours avant `until` par défaut"),
+    until: Optional[float] = Query(None, description="Fin (timestamp), fin de l'heure en cours par défaut"),
+    granularity: Literal["hour", "day", "week"] = Query("day"),
+    top: int = Query(10, ge=0, le=100),
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Ventes nettes (paiements moins annulations et remboursements) sur une période.
+
+    Les totaux combinent les seaux pré-agrégés semaine / jour / heure couvrant la
+    période ; la série donne un point par seau de la granularité demandée.
+    """
+    try:
+        if until is None:
+            until = current_hour_end()
+        if since is None:
+            since = until - 30 * DAY
+        if since >= until:
+            raise ValueError("La période est vide.")
+
+        rollups = context.sales_rollups
+        totals = rollups.totals(since, until)
+        series = [SalesPointResponse.from_totals(start, t) for start, t in rollups.series(since, until, granularity)]
+
+        best = sorted(totals.products.items(), key=lambda kv: kv[1][1], reverse=True)[:top]
+        top_products = []
+        for product_id, (units, revenue_cents) in best:
+            product = context.products_repo.get(product_id)
+            top_products.append(ProductSalesResponse(
+                product_id=product_id,
+                name=product.name if product else None,
+                units=units,
+                revenue_cents=revenue_cents,
+                revenue_euros=revenue_cents / 100.0
+            ))
+
+        return SalesAnalyticsResponse(
+            since=since,
+            until=until,
+            granularity=granularity,
+            revenue_cents=totals.revenue_cents,
+            revenue_euros=totals.revenue_cents / 100.0,
+            orders=totals.orders,
+            units=totals.units,
+            series=series,
+            top_products=top_products
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# =========================
+# ===== FACTURES =====
+# =========================
+
+@router.get("/invoices/export")
+async def export_invoices(
+    year: int = Query(..., ge=2000, le=9999),
+    month: int = Query(..., ge=1, le=12),
+    format: Literal["pdf", "html"] = "pdf",
+    admin_id: str = Depends(__import__('dependencies').get_current_admin_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Export mensuel : archive zip de toutes les factures émises dans le mois (UTC).
+
+    Les factures sont rendues en parallèle dans le pool de processus ;
+    celles déjà en cache ne sont pas recalculées.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        archive = await loop.run_in_executor(
+            None, context.invoice_renderer.export_month, year, month, format
+        )
+
+        return FileResponse(
+            archive,
+            media_type="application/zip",
+            filename=os.path.basename(archive)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # =========================
 # ===== UPLOAD D'IMAGES =====
 # =========================
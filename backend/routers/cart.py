@@ -1,6 +1,6 @@
 """
 Router pour la gestion du panier d'achat.
-Endpoints: ajout au panier, retrait du panier, consultation du panier.
+Endpoints: ajout au panier, retrait du panier, modifications par lot, consultation du panier.
 """
 
 from fastapi import APIRouter, Depends, HTTPException
@@ -11,8 +11,8 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from schemas import (
-    AddToCartRequest, RemoveFromCartRequest,
-    CartResponse, CartItemResponse, SimpleMessageResponse
+    AddToCartRequest, RemoveFromCartRequest, CartBatchRequest,
+    CartResponse, SimpleMessageResponse
 )
 
 
@@ -35,30 +35,8 @@ async def get_cart(
     """
     try:
         cart = context.cart_service.view_cart(user_id)
-        total_cents = context.cart_service.cart_total(user_id)
-
-        # Conversion des items du panier
-        items = []
-        for cart_item in cart.items.values():
-            product = context.products_repo.get(cart_item.product_id)
-
-            if product and product.active:
-                items.append(CartItemResponse(
-                    product_id=product.id,
-                    product_name=product.name,
-                    unit_price_cents=product.price_cents,
-                    unit_price_euros=product.price_cents / 100.0,
-                    quantity=cart_item.quantity,
-                    line_total_cents=product.price_cents * cart_item.quantity,
-                    line_total_euros=(product.price_cents * cart_item.quantity) / 100.0,
-                    image_url=getattr(product, 'image_url', None)
-                ))
-
-        return CartResponse(
-            items=items,
-            total_cents=total_cents,
-            total_euros=total_cents / 100.0
-        )
+
+        return CartResponse.from_cart(cart, context.products_repo)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -83,14 +61,52 @@ async def add_to_cart(
         Le panier mis à jour
     """
     try:
-        context.cart_service.add_to_cart(
+        cart = context.cart_service.add_to_cart(
             user_id=user_id,
             product_id=request.product_id,
             qty=request.quantity
         )
 
         # Retourne le panier mis à jour
-        return await get_cart(user_id, context)
+        return CartResponse.from_cart(cart, context.products_repo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# =========================
+# ===== MODIFICATIONS PAR LOT =====
+# =========================
+
+@router.post("/batch", response_model=CartResponse)
+async def apply_cart_batch(
+    request: CartBatchRequest,
+    user_id: str = Depends(__import__('dependencies').get_current_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Applique plusieurs opérations au panier en une requête, de façon atomique.
+
+    Args:
+        request: Liste d'opérations `add` / `remove` / `set`, et `replace=true`
+                 pour remplacer tout le panier (restauration d'un panier sauvegardé)
+
+    Returns:
+        Le panier mis à jour
+
+    Raises:
+        400: Si un produit est introuvable ou inactif, ou si le stock est insuffisant
+             pour une ou plusieurs lignes (aucune opération n'est alors appliquée)
+    """
+    try:
+        cart = context.cart_service.apply_batch(
+            user_id,
+            [(o.op, o.product_id, o.quantity) for o in request.operations],
+            replace_cart=request.replace
+        )
+
+        return CartResponse.from_cart(cart, context.products_repo)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -118,14 +134,14 @@ async def remove_from_cart(
         Le panier mis à jour
     """
     try:
-        context.cart_service.remove_from_cart(
+        cart = context.cart_service.remove_from_cart(
             user_id=user_id,
             product_id=request.product_id,
             qty=request.quantity
         )
 
         # Retourne le panier mis à jour
-        return await get_cart(user_id, context)
+        return CartResponse.from_cart(cart, context.products_repo)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -150,14 +166,14 @@ async def remove_product_by_id(
         Le panier mis à jour
     """
     try:
-        context.cart_service.remove_from_cart(
+        cart = context.cart_service.remove_from_cart(
             user_id=user_id,
             product_id=product_id,
             qty=0  # 0 = retrait complet
         )
 
         # Retourne le panier mis à jour
-        return await get_cart(user_id, context)
+        return CartResponse.from_cart(cart, context.products_repo)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
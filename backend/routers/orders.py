@@ -3,7 +3,10 @@ Router pour la gestion des commandes.
 Endpoints: checkout, paiement, liste des commandes, annulation.
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
+from fastapi.responses import FileResponse
+from typing import Literal, Optional
+import asyncio
 
 # Import depuis le module parent
 import sys
@@ -12,8 +15,13 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from schemas import (
     CheckoutRequest, PaymentRequest, OrderResponse,
-    OrderListResponse, PaymentResponse, CancelOrderRequest
+    OrderListResponse, PaymentResponse, CancelOrderRequest,
+    PaymentJobResponse
 )
+from models import ConflictError
+from payments import PaymentQueueFull
+from idempotency import IdempotencyKeyReused
+from invoicing import FORMATS as INVOICE_FORMATS
 
 
 router = APIRouter()
@@ -26,8 +34,10 @@ router = APIRouter()
 @router.post("/checkout", response_model=OrderResponse, status_code=201)
 async def checkout(
     request: CheckoutRequest,
+    response: Response,
     user_id: str = Depends(__import__('dependencies').get_current_user_id),
-    context=Depends(__import__('dependencies').get_context)
+    context=Depends(__import__('dependencies').get_context),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Crée une commande à partir du panier de l'utilisateur.
@@ -35,14 +45,21 @@ async def checkout(
     Le panier est vidé après la création de la commande.
     Le stock est réservé pour les produits commandés.
     La commande est créée avec le statut CREE.
+    Une requête répétée avec la même clé `Idempotency-Key` renvoie la commande
+    déjà créée au lieu d'en créer une seconde.
     """
-    try:
-        order = context.order_service.checkout(user_id, request.shipping_address)
-        return OrderResponse.from_order(order, context.products_repo)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async def create():
+        try:
+            order = context.order_service.checkout(user_id, request.shipping_address)
+            return OrderResponse.from_order(order, context.products_repo)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return await __import__('dependencies').run_idempotent(
+        context, "checkout", user_id, idempotency_key, request.model_dump_json(), response, create
+    )
 
 
 # =========================
@@ -52,8 +69,10 @@ async def checkout(
 @router.post("/pay", response_model=PaymentResponse)
 async def pay_order(
     request: PaymentRequest,
+    response: Response,
     user_id: str = Depends(__import__('dependencies').get_current_user_id),
-    context=Depends(__import__('dependencies').get_context)
+    context=Depends(__import__('dependencies').get_context),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Effectue le paiement d'une commande par carte bancaire.
@@ -62,14 +81,79 @@ async def pay_order(
         request: Contient l'ID de la commande et les informations de paiement
 
     Returns:
-        Les détails du paiement effectué
+        Les détails du paiement effectué (le paiement d'origine pour une
+        requête répétée avec la même clé `Idempotency-Key`)
 
     Raises:
         400: Si le paiement est refusé ou si la commande n'est pas éligible
         404: Si la commande n'existe pas
+        422: Si la clé `Idempotency-Key` a déjà servi pour une autre requête
+    """
+    async def pay():
+        try:
+            # Vérifier que la commande appartient à l'utilisateur
+            order = context.orders_repo.get(request.order_id)
+
+            if not order:
+                raise HTTPException(status_code=404, detail="Commande introuvable")
+
+            if order.user_id != user_id:
+                raise HTTPException(status_code=403, detail="Accès non autorisé à cette commande")
+
+            # Effectuer le paiement : l'appel au PSP est bloquant, il part dans le pool de threads
+            loop = asyncio.get_running_loop()
+            payment = await loop.run_in_executor(
+                None, context.order_service.pay_by_card,
+                request.order_id, request.card_number, request.exp_month, request.exp_year, request.cvc
+            )
+
+            return PaymentResponse(
+                payment_id=payment.id,
+                order_id=payment.order_id,
+                amount_cents=payment.amount_cents,
+                amount_euros=payment.amount_cents / 100.0,
+                succeeded=payment.succeeded
+            )
+        except ConflictError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    # Les données carte n'entrent pas dans l'empreinte de la requête
+    return await __import__('dependencies').run_idempotent(
+        context, "pay", user_id, idempotency_key,
+        request.model_dump_json(exclude={"card_number", "exp_month", "exp_year", "cvc"}), response, pay
+    )
+
+
+# =========================
+# ===== PAIEMENT ASYNCHRONE =====
+# =========================
+
+@router.post("/pay/async", response_model=PaymentJobResponse, status_code=202)
+async def pay_order_async(
+    request: PaymentRequest,
+    user_id: str = Depends(__import__('dependencies').get_current_user_id),
+    context=Depends(__import__('dependencies').get_context),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """
+    Met le paiement d'une commande en file et répond immédiatement.
+
+    Le débit est effectué par un worker ; l'état se consulte via
+    `GET /api/orders/payments/{job_id}`. Une même clé `Idempotency-Key`
+    (ou, à défaut, la même commande) renvoie le job déjà créé.
+
+    Raises:
+        400: Si la commande n'est pas éligible au paiement
+        422: Si la clé `Idempotency-Key` a déjà servi pour une autre commande
+        503: Si la file de paiement est pleine
     """
     try:
-        # Vérifier que la commande appartient à l'utilisateur
         order = context.orders_repo.get(request.order_id)
 
         if not order:
@@ -78,22 +162,21 @@ async def pay_order(
         if order.user_id != user_id:
             raise HTTPException(status_code=403, detail="Accès non autorisé à cette commande")
 
-        # Effectuer le paiement
-        payment = context.order_service.pay_by_card(
+        job = context.payment_pipeline.submit(
+            user_id=user_id,
             order_id=request.order_id,
             card_number=request.card_number,
             exp_month=request.exp_month,
             exp_year=request.exp_year,
-            cvc=request.cvc
+            cvc=request.cvc,
+            idempotency_key=idempotency_key
         )
 
-        return PaymentResponse(
-            payment_id=payment.id,
-            order_id=payment.order_id,
-            amount_cents=payment.amount_cents,
-            amount_euros=payment.amount_cents / 100.0,
-            succeeded=payment.succeeded
-        )
+        return PaymentJobResponse.from_job(job)
+    except PaymentQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
@@ -102,6 +185,28 @@ async def pay_order(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/payments/{job_id}", response_model=PaymentJobResponse)
+async def get_payment_status(
+    job_id: str,
+    user_id: str = Depends(__import__('dependencies').get_current_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Consulte l'état d'un paiement asynchrone (polling).
+    """
+    try:
+        job = context.payment_pipeline.get(job_id)
+
+        if not job or job.user_id != user_id:
+            raise HTTPException(status_code=404, detail="Paiement introuvable")
+
+        return PaymentJobResponse.from_job(job)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # =========================
 # ===== VOIR MES COMMANDES =====
 # =========================
@@ -119,10 +224,7 @@ async def get_my_orders(
     try:
         orders = context.order_service.view_orders(user_id)
 
-        order_responses = [
-            OrderResponse.from_order(order, context.products_repo)
-            for order in orders
-        ]
+        order_responses = OrderResponse.from_orders(orders, context.products_repo)
 
         return OrderListResponse(orders=order_responses)
     except Exception as e:
@@ -173,6 +275,55 @@ async def get_order(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# =========================
+# ===== FACTURE D'UNE COMMANDE =====
+# =========================
+
+@router.get("/{order_id}/invoice")
+async def download_invoice(
+    order_id: str,
+    format: Literal["pdf", "html"] = "pdf",
+    user_id: str = Depends(__import__('dependencies').get_current_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Télécharge la facture d'une commande (PDF ou HTML).
+
+    Le document est rendu hors de la boucle de l'API puis servi depuis le cache disque.
+
+    Raises:
+        403: Si la commande n'appartient pas à l'utilisateur (sauf pour les admins)
+        404: Si la commande n'existe pas ou n'est pas encore facturée
+    """
+    try:
+        order = context.orders_repo.get(order_id)
+
+        if not order:
+            raise HTTPException(status_code=404, detail="Commande introuvable")
+
+        user = context.users_repo.get(user_id)
+        is_admin = user and user.is_admin
+
+        if order.user_id != user_id and not is_admin:
+            raise HTTPException(status_code=403, detail="Accès non autorisé à cette commande")
+
+        if not order.invoice_id:
+            raise HTTPException(status_code=404, detail="Facture pas encore disponible")
+
+        invoice = context.invoices_repo.get(order.invoice_id)
+        path = await asyncio.wrap_future(context.invoice_renderer.submit(invoice, format))
+
+        return FileResponse(
+            path,
+            media_type=INVOICE_FORMATS[format],
+            filename=f"facture-{invoice.id}.{format}"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # =========================
 # ===== ANNULER UNE COMMANDE =====
 # =========================
@@ -203,10 +354,13 @@ async def cancel_order(
     try:
         order = context.order_service.request_cancellation(
             user_id=user_id,
-            order_id=request.order_id
+            order_id=request.order_id,
+            expected_version=request.version
         )
 
         return OrderResponse.from_order(order, context.products_repo)
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -3,7 +3,10 @@ Router pour le support client.
 Endpoints: créer un fil de discussion, poster un message, voir les fils.
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import asyncio
 
 # Import depuis le module parent
 import sys
@@ -12,7 +15,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from schemas import (
     CreateThreadRequest, PostMessageRequest,
-    ThreadResponse, ThreadListResponse, MessageResponse
+    ThreadResponse, ThreadListResponse, MessageResponse,
+    ThreadSummaryListResponse, ThreadSummaryResponse, MessagePageResponse
 )
 
 
@@ -112,11 +116,12 @@ async def get_my_threads(
         threads = context.threads_repo.list_by_user(user_id)
         print(f"DEBUG: {len(threads)} thread(s) trouvé(s)")
 
+        names = {}
         thread_responses = []
         for i, thread in enumerate(threads):
             print(f"DEBUG: Conversion du thread {i+1}/{len(threads)}: id={thread.id}")
             try:
-                thread_response = ThreadResponse.from_thread(thread, context.users_repo)
+                thread_response = ThreadResponse.from_thread(thread, context.users_repo, names)
                 thread_responses.append(thread_response)
             except Exception as e:
                 print(f"DEBUG ERROR: Erreur lors de la conversion du thread {thread.id}: {e}")
@@ -133,6 +138,31 @@ async def get_my_threads(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/threads/summary", response_model=ThreadSummaryListResponse)
+async def get_my_thread_summaries(
+    user_id: str = Depends(__import__('dependencies').get_current_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Liste résumée des fils de l'utilisateur connecté : sujet, aperçu du dernier
+    message, nombre de messages et de réponses non lues, sans les messages.
+    Les fils archivés sont résumés depuis leur résumé en mémoire, sans lecture disque.
+    """
+    try:
+        threads = context.threads_repo.list_live_by_user(user_id)
+        archived = context.threads_repo.list_archived_by_user(user_id)
+
+        return ThreadSummaryListResponse(threads=[
+            ThreadSummaryResponse.from_thread(thread, for_support=False)
+            for thread in threads
+        ] + [
+            ThreadSummaryResponse.from_archived(summary)
+            for summary in archived
+        ])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # =========================
 # ===== DÉTAIL D'UN FIL =====
 # =========================
@@ -177,6 +207,131 @@ async def get_thread(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# =========================
+# ===== PAGINATION DES MESSAGES =====
+# =========================
+
+@router.get("/threads/{thread_id}/messages", response_model=MessagePageResponse)
+async def get_thread_messages(
+    thread_id: str,
+    since: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    user_id: str = Depends(__import__('dependencies').get_current_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Récupère une page de messages d'un fil.
+
+    - `since=<message_id>` : messages postés après ce message (récupération incrémentale)
+    - `before=<message_id>` : messages précédant ce message (remonter l'historique)
+    - sans curseur : les `limit` derniers messages
+
+    Raises:
+        400: Si le curseur est inconnu
+        403: Si le fil n'appartient pas à l'utilisateur (sauf pour les admins)
+        404: Si le fil n'existe pas
+    """
+    try:
+        thread = context.threads_repo.get(thread_id)
+
+        if not thread:
+            raise HTTPException(status_code=404, detail="Fil de discussion introuvable")
+
+        user = context.users_repo.get(user_id)
+        is_admin = user and user.is_admin
+
+        if thread.user_id != user_id and not is_admin:
+            raise HTTPException(status_code=403, detail="Accès non autorisé à ce fil")
+
+        messages, has_more = thread.page(since=since, before=before, limit=limit)
+        names = {}
+
+        return MessagePageResponse(
+            thread_id=thread.id,
+            messages=[MessageResponse.from_message(msg, context.users_repo, names) for msg in messages],
+            has_more=has_more
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# =========================
+# ===== FLUX TEMPS RÉEL (SSE) =====
+# =========================
+
+SSE_HEARTBEAT_S = 15
+
+
+@router.get("/threads/{thread_id}/stream")
+async def stream_thread(
+    thread_id: str,
+    request: Request,
+    last_event_id: Optional[str] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    user_id: str = Depends(__import__('dependencies').get_stream_user_id),
+    context=Depends(__import__('dependencies').get_context)
+):
+    """
+    Flux Server-Sent Events des nouveaux messages d'un fil.
+
+    Chaque événement `message` porte l'id du message et un MessageResponse en JSON.
+    Pour reprendre après une coupure, le client envoie le dernier id reçu
+    (en-tête `Last-Event-ID`, envoyé automatiquement par EventSource, ou
+    paramètre `last_event_id`) : les messages manqués sont renvoyés d'abord.
+
+    Raises:
+        403: Si le fil n'appartient pas à l'utilisateur (sauf pour les admins)
+        404: Si le fil n'existe pas
+    """
+    thread = context.threads_repo.get(thread_id)
+
+    if not thread:
+        raise HTTPException(status_code=404, detail="Fil de discussion introuvable")
+
+    user = context.users_repo.get(user_id)
+    is_admin = user and user.is_admin
+
+    if thread.user_id != user_id and not is_admin:
+        raise HTTPException(status_code=403, detail="Accès non autorisé à ce fil")
+
+    broadcaster = context.thread_broadcaster
+    # S'abonner avant de calculer le rattrapage : aucun message ne peut être perdu entre les deux
+    listener = broadcaster.listen(thread_id)
+    backlog = broadcaster.backlog(thread, last_event_id_header or last_event_id)
+
+    async def events():
+        sent = set()
+        try:
+            yield "retry: 3000\n\n"
+            for message_id, data in backlog:
+                sent.add(message_id)
+                yield f"id: {message_id}\nevent: message\ndata: {data}\n\n"
+            while not listener.overflowed:
+                try:
+                    message_id, data = await asyncio.wait_for(listener.queue.get(), timeout=SSE_HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                if message_id in sent:
+                    continue
+                yield f"id: {message_id}\nevent: message\ndata: {data}\n\n"
+        finally:
+            broadcaster.unlisten(thread_id, listener)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # =========================
 # ===== POSTER UN MESSAGE =====
 # =========================
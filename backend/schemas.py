@@ -4,7 +4,7 @@ Ces schémas définissent la structure des requêtes et réponses.
 """
 
 from pydantic import BaseModel, EmailStr, Field, field_validator
-from typing import Optional, List
+from typing import Optional, List, Literal
 from enum import Enum
 
 
@@ -80,9 +80,12 @@ class ProductResponse(BaseModel):
     description: str
     price_cents: int
     price_euros: float
-    stock_qty: int
+    stock_qty: int          # disponible à la vente
+    reserved_qty: int = 0   # retenu par des commandes non payées
+    low_stock_threshold: int = 10
     active: bool
     image_url: Optional[str] = None
+    version: int = 0  # à renvoyer dans les requêtes de modification pour détecter les conflits
 
     @staticmethod
     def from_product(product):
@@ -94,11 +97,66 @@ class ProductResponse(BaseModel):
             price_cents=product.price_cents,
             price_euros=product.price_cents / 100.0,
             stock_qty=product.stock_qty,
+            reserved_qty=product.reserved_qty,
+            low_stock_threshold=product.low_stock_threshold,
             active=product.active,
+            version=product.version,
             image_url=getattr(product, 'image_url', None)
         )
 
 
+class StockHoldProductResponse(BaseModel):
+    """Stock d'un produit : disponible, réservé et physique."""
+    product_id: str
+    name: str
+    available_qty: int
+    reserved_qty: int
+    on_hand_qty: int
+
+
+class StockHoldsResponse(BaseModel):
+    """État des réservations de stock des commandes non payées."""
+    hold_s: float
+    scheduled: int
+    next_expiry: Optional[float] = None
+    expired: int
+    products: List[StockHoldProductResponse]
+
+
+class StockMovementResponse(BaseModel):
+    """Mouvement du journal de stock."""
+    at: float
+    delta: int
+    reserved_delta: int
+    reason: str
+    order_id: Optional[str] = None
+
+    @staticmethod
+    def from_movement(movement):
+        return StockMovementResponse(
+            at=movement.at,
+            delta=movement.delta,
+            reserved_delta=movement.reserved_delta,
+            reason=movement.reason,
+            order_id=movement.order_id
+        )
+
+
+class StockMovementListResponse(BaseModel):
+    """Mouvements de stock d'un produit sur une période."""
+    product_id: str
+    movements: List[StockMovementResponse]
+    has_more: bool
+
+
+class StockBalanceResponse(BaseModel):
+    """Stock d'un produit à une date donnée, d'après le journal."""
+    product_id: str
+    at: Optional[float] = None
+    available_qty: int
+    reserved_qty: int
+
+
 class ProductListResponse(BaseModel):
     """Liste de produits."""
     products: List[ProductResponse]
@@ -120,6 +178,26 @@ class RemoveFromCartRequest(BaseModel):
     quantity: int = Field(default=1, ge=0)
 
 
+class CartOperation(BaseModel):
+    """Opération d'un lot : ajouter, retirer (0 = retrait complet) ou fixer la quantité."""
+    op: Literal["add", "remove", "set"]
+    product_id: str
+    quantity: int = Field(default=1, ge=0)
+
+    @field_validator('quantity')
+    @classmethod
+    def validate_quantity(cls, v, info):
+        if info.data.get('op') == 'add' and v < 1:
+            raise ValueError("La quantité à ajouter doit être au moins 1")
+        return v
+
+
+class CartBatchRequest(BaseModel):
+    """Lot d'opérations appliqué au panier en une seule fois."""
+    operations: List[CartOperation] = Field(..., max_length=100)
+    replace: bool = False  # True = remplacer le panier (restauration)
+
+
 class CartItemResponse(BaseModel):
     """Item dans le panier."""
     product_id: str
@@ -131,6 +209,21 @@ class CartItemResponse(BaseModel):
     line_total_euros: float
     image_url: Optional[str] = None
 
+    @staticmethod
+    def from_item(item):
+        """Convertit une ligne de panier (avec sa copie du produit) en CartItemResponse."""
+        line_total = item.line_total_cents()
+        return CartItemResponse(
+            product_id=item.product_id,
+            product_name=item.name,
+            unit_price_cents=item.unit_price_cents,
+            unit_price_euros=item.unit_price_cents / 100.0,
+            quantity=item.quantity,
+            line_total_cents=line_total,
+            line_total_euros=line_total / 100.0,
+            image_url=item.image_url
+        )
+
 
 class CartResponse(BaseModel):
     """Panier complet."""
@@ -138,6 +231,17 @@ class CartResponse(BaseModel):
     total_cents: int
     total_euros: float
 
+    @staticmethod
+    def from_cart(cart, products_repo):
+        """Convertit un panier en une passe sur ses lignes, sans relire les produits."""
+        items = [CartItemResponse.from_item(item) for item in cart.lines(products_repo)]
+        total_cents = cart.running_total_cents
+        return CartResponse(
+            items=items,
+            total_cents=total_cents,
+            total_euros=total_cents / 100.0
+        )
+
 
 # =========================
 # ===== COMMANDES =====
@@ -186,6 +290,7 @@ class OrderResponse(BaseModel):
     status: OrderStatusEnum
     total_cents: int
     total_euros: float
+    item_count: int
     created_at: float
     shipping_address: Optional[str] = None
     validated_at: Optional[float] = None
@@ -197,28 +302,36 @@ class OrderResponse(BaseModel):
     delivery: Optional[DeliveryResponse] = None
     invoice_id: Optional[str] = None
     payment_id: Optional[str] = None
+    hold_expires_at: Optional[float] = None
+    version: int = 0  # à renvoyer dans les requêtes de modification pour détecter les conflits
 
     @staticmethod
-    def from_order(order, products_repo=None):
-        """Convertit un modèle Order en OrderResponse."""
+    def from_order(order, products_repo=None, images=None, lines=None):
+        """
+        Convertit un modèle Order en OrderResponse.
+        `images` (product_id -> image_url) et `lines` (lignes déjà converties) sont
+        partagés entre les commandes d'une même liste : voir `from_orders`.
+        """
+        if images is None:
+            images = _product_images({item.product_id for item in order.items}, products_repo)
+        if lines is None:
+            lines = {}
         items = []
         for item in order.items:
-            image_url = None
-            if products_repo:
-                product = products_repo.get(item.product_id)
-                if product:
-                    image_url = getattr(product, 'image_url', None)
-
-            items.append(OrderItemResponse(
-                product_id=item.product_id,
-                name=item.name,
-                unit_price_cents=item.unit_price_cents,
-                unit_price_euros=item.unit_price_cents / 100.0,
-                quantity=item.quantity,
-                line_total_cents=item.unit_price_cents * item.quantity,
-                line_total_euros=(item.unit_price_cents * item.quantity) / 100.0,
-                image_url=image_url
-            ))
+            key = (item.product_id, item.name, item.unit_price_cents, item.quantity)
+            line = lines.get(key)
+            if line is None:
+                line = lines[key] = OrderItemResponse(
+                    product_id=item.product_id,
+                    name=item.name,
+                    unit_price_cents=item.unit_price_cents,
+                    unit_price_euros=item.unit_price_cents / 100.0,
+                    quantity=item.quantity,
+                    line_total_cents=item.line_total_cents,
+                    line_total_euros=item.line_total_cents / 100.0,
+                    image_url=images.get(item.product_id)
+                )
+            items.append(line)
 
         delivery = None
         if order.delivery:
@@ -235,8 +348,9 @@ class OrderResponse(BaseModel):
             user_id=order.user_id,
             items=items,
             status=OrderStatusEnum(order.status.name),
-            total_cents=order.total_cents(),
-            total_euros=order.total_cents() / 100.0,
+            total_cents=order.total_cents,
+            total_euros=order.total_cents / 100.0,
+            item_count=order.item_count,
             created_at=order.created_at,
             shipping_address=order.shipping_address,
             validated_at=order.validated_at,
@@ -247,9 +361,35 @@ class OrderResponse(BaseModel):
             refunded_at=order.refunded_at,
             delivery=delivery,
             invoice_id=order.invoice_id,
-            payment_id=order.payment_id
+            payment_id=order.payment_id,
+            hold_expires_at=order.hold_expires_at,
+            version=order.version
         )
 
+    @staticmethod
+    def from_orders(orders, products_repo=None):
+        """
+        Convertit une liste de commandes : chaque produit n'est lu qu'une fois dans
+        le catalogue, et une même ligne (produit, prix, quantité) n'est convertie
+        qu'une fois pour toute la liste. Les totaux sont ceux stockés sur la commande.
+        """
+        orders = list(orders)
+        images = _product_images({item.product_id for order in orders for item in order.items}, products_repo)
+        lines = {}
+        return [OrderResponse.from_order(order, products_repo, images, lines) for order in orders]
+
+
+def _product_images(product_ids, products_repo):
+    """Image de chaque produit (les produits supprimés sont absents)."""
+    if not products_repo:
+        return {}
+    images = {}
+    for product_id in product_ids:
+        product = products_repo.get(product_id)
+        if product:
+            images[product_id] = getattr(product, 'image_url', None)
+    return images
+
 
 class OrderListResponse(BaseModel):
     """Liste de commandes."""
@@ -265,9 +405,40 @@ class PaymentResponse(BaseModel):
     succeeded: bool
 
 
+class PaymentJobResponse(BaseModel):
+    """État d'un paiement asynchrone."""
+    job_id: str
+    order_id: str
+    status: str  # EN_ATTENTE, EN_COURS, REUSSI, REFUSE, ECHEC
+    amount_cents: int
+    amount_euros: float
+    attempts: int
+    payment_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float
+    finished_at: Optional[float] = None
+
+    @staticmethod
+    def from_job(job):
+        """Convertit un PaymentJob en PaymentJobResponse."""
+        return PaymentJobResponse(
+            job_id=job.id,
+            order_id=job.order_id,
+            status=job.status.value,
+            amount_cents=job.amount_cents,
+            amount_euros=job.amount_cents / 100.0,
+            attempts=job.attempts,
+            payment_id=job.payment_id,
+            error=job.error,
+            created_at=job.created_at,
+            finished_at=job.finished_at
+        )
+
+
 class CancelOrderRequest(BaseModel):
     """Requête d'annulation de commande."""
     order_id: str
+    version: Optional[int] = None  # version lue : 409 si la commande a changé depuis
 
 
 # =========================
@@ -286,6 +457,22 @@ class PostMessageRequest(BaseModel):
     body: str = Field(..., min_length=1)
 
 
+def _author_name(author_user_id, users_repo, names=None):
+    """
+    Nom affiché de l'auteur d'un message. `names` mémorise les noms déjà résolus
+    pendant la construction d'une réponse : un seul accès au dépôt par auteur.
+    """
+    if not author_user_id:
+        return "Support"
+    if names is not None and author_user_id in names:
+        return names[author_user_id]
+    user = users_repo.get(author_user_id)
+    name = user.display_name() if user else "Utilisateur"
+    if names is not None:
+        names[author_user_id] = name
+    return name
+
+
 class MessageResponse(BaseModel):
     """Représentation d'un message."""
     id: str
@@ -295,6 +482,20 @@ class MessageResponse(BaseModel):
     body: str
     created_at: float
 
+    @staticmethod
+    def from_message(msg, users_repo, names=None):
+        """Convertit un modèle Message en MessageResponse."""
+        author_name = _author_name(msg.author_user_id, users_repo, names)
+
+        return MessageResponse(
+            id=msg.id,
+            thread_id=msg.thread_id,
+            author_user_id=msg.author_user_id,
+            author_name=author_name,
+            body=msg.body,
+            created_at=msg.created_at
+        )
+
 
 class ThreadResponse(BaseModel):
     """Représentation d'un fil de discussion."""
@@ -306,24 +507,17 @@ class ThreadResponse(BaseModel):
     closed: bool
 
     @staticmethod
-    def from_thread(thread, users_repo):
-        """Convertit un modèle MessageThread en ThreadResponse."""
-        messages = []
-        for msg in thread.messages:
-            if msg.author_user_id:
-                user = users_repo.get(msg.author_user_id)
-                author_name = f"{user.first_name} {user.last_name}" if user else "Utilisateur"
-            else:
-                author_name = "Support"
-
-            messages.append(MessageResponse(
-                id=msg.id,
-                thread_id=msg.thread_id,
-                author_user_id=msg.author_user_id,
-                author_name=author_name,
-                body=msg.body,
-                created_at=msg.created_at
-            ))
+    def from_thread(thread, users_repo, names=None):
+        """
+        Convertit un modèle MessageThread en ThreadResponse.
+        Passer le même dict `names` pour plusieurs fils d'une même réponse.
+        """
+        if names is None:
+            names = {}
+        messages = [
+            MessageResponse.from_message(msg, users_repo, names)
+            for msg in thread.messages
+        ]
 
         return ThreadResponse(
             id=thread.id,
@@ -340,6 +534,110 @@ class ThreadListResponse(BaseModel):
     threads: List[ThreadResponse]
 
 
+class ThreadSummaryResponse(BaseModel):
+    """Résumé d'un fil pour les listes (sans les messages)."""
+    id: str
+    user_id: str
+    order_id: Optional[str]
+    subject: str
+    closed: bool
+    message_count: int
+    unread_count: int
+    last_message_preview: Optional[str] = None
+    last_message_at: Optional[float] = None
+    last_message_from_support: Optional[bool] = None
+    last_customer_message_at: Optional[float] = None
+
+    @staticmethod
+    def from_thread(thread, for_support: bool, preview_length: int = 120):
+        """Résumé en O(1) : ne parcourt pas les messages du fil."""
+        last = thread.messages[-1] if thread.messages else None
+        return ThreadSummaryResponse(
+            id=thread.id,
+            user_id=thread.user_id,
+            order_id=thread.order_id,
+            subject=thread.subject,
+            closed=thread.closed,
+            message_count=len(thread.messages),
+            unread_count=thread.unread_count(for_support),
+            last_message_preview=last.body[:preview_length] if last else None,
+            last_message_at=last.created_at if last else None,
+            last_message_from_support=(last.author_user_id is None) if last else None,
+            last_customer_message_at=thread.last_customer_message_at
+        )
+
+    @staticmethod
+    def from_archived(summary):
+        """Résumé d'un fil archivé, construit sans relire le segment sur disque."""
+        return ThreadSummaryResponse(
+            id=summary.id,
+            user_id=summary.user_id,
+            order_id=summary.order_id,
+            subject=summary.subject,
+            closed=True,
+            message_count=summary.message_count,
+            unread_count=0,
+            last_message_preview=summary.last_message_preview,
+            last_message_at=summary.last_message_at
+        )
+
+
+class ThreadSummaryListResponse(BaseModel):
+    """Liste de résumés de fils."""
+    threads: List[ThreadSummaryResponse]
+
+
+class ArchivedThreadListResponse(BaseModel):
+    """Page des fils archivés (résumés uniquement)."""
+    threads: List[ThreadSummaryResponse]
+    offset: int
+    total: int
+    has_more: bool
+
+
+class SupportInboxResponse(BaseModel):
+    """Page de la boîte de réception du support (fils ouverts, le plus ancien en premier)."""
+    state: str
+    threads: List[ThreadSummaryResponse]
+    offset: int
+    limit: int
+    total: int
+    has_more: bool
+    unanswered_count: int
+    answered_count: int
+
+
+class SupportSearchHitResponse(BaseModel):
+    """Fil trouvé par la recherche, avec les messages qui correspondent."""
+    thread: ThreadSummaryResponse
+    subject_match: bool
+    match_count: int
+    messages: List[MessageResponse]
+
+    @staticmethod
+    def from_hit(hit, thread, users_repo, names=None, max_messages: int = 5):
+        messages = [thread.messages[thread.position_of(mid)] for mid in hit.message_ids[:max_messages]]
+        return SupportSearchHitResponse(
+            thread=ThreadSummaryResponse.from_thread(thread, for_support=True),
+            subject_match=hit.subject_match,
+            match_count=len(hit.message_ids),
+            messages=[MessageResponse.from_message(msg, users_repo, names) for msg in messages]
+        )
+
+
+class SupportSearchResponse(BaseModel):
+    """Résultats d'une recherche dans les conversations du support."""
+    query: str
+    results: List[SupportSearchHitResponse]
+
+
+class MessagePageResponse(BaseModel):
+    """Page de messages d'un fil (pagination par curseur)."""
+    thread_id: str
+    messages: List[MessageResponse]
+    has_more: bool
+
+
 # =========================
 # ===== ADMINISTRATION =====
 # =========================
@@ -347,28 +645,87 @@ class ThreadListResponse(BaseModel):
 class ValidateOrderRequest(BaseModel):
     """Requête de validation de commande (admin)."""
     order_id: str
+    version: Optional[int] = None  # version lue : 409 si la commande a changé depuis
 
 
 class ShipOrderRequest(BaseModel):
     """Requête d'expédition de commande (admin)."""
     order_id: str
+    version: Optional[int] = None
 
 
 class MarkDeliveredRequest(BaseModel):
     """Requête de marquage commande livrée (admin)."""
     order_id: str
+    version: Optional[int] = None
+
+
+class BulkOrderActionRequest(BaseModel):
+    """Requête d'opération groupée sur des commandes (admin)."""
+    order_ids: List[str] = Field(..., min_length=1, max_length=10000)
+
+
+class BulkOrderResult(BaseModel):
+    """Résultat compact d'une opération groupée pour une commande."""
+    order_id: str
+    succeeded: bool
+    status: Optional[OrderStatusEnum] = None
+    error: Optional[str] = None
+
+
+class BulkOrderActionResponse(BaseModel):
+    """Résumé d'une opération groupée (pas de OrderResponse complet)."""
+    action: str
+    total: int
+    succeeded: int
+    failed: int
+    results: List[BulkOrderResult]
+
+    @staticmethod
+    def from_results(action, results):
+        """Convertit une liste de BulkResult en résumé."""
+        items = [
+            BulkOrderResult(
+                order_id=r.order_id,
+                succeeded=r.succeeded,
+                status=OrderStatusEnum(r.status.name) if r.status else None,
+                error=r.error
+            )
+            for r in results
+        ]
+        succeeded = sum(1 for r in results if r.succeeded)
+        return BulkOrderActionResponse(
+            action=action,
+            total=len(results),
+            succeeded=succeeded,
+            failed=len(results) - succeeded,
+            results=items
+        )
 
 
 class RefundOrderRequest(BaseModel):
     """Requête de remboursement (admin)."""
     order_id: str
-    amount_cents: Optional[int] = None
+    amount_cents: Optional[int] = Field(default=None, gt=0)
+    version: Optional[int] = None
 
 
 class UpdateStockRequest(BaseModel):
     """Requête de mise à jour du stock (admin)."""
     product_id: str
     stock_qty: int = Field(ge=0)
+    version: Optional[int] = None  # version lue : 409 si le produit a changé depuis
+
+
+class UpdateLowStockThresholdRequest(BaseModel):
+    """Requête de modification du seuil de stock faible d'un produit (admin)."""
+    threshold: int = Field(ge=0)
+
+
+class LowStockResponse(BaseModel):
+    """Produits actifs sous leur seuil de stock faible, du plus critique au moins critique."""
+    count: int
+    products: List[ProductResponse]
 
 
 class CreateProductRequest(BaseModel):
@@ -387,6 +744,8 @@ class UpdateProductRequest(BaseModel):
     price_cents: Optional[int] = Field(default=None, ge=0)
     stock_qty: Optional[int] = Field(default=None, ge=0)
     active: Optional[bool] = None
+    low_stock_threshold: Optional[int] = Field(default=None, ge=0)
+    version: Optional[int] = None  # version lue : 409 si le produit a changé depuis
 
 
 class AdminStatsResponse(BaseModel):
@@ -405,6 +764,48 @@ class AdminStatsResponse(BaseModel):
     low_stock_products: List[ProductResponse]
 
 
+class SalesPointResponse(BaseModel):
+    """Ventes d'un seau (heure, jour ou semaine) de la série."""
+    start: float
+    revenue_cents: int
+    revenue_euros: float
+    orders: int
+    units: int
+
+    @staticmethod
+    def from_totals(start, totals):
+        """Convertit un point (début du seau, SalesTotals) en SalesPointResponse."""
+        return SalesPointResponse(
+            start=start,
+            revenue_cents=totals.revenue_cents,
+            revenue_euros=totals.revenue_cents / 100.0,
+            orders=totals.orders,
+            units=totals.units
+        )
+
+
+class ProductSalesResponse(BaseModel):
+    """Ventes d'un produit sur la période."""
+    product_id: str
+    name: Optional[str] = None
+    units: int
+    revenue_cents: int
+    revenue_euros: float
+
+
+class SalesAnalyticsResponse(BaseModel):
+    """Ventes nettes sur une période : totaux, série temporelle et meilleurs produits."""
+    since: float
+    until: float
+    granularity: str
+    revenue_cents: int
+    revenue_euros: float
+    orders: int
+    units: int
+    series: List[SalesPointResponse]
+    top_products: List[ProductSalesResponse]
+
+
 # =========================
 # ===== MESSAGES D'ERREUR =====
 # =========================
@@ -0,0 +1,224 @@
+"""
+Recherche plein texte dans les conversations du support.
+Index inversé positionnel sur les sujets et les messages, tenu à jour par
+les événements ThreadOpened / MessagePosted et reconstructible en bloc
+depuis le dépôt au démarrage. Les fils archivés (ThreadsArchived) en sont
+retirés : l'index ne couvre que les fils en mémoire.
+"""
+
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+import re
+import threading
+import unicodedata
+
+from events import EventBus, MessagePosted, ThreadOpened, ThreadsArchived
+from models import MessageThread, ThreadRepository
+
+
+_WORD = re.compile(r"\w+")
+_QUERY = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def normalize(text: str) -> str:
+    """Minuscules sans accents : « Expédiée » et « expediee » sont le même terme."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(normalize(text))
+
+
+@dataclass
+class SearchHit:
+    thread_id: str
+    subject_match: bool = False
+    message_ids: List[str] = field(default_factory=list)  # dans l'ordre du fil
+
+    @property
+    def score(self) -> int:
+        return len(self.message_ids) + (2 if self.subject_match else 0)
+
+
+class SupportSearchIndex:
+    """
+    Index inversé : terme -> {document -> positions}. Un document est le sujet
+    d'un fil ou un message. Les termes sont aussi gardés dans une liste triée
+    pour les requêtes par préfixe (bisect).
+
+    Syntaxe des requêtes : mots (tous requis), `"expression exacte"`, `préfixe*`.
+    Les conditions s'appliquent au fil : les mots peuvent être dans des messages différents.
+    """
+    def __init__(self, threads: ThreadRepository):
+        self.threads = threads
+        self._postings: Dict[str, Dict[int, List[int]]] = {}
+        self._terms: List[str] = []  # triée
+        self._docs: List[Optional[Tuple[str, Optional[str]]]] = []  # doc -> (thread_id, message_id ou None pour le sujet), None si retiré
+        self._thread_docs: Dict[str, List[int]] = {}  # thread_id -> documents
+        self._doc_terms: Dict[int, List[str]] = {}  # doc -> termes distincts, pour le retrait
+        self._removed = 0
+        self._lock = threading.Lock()
+
+    def subscribe_to(self, events: EventBus):
+        events.subscribe(ThreadOpened, self._on_thread_opened, name="support-search")
+        events.subscribe(MessagePosted, self._on_message_posted, name="support-search")
+        events.subscribe(ThreadsArchived, self._on_threads_archived, name="support-search")
+
+    # ----- Indexation -----
+
+    def _add_document(self, thread_id: str, message_id: Optional[str], text: str, new_terms: Optional[List[str]] = None):
+        doc = len(self._docs)
+        self._docs.append((thread_id, message_id))
+        self._thread_docs.setdefault(thread_id, []).append(doc)
+        terms = []
+        for position, term in enumerate(tokenize(text)):
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if new_terms is None:
+                    insort(self._terms, term)
+                else:
+                    new_terms.append(term)
+            positions = postings.get(doc)
+            if positions is None:
+                positions = postings[doc] = []
+                terms.append(term)
+            positions.append(position)
+        self._doc_terms[doc] = terms
+
+    def _remove_thread(self, thread_id: str):
+        for doc in self._thread_docs.pop(thread_id, ()):
+            for term in self._doc_terms.pop(doc, ()):
+                postings = self._postings[term]
+                del postings[doc]
+                if not postings:
+                    del self._postings[term]
+                    del self._terms[bisect_left(self._terms, term)]
+            self._docs[doc] = None
+            self._removed += 1
+
+    def _on_thread_opened(self, event: ThreadOpened):
+        thread = self.threads.get(event.thread_id)
+        if thread:
+            with self._lock:
+                self._add_document(thread.id, None, thread.subject)
+
+    def _on_message_posted(self, event: MessagePosted):
+        thread = self.threads.get(event.thread_id)
+        pos = thread.position_of(event.message_id) if thread else None
+        if pos is not None:
+            with self._lock:
+                self._add_document(thread.id, event.message_id, thread.messages[pos].body)
+
+    def _on_threads_archived(self, event: ThreadsArchived):
+        with self._lock:
+            for thread_id in event.thread_ids:
+                self._remove_thread(thread_id)
+
+    def rebuild(self):
+        """Reconstruit tout l'index depuis le dépôt (la liste des termes n'est triée qu'une fois)."""
+        with self._lock:
+            self._postings = {}
+            self._docs = []
+            self._thread_docs = {}
+            self._doc_terms = {}
+            self._removed = 0
+            new_terms: List[str] = []
+            for thread in self.threads.list_all():
+                self._add_document(thread.id, None, thread.subject, new_terms)
+                for msg in thread.messages:
+                    self._add_document(thread.id, msg.id, msg.body, new_terms)
+            self._terms = sorted(new_terms)
+
+    def stats(self) -> Dict[str, int]:
+        return {"documents": len(self._docs) - self._removed, "terms": len(self._terms)}
+
+    # ----- Recherche -----
+
+    def _prefix_docs(self, prefix: str) -> Set[int]:
+        docs: Set[int] = set()
+        i = bisect_left(self._terms, prefix)
+        while i < len(self._terms) and self._terms[i].startswith(prefix):
+            docs.update(self._postings[self._terms[i]])
+            i += 1
+        return docs
+
+    def _phrase_docs(self, terms: List[str]) -> Set[int]:
+        postings = [self._postings.get(t) for t in terms]
+        if not postings or not all(postings):
+            return set()
+        candidates = set.intersection(*(set(p) for p in postings))
+        matches = set()
+        for doc in candidates:
+            following = [set(p[doc]) for p in postings[1:]]
+            if any(all(start + i + 1 in positions for i, positions in enumerate(following)) for start in postings[0][doc]):
+                matches.add(doc)
+        return matches
+
+    def _clause_docs(self, phrase: Optional[str], word: Optional[str]) -> Set[int]:
+        if phrase is not None:
+            return self._phrase_docs(tokenize(phrase))
+        terms = tokenize(word)
+        if word.endswith("*") and len(terms) == 1:
+            return self._prefix_docs(terms[0])
+        # Un mot avec ponctuation interne (ex: « t-shirt ») se cherche comme une expression
+        return self._phrase_docs(terms)
+
+    def search(
+        self,
+        query: str,
+        user_id: Optional[str] = None,
+        order_id: Optional[str] = None,
+        closed: Optional[bool] = None,
+        limit: int = 20
+    ) -> List[SearchHit]:
+        """Fils correspondant à toutes les conditions de la requête, les plus pertinents en premier."""
+        clauses = [(phrase, word) for phrase, word in _QUERY.findall(query) if tokenize(phrase or word)]
+        if not clauses:
+            raise ValueError("Requête de recherche vide.")
+        with self._lock:
+            per_clause = [self._clause_docs(phrase or None, word or None) for phrase, word in clauses]
+            docs = [self._docs[d] for d in set().union(*per_clause)]
+            thread_sets = [{self._docs[d][0] for d in matched} for matched in per_clause]
+        thread_ids = set.intersection(*thread_sets)
+
+        # Chaque fil n'est lu qu'une fois dans le dépôt
+        hits: Dict[str, Tuple[SearchHit, MessageThread]] = {}
+        for thread_id, message_id in docs:
+            if thread_id not in thread_ids:
+                continue
+            entry = hits.get(thread_id)
+            if entry is None:
+                thread = self.threads.get(thread_id)
+                if not thread or not self._matches(thread, user_id, order_id, closed):
+                    thread_ids.discard(thread_id)
+                    continue
+                entry = hits[thread_id] = (SearchHit(thread_id), thread)
+            hit = entry[0]
+            if message_id is None:
+                hit.subject_match = True
+            else:
+                hit.message_ids.append(message_id)
+
+        for hit, thread in hits.values():
+            hit.message_ids.sort(key=thread.position_of)
+        ranked = sorted(
+            hits.values(),
+            key=lambda entry: (entry[0].score, self._last_activity(entry[1])),
+            reverse=True
+        )
+        return [hit for hit, _ in ranked[:limit]]
+
+    @staticmethod
+    def _matches(thread: MessageThread, user_id: Optional[str], order_id: Optional[str], closed: Optional[bool]) -> bool:
+        return (
+            (user_id is None or thread.user_id == user_id)
+            and (order_id is None or thread.order_id == order_id)
+            and (closed is None or thread.closed == closed)
+        )
+
+    @staticmethod
+    def _last_activity(thread: MessageThread) -> float:
+        return thread.messages[-1].created_at if thread.messages else 0.0
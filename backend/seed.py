@@ -17,6 +17,12 @@ def seed_data(context):
 
     print("🌱 Début du seed des données...")
 
+    # Les fils archivés d'une exécution précédente pointent vers des utilisateurs et
+    # des commandes qui n'existent plus
+    cleared = context.thread_archive.clear()
+    if cleared:
+        print(f"  🗑️ Archive du support vidée ({cleared} fils)")
+
     # =========================
     # ===== UTILISATEURS =====
     # =========================
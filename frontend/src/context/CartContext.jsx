@@ -1,5 +1,5 @@
 import React, { createContext, useState, useContext, useEffect } from 'react';
-import { getCart, addToCart as apiAddToCart, removeFromCart as apiRemoveFromCart, removeQuantityFromCart as apiRemoveQuantityFromCart, clearCart as apiClearCart } from '../services/api';
+import { getCart, addToCart as apiAddToCart, removeFromCart as apiRemoveFromCart, clearCart as apiClearCart, applyCartBatch } from '../services/api';
 import { useAuth } from './AuthContext';
 
 /**
@@ -104,38 +104,43 @@ export const CartProvider = ({ children }) => {
     }
   };
 
+  /**
+   * Appliquer plusieurs opérations au panier en une seule requête
+   * @param {Array} operations - Opérations { op: 'add'|'remove'|'set', product_id, quantity }
+   * @param {boolean} replace - Remplacer tout le panier
+   */
+  const applyBatch = async (operations, replace = false) => {
+    try {
+      setLoading(true);
+      const updatedCart = await applyCartBatch(operations, replace);
+      setCart(updatedCart);
+      return updatedCart;
+    } catch (error) {
+      console.error('Erreur lors de la mise à jour du panier:', error);
+      throw error;
+    } finally {
+      setLoading(false);
+    }
+  };
+
   /**
    * Mettre à jour la quantité d'un produit
    * @param {number} productId - ID du produit
    * @param {number} newQuantity - Nouvelle quantité
    */
   const updateQuantity = async (productId, newQuantity) => {
-    if (newQuantity <= 0) {
-      return removeFromCart(productId);
-    }
-
-    // Trouver la quantité actuelle
-    const currentItem = cart?.items?.find(item => item.product_id === productId);
-    if (!currentItem) return;
+    return applyBatch([{ op: 'set', product_id: productId, quantity: Math.max(0, newQuantity) }]);
+  };
 
-    const difference = newQuantity - currentItem.quantity;
-    if (difference > 0) {
-      // Augmenter la quantité
-      return addToCart(productId, difference);
-    } else if (difference < 0) {
-      // Diminuer la quantité
-      try {
-        setLoading(true);
-        const updatedCart = await apiRemoveQuantityFromCart(productId, Math.abs(difference));
-        setCart(updatedCart);
-        return updatedCart;
-      } catch (error) {
-        console.error('Erreur lors de la diminution de quantité:', error);
-        throw error;
-      } finally {
-        setLoading(false);
-      }
-    }
+  /**
+   * Restaurer un panier sauvegardé (remplace le panier actuel)
+   * @param {Array<{product_id: string, quantity: number}>} items
+   */
+  const restoreCart = async (items) => {
+    return applyBatch(
+      items.map(item => ({ op: 'set', product_id: item.product_id, quantity: item.quantity })),
+      true
+    );
   };
 
   const value = {
@@ -145,6 +150,8 @@ export const CartProvider = ({ children }) => {
     removeFromCart,
     clearCart,
     updateQuantity,
+    applyBatch,
+    restoreCart,
     loadCart,
   };
 
@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { MapPin } from 'lucide-react';
 import { useCart } from '../context/CartContext';
@@ -17,6 +17,8 @@ const CheckoutPage = () => {
   const [shippingAddress, setShippingAddress] = useState('');
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
+  // Même clé pour les répétitions d'une tentative (double clic, réseau instable)
+  const idempotencyKey = useRef(crypto.randomUUID());
 
   if (!cart || cart.items.length === 0) {
     navigate('/cart');
@@ -37,11 +39,17 @@ const CheckoutPage = () => {
       setLoading(true);
       setError('');
       // Créer la commande
-      const order = await checkout(shippingAddress);
+      const order = await checkout(shippingAddress, idempotencyKey.current);
       // Rediriger vers la page de paiement avec l'ID de la commande
       navigate(`/payment/${order.id}`);
     } catch (err) {
       console.error('Erreur lors de la création de la commande:', err);
+      // Le serveur a refusé la requête (4xx) : la tentative suivante est une nouvelle requête.
+      // Sans réponse (réseau, délai dépassé), on garde la clé pour que le serveur déduplique le renvoi.
+      const status = err.response?.status;
+      if (status >= 400 && status < 500) {
+        idempotencyKey.current = crypto.randomUUID();
+      }
       setError('Erreur lors de la création de la commande. Veuillez réessayer.');
     } finally {
       setLoading(false);
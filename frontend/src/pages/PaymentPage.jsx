@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { CreditCard, Lock, AlertTriangle, CheckCircle } from 'lucide-react';
 import { getOrder, payOrder } from '../services/api';
@@ -18,6 +18,8 @@ const PaymentPage = () => {
   const [loading, setLoading] = useState(true);
   const [processing, setProcessing] = useState(false);
   const [errors, setErrors] = useState({});
+  // Même clé pour les répétitions d'une tentative (double clic, réseau instable)
+  const idempotencyKey = useRef(crypto.randomUUID());
 
   // Données de carte factice
   const [cardData, setCardData] = useState({
@@ -103,7 +105,7 @@ const PaymentPage = () => {
         cvc: cardData.cvv,
       };
 
-      await payOrder(orderId, paymentData);
+      await payOrder(orderId, paymentData, idempotencyKey.current);
 
       // Rediriger vers la page de confirmation
       navigate(`/orders/${orderId}`, {
@@ -111,6 +113,12 @@ const PaymentPage = () => {
       });
     } catch (error) {
       console.error('Erreur lors du paiement:', error);
+      // Le serveur a refusé la requête (4xx) : la tentative suivante est une nouvelle requête.
+      // Sans réponse (réseau, délai dépassé), on garde la clé pour que le serveur déduplique le renvoi.
+      const status = error.response?.status;
+      if (status >= 400 && status < 500) {
+        idempotencyKey.current = crypto.randomUUID();
+      }
       alert('Erreur lors du paiement. Veuillez réessayer.');
     } finally {
       setProcessing(false);
@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import { MessageCircle, Send, Plus, Headphones, X } from 'lucide-react';
-import { getThreads, getThread, createThread, postMessage } from '../services/api';
+import { getThreads, getThread, createThread, postMessage, subscribeToThread } from '../services/api';
 import Loading from '../components/common/Loading';
 
 /**
@@ -22,6 +22,25 @@ const SupportPage = () => {
     loadThreads();
   }, []);
 
+  // Nouveaux messages poussés par le serveur pour le fil ouvert
+  useEffect(() => {
+    if (!selectedThread || selectedThread.closed) {
+      return undefined;
+    }
+    const lastMessage = selectedThread.messages?.[selectedThread.messages.length - 1];
+    return subscribeToThread(selectedThread.id, lastMessage?.id, appendMessage);
+  }, [selectedThread?.id, selectedThread?.closed]);
+
+  const appendMessage = (message) => {
+    setSelectedThread((thread) => {
+      const messages = thread?.messages || [];
+      if (!thread || thread.id !== message.thread_id || messages.some((m) => m.id === message.id)) {
+        return thread;
+      }
+      return { ...thread, messages: [...messages, message] };
+    });
+  };
+
   const loadThreads = async () => {
     try {
       const data = await getThreads();
@@ -1,21 +1,49 @@
 import React, { useEffect, useState } from 'react';
 import { Link } from 'react-router-dom';
 import { Package, ShoppingCart, DollarSign, Users, TrendingUp, MessageCircle } from 'lucide-react';
-import { getStats } from '../../services/api';
+import { getStats, getSalesAnalytics } from '../../services/api';
 import Card from '../../components/common/Card';
 import Loading from '../../components/common/Loading';
 
 /**
  * Tableau de bord administrateur avec statistiques
  */
+// Périodes proposées pour la courbe des ventes
+const SALES_PERIODS = {
+  hour: { label: '48 h', seconds: 48 * 3600 },
+  day: { label: '30 jours', seconds: 30 * 24 * 3600 },
+  week: { label: '12 semaines', seconds: 12 * 7 * 24 * 3600 },
+};
+
 const AdminDashboard = () => {
   const [stats, setStats] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [granularity, setGranularity] = useState('day');
+  const [sales, setSales] = useState(null);
 
   useEffect(() => {
     loadStats();
   }, []);
 
+  useEffect(() => {
+    loadSales(granularity);
+  }, [granularity]);
+
+  const loadSales = async (selected) => {
+    try {
+      const until = Date.now() / 1000;
+      const data = await getSalesAnalytics({
+        since: until - SALES_PERIODS[selected].seconds,
+        until,
+        granularity: selected,
+        top: 5,
+      });
+      setSales(data);
+    } catch (error) {
+      console.error('Erreur lors du chargement des ventes:', error);
+    }
+  };
+
   const loadStats = async () => {
     try {
       const data = await getStats();
@@ -31,6 +59,8 @@ const AdminDashboard = () => {
     return <Loading fullScreen message="Chargement du tableau de bord..." />;
   }
 
+  const maxSalesCents = Math.max(1, ...(sales?.series || []).map((point) => point.revenue_cents));
+
   const statCards = [
     {
       title: 'Total Commandes',
@@ -98,6 +128,75 @@ const AdminDashboard = () => {
           })}
         </div>
 
+        {/* Ventes sur la période */}
+        <Card className="mb-8">
+          <div className="flex items-center justify-between mb-6">
+            <h2 className="text-xl font-bold text-gray-800">
+              Ventes nettes
+            </h2>
+            <div className="flex gap-2">
+              {Object.entries(SALES_PERIODS).map(([key, period]) => (
+                <button
+                  key={key}
+                  onClick={() => setGranularity(key)}
+                  className={`px-3 py-1 rounded-lg text-sm ${
+                    granularity === key
+                      ? 'bg-primary-600 text-white'
+                      : 'bg-gray-100 text-gray-700 hover:bg-gray-200'
+                  }`}
+                >
+                  {period.label}
+                </button>
+              ))}
+            </div>
+          </div>
+
+          {sales && (
+            <>
+              <div className="grid grid-cols-3 gap-4 mb-6">
+                <div>
+                  <p className="text-sm text-gray-600">Chiffre d'affaires</p>
+                  <p className="text-2xl font-bold text-gray-800">{sales.revenue_euros.toFixed(2)} €</p>
+                </div>
+                <div>
+                  <p className="text-sm text-gray-600">Commandes</p>
+                  <p className="text-2xl font-bold text-gray-800">{sales.orders}</p>
+                </div>
+                <div>
+                  <p className="text-sm text-gray-600">Articles vendus</p>
+                  <p className="text-2xl font-bold text-gray-800">{sales.units}</p>
+                </div>
+              </div>
+
+              {/* Une barre par heure, jour ou semaine */}
+              <div className="flex items-end gap-px h-32 mb-6">
+                {sales.series.map((point) => (
+                  <div
+                    key={point.start}
+                    title={`${new Date(point.start * 1000).toLocaleString('fr-FR')} : ${point.revenue_euros.toFixed(2)} € (${point.orders} commandes)`}
+                    className="flex-1 bg-primary-500 rounded-t"
+                    style={{ height: `${(Math.max(point.revenue_cents, 0) / maxSalesCents) * 100}%` }}
+                  />
+                ))}
+              </div>
+
+              {sales.top_products.length > 0 && (
+                <div className="space-y-2">
+                  <h3 className="font-semibold text-gray-800">Meilleures ventes</h3>
+                  {sales.top_products.map((product) => (
+                    <div key={product.product_id} className="flex items-center justify-between p-2 bg-gray-50 rounded-lg">
+                      <span className="text-gray-800">{product.name || product.product_id}</span>
+                      <span className="text-gray-600">
+                        {product.units} vendus · {product.revenue_euros.toFixed(2)} €
+                      </span>
+                    </div>
+                  ))}
+                </div>
+              )}
+            </>
+          )}
+        </Card>
+
         {/* Statistiques détaillées */}
         <div className="grid grid-cols-1 lg:grid-cols-2 gap-6">
           {/* Commandes par statut */}
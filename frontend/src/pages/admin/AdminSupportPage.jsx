@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import { MessageCircle, Send, CheckCircle, X } from 'lucide-react';
-import api from '../../services/api';
+import api, { subscribeToThread } from '../../services/api';
 import Card from '../../components/common/Card';
 import Button from '../../components/common/Button';
 import Loading from '../../components/common/Loading';
@@ -19,6 +19,25 @@ const AdminSupportPage = () => {
     loadThreads();
   }, []);
 
+  // Nouveaux messages poussés par le serveur pour le fil ouvert
+  useEffect(() => {
+    if (!selectedThread || selectedThread.closed) {
+      return undefined;
+    }
+    const lastMessage = selectedThread.messages?.[selectedThread.messages.length - 1];
+    return subscribeToThread(selectedThread.id, lastMessage?.id, appendMessage);
+  }, [selectedThread?.id, selectedThread?.closed]);
+
+  const appendMessage = (message) => {
+    setSelectedThread((thread) => {
+      const messages = thread?.messages || [];
+      if (!thread || thread.id !== message.thread_id || messages.some((m) => m.id === message.id)) {
+        return thread;
+      }
+      return { ...thread, messages: [...messages, message] };
+    });
+  };
+
   const loadThreads = async () => {
     try {
       const response = await api.get('/api/admin/support/threads');
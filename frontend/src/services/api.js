@@ -154,6 +154,17 @@ export const removeQuantityFromCart = async (productId, quantity) => {
   return response.data;
 };
 
+/**
+ * Appliquer plusieurs opérations au panier en une requête (tout ou rien)
+ * @param {Array<{op: 'add'|'remove'|'set', product_id: string, quantity: number}>} operations
+ * @param {boolean} replace - Remplacer tout le panier (restauration)
+ * @returns {Promise<Object>} Panier mis à jour
+ */
+export const applyCartBatch = async (operations, replace = false) => {
+  const response = await api.post('/api/cart/batch', { operations, replace });
+  return response.data;
+};
+
 /**
  * Vider le panier
  * @returns {Promise<void>}
@@ -168,10 +179,15 @@ export const clearCart = async () => {
 /**
  * Créer une commande à partir du panier
  * @param {string} shippingAddress - Adresse de livraison
+ * @param {string} [idempotencyKey] - Clé réutilisée pour les répétitions d'une même tentative
  * @returns {Promise<Object>} Commande créée
  */
-export const checkout = async (shippingAddress) => {
-  const response = await api.post('/api/orders/checkout', { shipping_address: shippingAddress });
+export const checkout = async (shippingAddress, idempotencyKey) => {
+  const response = await api.post(
+    '/api/orders/checkout',
+    { shipping_address: shippingAddress },
+    idempotencyKey ? { headers: { 'Idempotency-Key': idempotencyKey } } : undefined
+  );
   return response.data;
 };
 
@@ -179,13 +195,15 @@ export const checkout = async (shippingAddress) => {
  * Payer une commande
  * @param {number} orderId - ID de la commande
  * @param {Object} paymentData - Données de paiement (factice)
+ * @param {string} [idempotencyKey] - Clé réutilisée pour les répétitions d'une même tentative
  * @returns {Promise<Object>} Commande mise à jour
  */
-export const payOrder = async (orderId, paymentData) => {
-  const response = await api.post('/api/orders/pay', {
-    order_id: orderId,
-    ...paymentData
-  });
+export const payOrder = async (orderId, paymentData, idempotencyKey) => {
+  const response = await api.post(
+    '/api/orders/pay',
+    { order_id: orderId, ...paymentData },
+    idempotencyKey ? { headers: { 'Idempotency-Key': idempotencyKey } } : undefined
+  );
   return response.data;
 };
 
@@ -265,6 +283,23 @@ export const getThread = async (threadId) => {
   return response.data;
 };
 
+/**
+ * S'abonner aux nouveaux messages d'un thread (Server-Sent Events)
+ * @param {string} threadId - ID du thread
+ * @param {string|null} lastMessageId - Dernier message déjà affiché (reprise)
+ * @param {Function} onMessage - Appelée avec chaque nouveau message
+ * @returns {Function} Fonction de désabonnement
+ */
+export const subscribeToThread = (threadId, lastMessageId, onMessage) => {
+  const params = new URLSearchParams({ token: localStorage.getItem('token') || '' });
+  if (lastMessageId) {
+    params.set('last_event_id', lastMessageId);
+  }
+  const source = new EventSource(`${API_URL}/api/support/threads/${threadId}/stream?${params}`);
+  source.addEventListener('message', (event) => onMessage(JSON.parse(event.data)));
+  return () => source.close();
+};
+
 // ==================== ADMIN ====================
 
 /**
@@ -357,6 +392,16 @@ export const getStats = async () => {
   return response.data;
 };
 
+/**
+ * Récupérer les ventes nettes sur une période (admin)
+ * @param {Object} params - since / until (timestamps en secondes), granularity ('hour' | 'day' | 'week'), top
+ * @returns {Promise<Object>} Totaux, série par seau et meilleurs produits
+ */
+export const getSalesAnalytics = async (params = {}) => {
+  const response = await api.get('/api/admin/analytics/sales', { params });
+  return response.data;
+};
+
 /**
  * Upload une image pour un produit (admin)
  * @param {File} file - Fichier image à uploader